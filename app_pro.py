@@ -5,14 +5,21 @@ Frictionless meal tracking with AI-powered insights
 Built for speed, simplicity, and results
 """
 
-from flask import Flask, render_template, jsonify, request, redirect, url_for, make_response, g
+from flask import Flask, Response, render_template, jsonify, request, redirect, url_for, make_response, g, current_app
+from flask.json.provider import DefaultJSONProvider
+import functools
+import hashlib
 import json
 import os
+import random
+import time
 import uuid
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 from collections import defaultdict
 
+import json_codec
+
 # Optional imports (load if available)
 try:
     from gamification_system import GamificationEngine
@@ -20,7 +27,26 @@ try:
 except ImportError:
     gamification = None
 
+
+class CodecJSONProvider(DefaultJSONProvider):
+    """jsonify() / request.get_json() through json_codec (orjson when installed), same output options as Flask's"""
+
+    def dumps(self, obj, **kwargs):
+        return json_codec.dumps(obj, indent=kwargs.get('indent') or 0,
+                                sort_keys=kwargs.get('sort_keys', self.sort_keys), default=kwargs.get('default', self.default))
+
+    def loads(self, s, **kwargs):
+        return json_codec.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = 2 if (self.compact is None and current_app.debug) or self.compact is False else 0
+        body = json_codec.dumpb(obj, indent=indent, sort_keys=self.sort_keys, default=self.default)
+        return current_app.response_class(body + b'\n', mimetype=self.mimetype)
+
+
 app = Flask(__name__)
+app.json = CodecJSONProvider(app)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
 app.config['DEBUG'] = os.getenv('FLASK_ENV') != 'production'
 app.config['TEMPLATES_AUTO_RELOAD'] = True  # Force template reload in production
@@ -32,7 +58,21 @@ if not app.config['DEBUG']:
     app.logger.setLevel(logging.INFO)
 
 LEGACY_DATA_FILE = 'fitness_data.json'
-USER_DATA_DIR = os.getenv('LEAN_USER_DATA_DIR', 'data/users')
+
+from daily_rollups import ROLLUP_KEY, add_meal as add_to_rollups, empty_day, ensure_rollups, totals_between
+from job_queue import JobQueue, QueueFull
+from live_updates import HEARTBEAT_SECONDS, LiveHub, TooManyStreams, format_event
+from meal_archive import ARCHIVE_KEY
+from range_aggregates import GROUPS as AGGREGATE_GROUPS, aggregate
+from streaks import STREAK_KEY, streak_summary
+from user_storage import USER_DATA_DIR, VersionConflict, get_user_store, insert_ordered
+from vision_cache import vision_cache
+store = get_user_store()
+live = LiveHub()
+jobs = JobQueue(os.path.join(USER_DATA_DIR, '.jobs'), on_finish=lambda job: _publish_job(job))
+
+# Compare-and-swap attempts before update_data() falls back to the per-user lock
+SAVE_RETRIES = 5
 
 def _default_user_data():
     return {
@@ -49,14 +89,6 @@ def _default_user_data():
         'weights': []
     }
 
-def _ensure_user_dir():
-    os.makedirs(USER_DATA_DIR, exist_ok=True)
-
-def _user_data_path(uid: str) -> str:
-    _ensure_user_dir()
-    safe = ''.join(ch for ch in uid if ch.isalnum() or ch in ('-','_'))
-    return os.path.join(USER_DATA_DIR, f'{safe}.json')
-
 def _get_or_create_uid():
     uid = request.cookies.get('lean_uid')
     if not uid:
@@ -65,42 +97,242 @@ def _get_or_create_uid():
     g.lean_uid = uid
     return uid
 
-def _maybe_migrate_legacy(uid: str, path: str):
-    # If legacy single-user file exists and this user file doesn't, migrate once.
-    if os.path.exists(path):
-        return
-    if os.path.exists(LEGACY_DATA_FILE):
-        try:
-            with open(LEGACY_DATA_FILE) as f:
-                legacy = json.load(f)
-            # basic sanity
-            if isinstance(legacy, dict) and ('meals' in legacy or 'settings' in legacy):
-                _ensure_user_dir()
-                with open(path, 'w') as f:
-                    json.dump(legacy, f, indent=2)
-                return
-        except Exception:
-            pass
+def _current_uid():
+    return getattr(g, 'lean_uid', None) or _get_or_create_uid()
 
-    # Otherwise create fresh
-    data = _default_user_data()
-    _ensure_user_dir()
-    with open(path, 'w') as f:
-        json.dump(data, f, indent=2)
+def _maybe_migrate_legacy(uid: str):
+    # If legacy single-user file exists and this user has no data yet, migrate once.
+    if store.exists(uid):
+        return
+    with store.locked(uid):
+        # Re-check under the lock so two first requests can't both create the document
+        if store.exists(uid):
+            return
+        if os.path.exists(LEGACY_DATA_FILE):
+            try:
+                with open(LEGACY_DATA_FILE, 'rb') as f:
+                    legacy = json_codec.load(f)
+                # basic sanity
+                if isinstance(legacy, dict) and ('meals' in legacy or 'settings' in legacy):
+                    store.save(uid, legacy)
+                    return
+            except Exception:
+                pass
+
+        # Otherwise create fresh
+        store.save(uid, _default_user_data())
 
 def load_data():
-    uid = getattr(g, 'lean_uid', None) or _get_or_create_uid()
-    path = _user_data_path(uid)
-    _maybe_migrate_legacy(uid, path)
-    with open(path) as f:
-        return json.load(f)
+    uid = _current_uid()
+    _maybe_migrate_legacy(uid)
+    return store.load(uid)
+
+def load_all_data():
+    """load_data() with archived months' meals merged back in - the complete history, for exports"""
+    uid = _current_uid()
+    _maybe_migrate_legacy(uid)
+    return store.load_all(uid)
 
 def save_data(data):
-    uid = getattr(g, 'lean_uid', None) or _get_or_create_uid()
-    path = _user_data_path(uid)
-    _ensure_user_dir()
-    with open(path, 'w') as f:
-        json.dump(data, f, indent=2)
+    """Save a document from load_data(); raises VersionConflict if it changed in between"""
+    store.save(_current_uid(), data, expected_version=data.get('_version'))
+
+def update_data(mutate):
+    """
+    Read-modify-write the current user's document: load, mutate(data), save.
+    Retries on version conflicts (another request or worker wrote first),
+    then falls back to holding the per-user lock for the whole cycle.
+    Returns whatever mutate returns; if mutate raises, nothing is saved.
+    """
+    for attempt in range(SAVE_RETRIES):
+        data = load_data()
+        result = mutate(data)
+        try:
+            save_data(data)
+            return result
+        except VersionConflict:
+            time.sleep(random.uniform(0, 0.005 * (attempt + 1)))
+
+    with store.locked(_current_uid()):
+        data = load_data()
+        result = mutate(data)
+        save_data(data)
+        return result
+
+def load_meals(start=None, end=None):
+    """Meals between two 'YYYY-MM-DD' dates (inclusive) without loading the full document"""
+    uid = _current_uid()
+    _maybe_migrate_legacy(uid)
+    return store.meals_between(uid, start, end)
+
+def load_daily_totals(start=None, end=None):
+    """{date: {calories, protein, carbs, fat, meal_count}} for logged days in the range"""
+    uid = _current_uid()
+    _maybe_migrate_legacy(uid)
+    return store.daily_totals(uid, start, end)
+
+def load_streak():
+    """{'current', 'longest', 'logged_today'} as of today in the app's timezone"""
+    uid = _current_uid()
+    _maybe_migrate_legacy(uid)
+    return store.streak(uid, datetime.now(ZoneInfo("America/Chicago")).strftime('%Y-%m-%d'))
+
+def load_aggregate(start, end, group='day'):
+    """Per-bucket macro totals for start..end ('YYYY-MM-DD') grouped by day, week or month"""
+    uid = _current_uid()
+    _maybe_migrate_legacy(uid)
+    return store.aggregate(uid, start, end, group)
+
+def _last_days(days, today):
+    """(start, end) 'YYYY-MM-DD' bounds of the `days` calendar days ending today"""
+    return (today - timedelta(days=days - 1)).strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d')
+
+def load_deficit_ledger(start, goal):
+    """DeficitLedger of the current user's daily calories from start against a daily goal"""
+    uid = _current_uid()
+    _maybe_migrate_legacy(uid)
+    return store.deficit_ledger(uid, start, goal)
+
+def load_settings():
+    uid = _current_uid()
+    _maybe_migrate_legacy(uid)
+    return store.settings(uid)
+
+def log_meal(meal):
+    """Persist one new meal (single insert on the SQLite engine)"""
+    uid = _current_uid()
+    _maybe_migrate_legacy(uid)
+    _append_meal(uid, meal)
+
+def _append_meal(uid, meal):
+    """log_meal() for a given uid - what background jobs call, outside any request"""
+    store.append_meal(uid, meal)
+    _publish_meal(uid, 'meal', meal)
+
+def log_weight(entry):
+    """Persist one new weight entry"""
+    uid = _current_uid()
+    _maybe_migrate_legacy(uid)
+    store.append_weight(uid, entry)
+    if live.watching(uid):
+        live.publish(uid, 'weight', {'entry': entry})
+
+def log_progress_photo(photo):
+    """Persist one new progress photo entry"""
+    uid = _current_uid()
+    _maybe_migrate_legacy(uid)
+    store.append_progress_photo(uid, photo)
+
+def remove_meal(meal_id):
+    """Delete the meal with this id and return it"""
+    uid = _current_uid()
+    _maybe_migrate_legacy(uid)
+    try:
+        meal = store.delete_meal(uid, meal_id)
+    except KeyError:
+        raise ValueError('Invalid meal ID')
+    _publish_meal(uid, 'meal_deleted', meal)
+    return meal
+
+def edit_meal(meal_id, changes):
+    """Update fields of the meal with this id and return the new record"""
+    uid = _current_uid()
+    _maybe_migrate_legacy(uid)
+    before = store.find_meal(uid, meal_id) if live.watching(uid) else None
+    try:
+        meal = store.update_meal(uid, meal_id, changes)
+    except KeyError:
+        raise ValueError('Invalid meal ID')
+    _publish_meal(uid, 'meal_updated', meal, before)
+    return meal
+
+def _day_totals(uid, day):
+    return store.daily_totals(uid, day, day).get(day) or empty_day()
+
+def _publish_meal(uid, event, meal, before=None):
+    """
+    Push a committed meal change to the user's open streams: the meal, the
+    new totals of the day(s) it touched and the new streak. Nothing is
+    computed when no stream is open.
+    """
+    if not live.watching(uid):
+        return
+    days = {meal.get('date'), before.get('date') if before else None} - {None}
+    today = datetime.now(ZoneInfo("America/Chicago")).strftime('%Y-%m-%d')
+    live.publish(uid, event, {'meal': meal, 'totals': {day: _day_totals(uid, day) for day in sorted(days)},
+                              'streak': store.streak(uid, today)})
+
+def _live_snapshot(uid):
+    """The 'sync' event: today's totals and the streak, for a client to (re)start from"""
+    today = datetime.now(ZoneInfo("America/Chicago")).strftime('%Y-%m-%d')
+    return {'today': today, 'totals': {today: _day_totals(uid, today)}, 'streak': store.streak(uid, today)}
+
+def _job_payload(job):
+    """A job record as /api/jobs/<id> shows it to its owner"""
+    payload = {'job_id': job['id'], 'kind': job['kind'], 'status': job['status']}
+    if 'result' in job:
+        payload['result'] = job['result']
+    if 'error' in job:
+        payload['error'] = job['error']
+    return payload
+
+def _publish_job(job):
+    """Tell the owner's open streams a job finished (its meal, if any, was already pushed)"""
+    if live.watching(job['uid']):
+        live.publish(job['uid'], 'job', _job_payload(job))
+
+def _submit_job(uid, kind, fn, *args):
+    """
+    Queue a background job for the current user: 202 with its id, or 503
+    when this worker's queue is full.
+    """
+    try:
+        job = jobs.submit(uid, kind, fn, *args)
+    except QueueFull:
+        response = jsonify({'success': False, 'error': 'Too many uploads in progress, please try again shortly'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    return jsonify({'success': True, 'job_id': job['id'], 'status': job['status'],
+                    'status_url': url_for('get_job', job_id=job['id'])}), 202
+
+def _etag(*parts):
+    return hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=12).hexdigest()
+
+def _conditional(etag, render):
+    """
+    304 when the client's If-None-Match already holds etag, else render()'s
+    response tagged with it (200s only). Clients must revalidate every time
+    (no-cache), which costs them one round trip and us only the etag.
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(render())
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def conditional_get(view):
+    """
+    For read endpoints whose body depends only on the user's document, the
+    query string and today's date: ETag them from those, with the document
+    taken as store.stamp() - the per-user version on SQLite, the document
+    (and journal) file stat otherwise, the same token the document cache is
+    validated by - so a poll with nothing new is one stat and a 304, before
+    any loading or computing.
+    """
+    @functools.wraps(view)
+    def conditional(*args, **kwargs):
+        uid = _current_uid()
+        stamp = store.stamp(uid)
+        if stamp is None:
+            return view(*args, **kwargs)  # no document yet - the view creates it
+        today = datetime.now(ZoneInfo("America/Chicago")).strftime('%Y-%m-%d')
+        etag = _etag(stamp, uid, request.path, sorted(request.args.items(multi=True)), today)
+        return _conditional(etag, lambda: view(*args, **kwargs))
+    return conditional
 
 @app.before_request
 def _attach_uid():
@@ -148,11 +380,9 @@ def version_check():
 
 @app.route('/')
 def dashboard():
-    response = make_response(render_template('dashboard_v3.html'))
-    response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
-    return response
+    # Revalidated on every load (a deploy shows up at once), but unchanged templates are a 304
+    st = os.stat(os.path.join(app.root_path, app.template_folder, 'dashboard_v3.html'))
+    return _conditional(_etag(st.st_mtime_ns, st.st_size), lambda: render_template('dashboard_v3.html'))
 
 @app.route('/settings')
 def settings():
@@ -164,14 +394,14 @@ def import_page():
     return render_template('import.html')
 
 @app.route('/api/today')
+@conditional_get
 def get_today():
     """Get today's complete data"""
-    data = load_data()
     today = datetime.now(ZoneInfo("America/Chicago")).strftime('%Y-%m-%d')
-    
-    # Get today's meals
-    today_meals = [m for m in data['meals'] if m['date'] == today]
-    
+    return jsonify(_today_payload(today, load_meals(today, today), load_settings()))
+
+def _today_payload(today, today_meals, settings):
+    """/api/today body from today's meals and the user's settings"""
     # Calculate totals
     total_cal = sum(m['calories'] for m in today_meals)
     total_protein = sum(m['protein'] for m in today_meals)
@@ -179,13 +409,12 @@ def get_today():
     total_fat = sum(m.get('fat', 0) for m in today_meals)
     
     # Goals
-    settings = data.get('settings', {})
     cal_goal = settings.get('daily_calorie_goal', 2200)
     protein_goal = settings.get('daily_protein_goal', 200)
     carbs_goal = settings.get('daily_carbs_goal', 250)
     fat_goal = settings.get('daily_fat_goal', 70)
     
-    return jsonify({
+    return {
         'date': today,
         'meals': today_meals,
         'totals': {
@@ -205,85 +434,57 @@ def get_today():
             'calories_pct': round((total_cal / cal_goal) * 100),
             'protein_pct': round((total_protein / protein_goal) * 100)
         }
-    })
+    }
 
 @app.route('/api/meals')
+@conditional_get
 def get_meals():
     """Get recent meals (for displaying in Recent Meals section)"""
     days = int(request.args.get('days', 30))
-    data = load_data()
     now = datetime.now(ZoneInfo("America/Chicago"))
     cutoff_date = (now - timedelta(days=days)).strftime('%Y-%m-%d')
     
-    # Get all meals from the last N days, sorted by date+time descending
-    recent_meals = [m for m in data['meals'] if m['date'] >= cutoff_date]
+    return jsonify(_meals_payload(load_meals(cutoff_date)))
+
+def _meals_payload(recent_meals):
+    """/api/meals body: the given meals sorted by date+time descending"""
     recent_meals.sort(key=lambda x: (x['date'], x.get('time', '00:00')), reverse=True)
     
-    return jsonify({
+    return {
         'meals': recent_meals,
         'count': len(recent_meals)
-    })
+    }
 
 @app.route('/api/goal_projection')
 def get_goal_projection():
     """Calculate goal projection based on actual progress"""
-    data = load_data()
-    
     # Load user goals (would come from database in production)
     try:
-        with open('user_goals.json') as f:
-            goals = json.load(f)
+        with open('user_goals.json', 'rb') as f:
+            goals = json_codec.load(f)
     except:
         return jsonify({'error': 'Goals not set'})
     
-    # Calculate actual deficit over time
-    meals_by_date = defaultdict(list)
-    for meal in data['meals']:
-        meals_by_date[meal['date']].append(meal)
-    
-    start_date = datetime.strptime(goals['started_date'], '%Y-%m-%d')
-    today = datetime.now(ZoneInfo("America/Chicago"))
+    return jsonify(_goal_projection(goals))
+
+def _goal_projection(goals):
+    """/api/goal_projection body for the given goals"""
+    # Cumulative deficit, days under target and logging runs since the start
+    # date come from prefix sums over the daily rollups (deficit_ledger.py)
+    tz = ZoneInfo("America/Chicago")
+    today = datetime.now(tz)
+    start_date = datetime.strptime(goals['started_date'], '%Y-%m-%d').replace(tzinfo=tz)
     days_tracked = (today - start_date).days
-    
-    # Calculate cumulative deficit
-    total_deficit = 0
-    days_under_target = 0
-    logging_streak = 0
-    current_streak = 0
-    last_logged_date = None
-    
-    for i in range(days_tracked + 1):
-        date = (start_date + timedelta(days=i)).strftime('%Y-%m-%d')
-        meals = meals_by_date[date]
-        
-        if meals:
-            day_cal = sum(m['calories'] for m in meals)
-            day_deficit = goals['daily_calorie_goal'] - day_cal
-            total_deficit += day_deficit
-            
-            if day_deficit > 0:
-                days_under_target += 1
-            
-            # Calculate logging streak
-            date_obj = datetime.strptime(date, '%Y-%m-%d')
-            if last_logged_date:
-                gap = (date_obj - last_logged_date).days
-                if gap == 1:
-                    current_streak += 1
-                else:
-                    current_streak = 1
-            else:
-                current_streak = 1
-            
-            logging_streak = max(logging_streak, current_streak)
-            last_logged_date = date_obj
+    ledger = load_deficit_ledger(goals['started_date'], goals['daily_calorie_goal'])
+    summary = ledger.summary(today.strftime('%Y-%m-%d'))
+    total_deficit = summary['total_deficit']
     
     # Calculate lbs lost (3500 cal = 1 lb)
     lbs_lost = total_deficit / 3500
     current_weight = goals['current_weight'] - lbs_lost
     
     # Calculate required vs actual rate
-    target_date = datetime.strptime(goals['target_date'], '%Y-%m-%d')
+    target_date = datetime.strptime(goals['target_date'], '%Y-%m-%d').replace(tzinfo=tz)
     days_to_goal = (target_date - today).days
     lbs_to_goal = current_weight - goals['goal_weight']
     
@@ -303,7 +504,7 @@ def get_goal_projection():
         new_weeks = int(lbs_to_goal / actual_weekly_loss) if actual_weekly_loss > 0 else 52
         status_text = f'❌ Off Track (reset to {new_weeks} weeks)'
     
-    return jsonify({
+    return {
         'current_weight': round(current_weight, 1),
         'goal_weight': goals['goal_weight'],
         'lbs_to_goal': round(lbs_to_goal, 1),
@@ -316,78 +517,47 @@ def get_goal_projection():
         'actual_weekly_loss': round(actual_weekly_loss, 2),
         'total_deficit': int(total_deficit),
         'days_tracked': days_tracked,
-        'days_under_target': days_under_target,
-        'logging_streak': logging_streak,
-        'current_streak': current_streak
-    })
+        'days_under_target': summary['days_under_target'],
+        'logging_streak': summary['logging_streak'],
+        'current_streak': summary['current_streak']
+    }
 
 @app.route('/api/week')
+@conditional_get
 def get_week():
     """Get last 7 days summary"""
-    data = load_data()
-    
-    # Calculate last 7 days
-    meals_by_date = defaultdict(list)
-    for meal in data['meals']:
-        meals_by_date[meal['date']].append(meal)
-    
     today = datetime.now(ZoneInfo("America/Chicago"))
-    week_data = []
     
-    for i in range(6, -1, -1):
-        date = (today - timedelta(days=i)).strftime('%Y-%m-%d')
-        meals = meals_by_date[date]
-        
-        day_cal = sum(m['calories'] for m in meals)
-        day_protein = sum(m['protein'] for m in meals)
-        
-        week_data.append({
-            'date': date,
-            'day': (today - timedelta(days=i)).strftime('%a'),
-            'calories': day_cal,
-            'protein': day_protein,
-            'meal_count': len(meals)
-        })
-    
-    return jsonify(week_data)
+    return jsonify([{
+        'date': day['start'],
+        'day': datetime.strptime(day['start'], '%Y-%m-%d').strftime('%a'),
+        'calories': day['calories'],
+        'protein': day['protein'],
+        'meal_count': day['meal_count']
+    } for day in load_aggregate(*_last_days(7, today))])
 
 @app.route('/api/last_14_days')
+@conditional_get
 def get_last_14_days():
     """Get last 14 days for trend chart"""
-    data = load_data()
-    
-    # Calculate last 14 days
-    meals_by_date = defaultdict(list)
-    for meal in data['meals']:
-        meals_by_date[meal['date']].append(meal)
-    
     today = datetime.now(ZoneInfo("America/Chicago"))
-    trend_data = []
-    
-    for i in range(13, -1, -1):
-        date = (today - timedelta(days=i)).strftime('%Y-%m-%d')
-        meals = meals_by_date[date]
-        
-        day_cal = sum(m['calories'] for m in meals)
-        day_protein = sum(m['protein'] for m in meals)
-        
-        trend_data.append({
-            'date': date,
-            'day': (today - timedelta(days=i)).strftime('%a'),
-            'calories': day_cal,
-            'protein': day_protein
-        })
     
-    return jsonify(trend_data)
+    return jsonify([{
+        'date': day['start'],
+        'day': datetime.strptime(day['start'], '%Y-%m-%d').strftime('%a'),
+        'calories': day['calories'],
+        'protein': day['protein']
+    } for day in load_aggregate(*_last_days(14, today))])
 
 @app.route('/api/meal_history')
+@conditional_get
 def get_meal_history():
     """Get all meals with dates for history view"""
-    data = load_data()
+    totals = load_daily_totals()
     
     # Group meals by date
     meals_by_date = defaultdict(list)
-    for meal in data['meals']:
+    for meal in load_meals():
         meals_by_date[meal['date']].append(meal)
     
     # Sort dates descending (newest first)
@@ -396,8 +566,9 @@ def get_meal_history():
     history = []
     for date in sorted_dates:
         meals = meals_by_date[date]
-        day_cal = sum(m['calories'] for m in meals)
-        day_protein = sum(m['protein'] for m in meals)
+        day = totals.get(date) or empty_day()
+        day_cal = day['calories']
+        day_protein = day['protein']
         
         # Format date
         date_obj = datetime.strptime(date, '%Y-%m-%d')
@@ -542,24 +713,20 @@ def generate_meal_plan():
     })
 
 @app.route('/api/progress_photos')
+@conditional_get
 def get_progress_photos():
     """Get all progress photos"""
     data = load_data()
-    photos = data.get('progress_photos', [])
-    
+    return jsonify(_progress_photos_payload(data.get('progress_photos', [])))
+
+def _progress_photos_payload(photos):
     # Sort by date
-    photos = sorted(photos, key=lambda x: x['date'])
-    
-    return jsonify(photos)
+    return sorted(photos, key=lambda x: x['date'])
 
 @app.route('/api/upload_progress_photo', methods=['POST'])
 def upload_progress_photo():
     """Upload a progress photo"""
     photo_data = request.json
-    data = load_data()
-    
-    if 'progress_photos' not in data:
-        data['progress_photos'] = []
     
     # Add photo entry
     photo_entry = {
@@ -570,8 +737,7 @@ def upload_progress_photo():
         'notes': photo_data.get('notes', '')
     }
     
-    data['progress_photos'].append(photo_entry)
-    save_data(data)
+    log_progress_photo(photo_entry)
     
     return jsonify({'status': 'success', 'photo': photo_entry})
 
@@ -585,17 +751,15 @@ def generate_future_body():
     # In production, this would call an image generation API
     # For now, return projection data
     
-    data = load_data()
-    
     # Calculate projected weight loss
     try:
-        with open('user_goals.json') as f:
-            goals = json.load(f)
+        with open('user_goals.json', 'rb') as f:
+            goals = json_codec.load(f)
     except:
         return jsonify({'error': 'Goals not set'})
     
     # Get current stats
-    projection = get_goal_projection().json
+    projection = _goal_projection(goals)
     weekly_loss = projection['actual_weekly_loss']
     projected_weight_loss = weekly_loss * weeks_ahead
     projected_weight = projection['current_weight'] - projected_weight_loss
@@ -618,22 +782,20 @@ def get_gamification():
 def log_meal_with_gamification():
     """Log meal and award XP"""
     meal_data = request.json
-    data = load_data()
     
     # Add timestamp
     meal_data['date'] = datetime.now(ZoneInfo("America/Chicago")).strftime('%Y-%m-%d')
     meal_data['time'] = datetime.now(ZoneInfo("America/Chicago")).strftime('%H:%M')
     
-    data['meals'].append(meal_data)
-    data['meals'] = sorted(data['meals'], key=lambda x: (x['date'], x['time']))
+    log_meal(meal_data)
     
     # Calculate day totals
     today = meal_data['date']
-    today_meals = [m for m in data['meals'] if m['date'] == today]
+    today_meals = load_meals(today, today)
     total_cal = sum(m['calories'] for m in today_meals)
     total_protein = sum(m['protein'] for m in today_meals)
     
-    settings = data.get('settings', {})
+    settings = load_settings()
     cal_goal = settings.get('daily_calorie_goal', 2200)
     protein_goal = settings.get('daily_protein_goal', 200)
     
@@ -643,8 +805,6 @@ def log_meal_with_gamification():
     # Award XP
     xp_result = gamification.log_meal_xp(under_target=under_target, protein_hit=protein_hit)
     
-    save_data(data)
-    
     return jsonify({
         'status': 'success',
         'meal': meal_data,
@@ -655,23 +815,23 @@ def log_meal_with_gamification():
 def add_meal():
     """Quick add a meal"""
     meal_data = request.json
-    data = load_data()
     
     # Add timestamp
     meal_data['date'] = datetime.now(ZoneInfo("America/Chicago")).strftime('%Y-%m-%d')
     meal_data['time'] = datetime.now(ZoneInfo("America/Chicago")).strftime('%H:%M')
     
-    data['meals'].append(meal_data)
-    data['meals'] = sorted(data['meals'], key=lambda x: (x['date'], x['time']))
-    
-    save_data(data)
+    log_meal(meal_data)
     
     return jsonify({'status': 'success'})
 
 
 @app.route('/api/voice_log', methods=['POST'])
 def voice_log():
-    """Process voice recording and log meal"""
+    """
+    Accept a voice recording and log its meal in the background. Returns a
+    job id at once; GET /api/jobs/<id> (or the 'job' stream event) reports
+    {'success', 'transcript', 'meal'} when transcription and parsing finish.
+    """
     try:
         # Get audio file from request
         if 'audio' not in request.files:
@@ -680,12 +840,28 @@ def voice_log():
         audio_file = request.files['audio']
         
         # Save temporarily
-        temp_path = f'/tmp/voice_{datetime.now(ZoneInfo("America/Chicago")).timestamp()}.webm'
+        now = datetime.now(ZoneInfo("America/Chicago"))
+        temp_path = f'/tmp/voice_{now.timestamp()}_{uuid.uuid4().hex[:8]}.webm'
         audio_file.save(temp_path)
         
+        uid = _current_uid()
+        _maybe_migrate_legacy(uid)
+        response, status = _submit_job(uid, 'voice_log', _voice_log_job, uid, temp_path, os.getenv('OPENAI_API_KEY'), now)
+        if status != 202:
+            os.remove(temp_path)
+        return response, status
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def _voice_log_job(uid, temp_path, api_key, now):
+    """Transcribe, parse and save a recorded meal (runs on the job pool)"""
+    try:
         # Use direct API calls instead of SDK to avoid proxy issues
         from voice_fix import transcribe_audio_direct, parse_meal_direct
-        api_key = os.getenv('OPENAI_API_KEY')
         
         # Transcribe with Whisper
         text = transcribe_audio_direct(temp_path, api_key)
@@ -694,36 +870,30 @@ def voice_log():
         result_text = parse_meal_direct(text, api_key)
         meal_data = json.loads(result_text)
         
-        # SAVE THE MEAL TO DATABASE
-        now = datetime.now(ZoneInfo("America/Chicago"))
-        new_meal = {
-            'date': now.strftime('%Y-%m-%d'),
-            'time': now.strftime('%H:%M'),
-            'description': meal_data.get('food', text),
-            'calories': int(meal_data.get('calories', 0)),
-            'protein': int(meal_data.get('protein', 0)),
-            'carbs': int(meal_data.get('carbs', 0)),
-            'fat': int(meal_data.get('fat', 0))
-        }
+        # SAVE THE MEAL TO DATABASE (timed when it was recorded, not when the job ran)
+        _append_meal(uid, _ai_meal(meal_data, meal_data.get('food', text), now))
         
-        data = load_data()
-        data['meals'].append(new_meal)
-        save_data(data)
-        
-        # Clean up temp file
-        os.remove(temp_path)
-        
-        return jsonify({
+        return {
             'success': True,
             'transcript': text,
             'meal': meal_data
-        })
-        
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+        }
+    finally:
+        # Clean up temp file
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def _ai_meal(meal_data, description, now):
+    """The stored meal for an AI estimate ({'food', 'calories', ...}) logged at now"""
+    return {
+        'date': now.strftime('%Y-%m-%d'),
+        'time': now.strftime('%H:%M'),
+        'description': description,
+        'calories': int(meal_data.get('calories', 0)),
+        'protein': int(meal_data.get('protein', 0)),
+        'carbs': int(meal_data.get('carbs', 0)),
+        'fat': int(meal_data.get('fat', 0))
+    }
 
 
 @app.route('/api/calculate_goals', methods=['POST'])
@@ -815,19 +985,20 @@ def save_goals():
     try:
         goals = request.json or {}
 
-        data = load_data()
-        if 'settings' not in data:
-            data['settings'] = {}
+        def apply_goals(data):
+            if 'settings' not in data:
+                data['settings'] = {}
 
-        data['settings']['daily_calorie_goal'] = int(goals.get('daily_calorie_goal', 2200))
-        data['settings']['daily_protein_goal'] = int(goals.get('daily_protein_goal', 200))
-        data['settings']['daily_carbs_goal'] = int(goals.get('daily_carbs_goal', 250))
-        data['settings']['daily_fat_goal'] = int(goals.get('daily_fat_goal', 70))
-        data['settings']['onboarded'] = True
+            data['settings']['daily_calorie_goal'] = int(goals.get('daily_calorie_goal', 2200))
+            data['settings']['daily_protein_goal'] = int(goals.get('daily_protein_goal', 200))
+            data['settings']['daily_carbs_goal'] = int(goals.get('daily_carbs_goal', 250))
+            data['settings']['daily_fat_goal'] = int(goals.get('daily_fat_goal', 70))
+            data['settings']['onboarded'] = True
+            return data['settings']
 
-        save_data(data)
+        settings = update_data(apply_goals)
 
-        return jsonify({'success': True, 'settings': data['settings']})
+        return jsonify({'success': True, 'settings': settings})
 
     except Exception as e:
         return jsonify({
@@ -873,12 +1044,12 @@ def save_share_image():
 def export_data():
     """Export all user data as JSON"""
     try:
-        data = load_data()
+        data = load_all_data()
         
         # Try to include goals if they exist
         try:
-            with open('user_goals.json') as f:
-                goals = json.load(f)
+            with open('user_goals.json', 'rb') as f:
+                goals = json_codec.load(f)
                 data['goals'] = goals
         except:
             pass
@@ -892,7 +1063,7 @@ def export_data():
         
         # Return as downloadable JSON
         from flask import make_response
-        response = make_response(json.dumps(export, indent=2))
+        response = make_response(json_codec.dumpb(export, indent=2))
         response.headers['Content-Type'] = 'application/json'
         response.headers['Content-Disposition'] = f'attachment; filename=lean_data_{datetime.now(ZoneInfo("America/Chicago")).strftime("%Y%m%d")}.json'
         
@@ -1139,13 +1310,10 @@ def api_log_meal_enhanced():
         }), 403
     
     # Add meal
-    data = load_data()
     meal_data['date'] = datetime.now(ZoneInfo("America/Chicago")).strftime('%Y-%m-%d')
     meal_data['time'] = datetime.now(ZoneInfo("America/Chicago")).strftime('%H:%M')
     
-    data['meals'].append(meal_data)
-    data['meals'] = sorted(data['meals'], key=lambda x: (x['date'], x['time']))
-    save_data(data)
+    log_meal(meal_data)
     
     # Track analytics
     method = meal_data.get('method', 'text')
@@ -1157,7 +1325,7 @@ def api_log_meal_enhanced():
     )
     
     # Check for milestones
-    meal_count = len([m for m in data['meals'] if m.get('user_id') == user_id])
+    meal_count = len([m for m in load_meals() if m.get('user_id') == user_id])
     
     milestone = None
     if meal_count == 1:
@@ -1177,60 +1345,15 @@ def api_log_meal_enhanced():
 # ============= STREAK COUNTER =============
 
 @app.route('/api/streak')
+@conditional_get
 def get_streak():
-    """Calculate current logging streak"""
-    data = load_data()
-    
-    if not data['meals']:
-        return jsonify({'current': 0, 'longest': 0, 'logged_today': False})
-    
-    # Get unique dates with meals logged
-    dates_logged = sorted(set(meal['date'] for meal in data['meals']))
-    
-    if not dates_logged:
-        return jsonify({'current': 0, 'longest': 0, 'logged_today': False})
-    
-    # Calculate current streak
+    """Current and longest logging streak, from the persisted streak state (streaks.py)"""
+    return jsonify(load_streak())
+
+def _streak_payload(data):
+    """/api/streak body from a loaded user document (after ensure_rollups)"""
     today = datetime.now(ZoneInfo("America/Chicago")).strftime('%Y-%m-%d')
-    yesterday = (datetime.now(ZoneInfo("America/Chicago")) - timedelta(days=1)).strftime('%Y-%m-%d')
-    
-    current_streak = 0
-    longest_streak = 0
-    temp_streak = 1
-    
-    # Check if logged today or yesterday (grace period)
-    if today in dates_logged or yesterday in dates_logged:
-        current_streak = 1
-        
-        # Count backwards from most recent
-        for i in range(len(dates_logged) - 1, 0, -1):
-            current_date = datetime.strptime(dates_logged[i], '%Y-%m-%d')
-            prev_date = datetime.strptime(dates_logged[i-1], '%Y-%m-%d')
-            
-            # Check if consecutive days
-            if (current_date - prev_date).days == 1:
-                current_streak += 1
-            else:
-                break
-    
-    # Calculate longest streak ever
-    for i in range(1, len(dates_logged)):
-        current_date = datetime.strptime(dates_logged[i], '%Y-%m-%d')
-        prev_date = datetime.strptime(dates_logged[i-1], '%Y-%m-%d')
-        
-        if (current_date - prev_date).days == 1:
-            temp_streak += 1
-            longest_streak = max(longest_streak, temp_streak)
-        else:
-            temp_streak = 1
-    
-    longest_streak = max(longest_streak, current_streak, temp_streak)
-    
-    return jsonify({
-        'current': current_streak,
-        'longest': longest_streak,
-        'logged_today': today in dates_logged
-    })
+    return streak_summary(data[STREAK_KEY], data[ROLLUP_KEY], today)
 
 # ============= WEIGHT TRACKING =============
 
@@ -1239,10 +1362,6 @@ def add_weight():
     """Add a weight entry"""
     try:
         weight_data = request.json
-        data = load_data()
-        
-        if 'weight_history' not in data:
-            data['weight_history'] = []
         
         entry = {
             'date': datetime.now(ZoneInfo("America/Chicago")).strftime('%Y-%m-%d'),
@@ -1251,10 +1370,7 @@ def add_weight():
             'notes': weight_data.get('notes', '')
         }
         
-        data['weight_history'].append(entry)
-        data['weight_history'] = sorted(data['weight_history'], key=lambda x: (x['date'], x['time']))
-        
-        save_data(data)
+        log_weight(entry)
         
         return jsonify({
             'success': True,
@@ -1268,6 +1384,7 @@ def add_weight():
         }), 400
 
 @app.route('/api/weight/history')
+@conditional_get
 def get_weight_history():
     """Get weight history with optional date range"""
     try:
@@ -1315,63 +1432,11 @@ def get_weight_history():
 # ============= PROGRESS CARD GENERATOR =============
 
 @app.route('/api/progress_card')
+@conditional_get
 def generate_progress_card():
     """Generate weekly recap card data"""
     try:
-        data = load_data()
-        
-        # Calculate stats for the week
-        today = datetime.now(ZoneInfo("America/Chicago"))
-        week_start = (today - timedelta(days=7)).strftime('%Y-%m-%d')
-        today_str = today.strftime('%Y-%m-%d')
-        
-        # Get meals from last 7 days
-        week_meals = [m for m in data['meals'] if week_start <= m['date'] <= today_str]
-        
-        # Get weight change
-        weight_history = data.get('weight_history', [])
-        if len(weight_history) >= 2:
-            week_weights = [w for w in weight_history if week_start <= w['date'] <= today_str]
-            if len(week_weights) >= 2:
-                weight_lost = week_weights[0]['weight'] - week_weights[-1]['weight']
-            else:
-                # Compare first and last overall
-                weight_lost = weight_history[0]['weight'] - weight_history[-1]['weight']
-        else:
-            weight_lost = 0
-        
-        # Get streak
-        streak_res = get_streak()
-        streak_data = streak_res.get_json()
-        
-        # Count meals logged
-        meals_logged = len(week_meals)
-        
-        # Calculate average deficit
-        total_deficit = 0
-        days_with_meals = set(m['date'] for m in week_meals)
-        
-        for date in days_with_meals:
-            day_meals = [m for m in week_meals if m['date'] == date]
-            day_cal = sum(m['calories'] for m in day_meals)
-            settings = data.get('settings', {})
-            cal_goal = settings.get('daily_calorie_goal', 2200)
-            deficit = cal_goal - day_cal
-            if deficit > 0:
-                total_deficit += deficit
-        
-        avg_deficit = total_deficit // max(len(days_with_meals), 1)
-        
-        return jsonify({
-            'success': True,
-            'card_data': {
-                'weight_lost': round(weight_lost, 1),
-                'streak': streak_data['current'],
-                'meals_logged': meals_logged,
-                'avg_deficit': avg_deficit,
-                'period': '7 days'
-            }
-        })
+        return jsonify(_progress_card_payload(load_data()))
         
     except Exception as e:
         return jsonify({
@@ -1379,42 +1444,189 @@ def generate_progress_card():
             'error': str(e)
         }), 400
 
+def _progress_card_payload(data, streak=None):
+    """/api/progress_card body from a loaded user document (streak: a _streak_payload() already computed from it)"""
+    totals = ensure_rollups(data)
+    
+    # Calculate stats for the week
+    today = datetime.now(ZoneInfo("America/Chicago"))
+    week_start = (today - timedelta(days=7)).strftime('%Y-%m-%d')
+    today_str = today.strftime('%Y-%m-%d')
+    
+    # Get per-day totals for the last 7 days
+    week_totals = totals_between(totals, week_start, today_str)
+    
+    # Get weight change
+    weight_history = data.get('weight_history', [])
+    if len(weight_history) >= 2:
+        week_weights = [w for w in weight_history if week_start <= w['date'] <= today_str]
+        if len(week_weights) >= 2:
+            weight_lost = week_weights[0]['weight'] - week_weights[-1]['weight']
+        else:
+            # Compare first and last overall
+            weight_lost = weight_history[0]['weight'] - weight_history[-1]['weight']
+    else:
+        weight_lost = 0
+    
+    # Get streak
+    if streak is None:
+        streak = _streak_payload(data)
+    
+    # Count meals logged
+    meals_logged = sum(day['meal_count'] for day in week_totals.values())
+    
+    # Calculate average deficit
+    total_deficit = 0
+    days_with_meals = set(week_totals)
+    
+    for date in days_with_meals:
+        day_cal = week_totals[date]['calories']
+        settings = data.get('settings', {})
+        cal_goal = settings.get('daily_calorie_goal', 2200)
+        deficit = cal_goal - day_cal
+        if deficit > 0:
+            total_deficit += deficit
+    
+    avg_deficit = total_deficit // max(len(days_with_meals), 1)
+    
+    return {
+        'success': True,
+        'card_data': {
+            'weight_lost': round(weight_lost, 1),
+            'streak': streak['current'],
+            'meals_logged': meals_logged,
+            'avg_deficit': avg_deficit,
+            'period': '7 days'
+        }
+    }
+
 # ============= MISSING ENDPOINTS FOR DASHBOARD V3 =============
 
+def _history_payload(days):
+    """/api/history body from day buckets (range_aggregates.aggregate), zeros for days without meals"""
+    return [{
+        'date': day['start'],
+        'calories': day['calories'],
+        'protein': day['protein'],
+        'carbs': day['carbs'],
+        'fat': day['fat'],
+        'meal_count': day['meal_count']
+    } for day in days]
+
 @app.route('/api/history')
+@conditional_get
 def get_history():
     """Get meal/calorie history for specified number of days"""
     try:
         days = request.args.get('days', 14, type=int)
-        data = load_data()
+        today = datetime.now(ZoneInfo("America/Chicago"))
         
-        # Calculate date range
-        meals_by_date = defaultdict(list)
-        for meal in data['meals']:
-            meals_by_date[meal['date']].append(meal)
+        return jsonify(_history_payload(load_aggregate(*_last_days(days, today))))
         
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@app.route('/api/aggregate')
+@conditional_get
+def get_aggregate():
+    """
+    Macro totals for any window grouped by day, ISO week or month:
+    ?from=YYYY-MM-DD&to=YYYY-MM-DD&group=day|week|month&metrics=calories,protein
+    Defaults: the last 14 days, by day, all metrics. Every bucket also
+    carries meal_count and days_logged.
+    """
+    try:
         today = datetime.now(ZoneInfo("America/Chicago"))
-        history = []
+        default_start, default_end = _last_days(14, today)
+        start = request.args.get('from', default_start)
+        end = request.args.get('to', default_end)
+        group = request.args.get('group', 'day')
+        metrics = [m.strip() for m in request.args.get('metrics', 'calories,protein,carbs,fat').split(',') if m.strip()]
+        
+        if group not in AGGREGATE_GROUPS:
+            return jsonify({'success': False, 'error': f"group must be one of {', '.join(AGGREGATE_GROUPS)}"}), 400
+        unknown = [m for m in metrics if m not in ('calories', 'protein', 'carbs', 'fat')]
+        if unknown:
+            return jsonify({'success': False, 'error': f"Unknown metrics: {', '.join(unknown)}"}), 400
+        if datetime.strptime(start, '%Y-%m-%d') > datetime.strptime(end, '%Y-%m-%d'):
+            return jsonify({'success': False, 'error': "'from' is after 'to'"}), 400
+        
+        keep = ('label', 'start', 'end', *metrics, 'meal_count', 'days_logged')
+        buckets = [{k: bucket[k] for k in keep} for bucket in load_aggregate(start, end, group)]
         
-        for i in range(days - 1, -1, -1):
-            date = (today - timedelta(days=i)).strftime('%Y-%m-%d')
-            meals = meals_by_date[date]
-            
-            day_cal = sum(m['calories'] for m in meals)
-            day_protein = sum(m['protein'] for m in meals)
-            day_carbs = sum(m.get('carbs', 0) for m in meals)
-            day_fat = sum(m.get('fat', 0) for m in meals)
-            
-            history.append({
-                'date': date,
-                'calories': day_cal,
-                'protein': day_protein,
-                'carbs': day_carbs,
-                'fat': day_fat,
-                'meal_count': len(meals)
-            })
+        return jsonify({
+            'from': start,
+            'to': end,
+            'group': group,
+            'metrics': metrics,
+            'buckets': buckets,
+            'totals': {k: sum(bucket[k] for bucket in buckets) for k in keep[3:]}
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+# ============= DASHBOARD BUNDLE =============
+
+DASHBOARD_SECTIONS = ('streak', 'today', 'meals', 'history', 'progress_card', 'progress_photos')
+
+@app.route('/api/dashboard_bundle')
+@conditional_get
+def get_dashboard_bundle():
+    """
+    Everything the dashboard needs on load from one read of the user document.
+    ?sections=today,streak picks a subset (default: all of DASHBOARD_SECTIONS);
+    ?days= and ?history_days= mean the same as on /api/meals and /api/history.
+    Each section holds exactly the body its standalone endpoint returns.
+    """
+    try:
+        requested = request.args.get('sections')
+        sections = [s.strip() for s in requested.split(',') if s.strip()] if requested else list(DASHBOARD_SECTIONS)
+        unknown = [s for s in sections if s not in DASHBOARD_SECTIONS]
+        if unknown:
+            return jsonify({'success': False, 'error': f"Unknown sections: {', '.join(unknown)}"}), 400
+        days = request.args.get('days', 30, type=int)
+        history_days = request.args.get('history_days', 14, type=int)
         
-        return jsonify(history)
+        data = load_data()
+        totals = ensure_rollups(data)
+        now = datetime.now(ZoneInfo("America/Chicago"))
+        today = now.strftime('%Y-%m-%d')
+        cutoff_date = (now - timedelta(days=days)).strftime('%Y-%m-%d') if 'meals' in sections else today
+        
+        # Stored meals are in (date, time) order: walk back from the newest to the
+        # oldest day the meal sections need instead of scanning the whole history
+        meals = data.get('meals', [])
+        oldest = min(cutoff_date, today)
+        start = len(meals)
+        while start and meals[start - 1].get('date', '') >= oldest:
+            start -= 1
+        window = meals[start:]
+        if start == 0 and data.get(ARCHIVE_KEY):
+            window = load_meals(oldest)  # reaches back into archived months
+        
+        streak = _streak_payload(data) if {'streak', 'progress_card'} & set(sections) else None
+        bundle = {}
+        if 'streak' in sections:
+            bundle['streak'] = streak
+        if 'today' in sections:
+            bundle['today'] = _today_payload(today, [m for m in window if m.get('date') == today], data.get('settings', {}))
+        if 'meals' in sections:
+            bundle['meals'] = _meals_payload([m for m in window if m.get('date', '') >= cutoff_date])
+        if 'history' in sections:
+            bundle['history'] = _history_payload(aggregate(totals, *_last_days(history_days, now)))
+        if 'progress_card' in sections:
+            bundle['progress_card'] = _progress_card_payload(data, streak)
+        if 'progress_photos' in sections:
+            bundle['progress_photos'] = _progress_photos_payload(data.get('progress_photos', []))
+        
+        return jsonify(bundle)
         
     except Exception as e:
         return jsonify({
@@ -1422,28 +1634,76 @@ def get_history():
             'error': str(e)
         }), 400
 
+@app.route('/api/stream')
+def stream():
+    """
+    Server-Sent Events for the current user, so dashboards need not poll.
+    Opens with a 'sync' event (today's totals and the streak), then sends
+    'meal', 'meal_deleted' and 'meal_updated' ({meal, totals: {day: ...},
+    streak}), 'weight' ({entry}) and 'job' (a finished voice_log /
+    photo_log job, as /api/jobs/<id> shows it) as writes commit. Writes made through
+    another worker process surface as a 'sync' at the next heartbeat, as
+    does a backlog the client was too slow to drain. Answers 503 once this
+    worker serves LEAN_STREAM_MAX streams.
+    """
+    uid = _current_uid()
+    _maybe_migrate_legacy(uid)
+    try:
+        subscription = live.subscribe(uid)
+    except TooManyStreams:
+        # Every open stream holds a server thread: past the cap the dashboard polls instead
+        response = jsonify({'success': False, 'error': 'Too many live streams, poll instead'})
+        response.headers['Retry-After'] = '60'
+        return response, 503
+
+    def events():
+        try:
+            stamp = store.stamp(uid)
+            yield 'retry: 5000\n\n' + format_event('sync', _live_snapshot(uid))
+            while not subscription.closed:
+                queued, overflowed = subscription.wait(HEARTBEAT_SECONDS)
+                if overflowed:
+                    stamp = store.stamp(uid)
+                    yield format_event('sync', _live_snapshot(uid))
+                elif queued:
+                    stamp = store.stamp(uid)
+                    yield ''.join(format_event(event, data) for event, data in queued)
+                elif not subscription.closed:
+                    current = store.stamp(uid)
+                    if current != stamp:
+                        stamp = current
+                        yield format_event('sync', _live_snapshot(uid))
+                    else:
+                        yield ': keep-alive\n\n'
+        finally:
+            subscription.close()
+
+    response = Response(events(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # proxies must not hold events back
+    response.call_on_close(subscription.close)
+    return response
+
 @app.route('/api/delete_meal', methods=['POST'])
 def delete_meal():
-    """Delete a meal by index"""
+    """Delete a meal by its id"""
     try:
         meal_id = request.json.get('meal_id')
-        data = load_data()
         
-        # If meal_id is provided (for future ID-based deletion)
         if meal_id is not None:
-            # For now, treat meal_id as index
-            if 0 <= meal_id < len(data['meals']):
-                deleted_meal = data['meals'].pop(meal_id)
-                save_data(data)
-                return jsonify({
-                    'success': True,
-                    'deleted': deleted_meal
-                })
-            else:
-                return jsonify({
-                    'success': False,
-                    'error': 'Invalid meal ID'
-                }), 400
+            # Older clients send a position in the stored meal list (JSON true/false is not one)
+            if isinstance(meal_id, bool):
+                raise ValueError('Invalid meal ID')
+            if isinstance(meal_id, int):
+                meals = load_all_data()['meals']
+                if not 0 <= meal_id < len(meals):
+                    raise ValueError('Invalid meal ID')
+                meal_id = meals[meal_id]['id']
+            deleted_meal = remove_meal(meal_id)
+            return jsonify({
+                'success': True,
+                'deleted': deleted_meal
+            })
         else:
             return jsonify({
                 'success': False,
@@ -1456,34 +1716,64 @@ def delete_meal():
             'error': str(e)
         }), 400
 
+@app.route('/api/update_meal', methods=['POST'])
+def update_meal():
+    """Edit a meal by its id"""
+    try:
+        body = request.json
+        meal_id = body.get('meal_id')
+        if not meal_id:
+            return jsonify({
+                'success': False,
+                'error': 'meal_id required'
+            }), 400
+        
+        changes = {k: body[k] for k in ('description', 'date', 'time') if k in body}
+        for macro in ('calories', 'protein', 'carbs', 'fat'):
+            if macro in body:
+                changes[macro] = int(body[macro])
+        
+        updated_meal = edit_meal(meal_id, changes)
+        return jsonify({
+            'success': True,
+            'meal': updated_meal
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
 @app.route('/api/update_goals', methods=['POST'])
 def update_goals():
     """Update calorie/protein/macro goals"""
     try:
         goals_update = request.json
-        data = load_data()
         
-        if 'settings' not in data:
-            data['settings'] = {}
-        
-        # Update goals
-        if 'calories' in goals_update:
-            data['settings']['daily_calorie_goal'] = int(goals_update['calories'])
-        if 'protein' in goals_update:
-            data['settings']['daily_protein_goal'] = int(goals_update['protein'])
-        if 'carbs' in goals_update:
-            data['settings']['daily_carbs_goal'] = int(goals_update['carbs'])
-        if 'fat' in goals_update:
-            data['settings']['daily_fat_goal'] = int(goals_update['fat'])
-        
-        # Mark as onboarded if goals were set
-        data['settings']['onboarded'] = True
+        def apply_goals(data):
+            if 'settings' not in data:
+                data['settings'] = {}
+            
+            # Update goals
+            if 'calories' in goals_update:
+                data['settings']['daily_calorie_goal'] = int(goals_update['calories'])
+            if 'protein' in goals_update:
+                data['settings']['daily_protein_goal'] = int(goals_update['protein'])
+            if 'carbs' in goals_update:
+                data['settings']['daily_carbs_goal'] = int(goals_update['carbs'])
+            if 'fat' in goals_update:
+                data['settings']['daily_fat_goal'] = int(goals_update['fat'])
+            
+            # Mark as onboarded if goals were set
+            data['settings']['onboarded'] = True
+            return data['settings']
         
-        save_data(data)
+        settings = update_data(apply_goals)
         
         return jsonify({
             'success': True,
-            'updated_goals': data['settings']
+            'updated_goals': settings
         })
         
     except Exception as e:
@@ -1497,11 +1787,11 @@ def clear_all_data():
     """Clear all user data (⚠️ DESTRUCTIVE)"""
     try:
         # Create backup before clearing
-        data = load_data()
+        data = load_all_data()
         backup_file = f'fitness_data_backup_{datetime.now(ZoneInfo("America/Chicago")).strftime("%Y%m%d_%H%M%S")}.json'
         
-        with open(backup_file, 'w') as f:
-            json.dump(data, f, indent=2)
+        with open(backup_file, 'wb') as f:
+            f.write(json_codec.dumpb(data, indent=2))
         
         # Reset to empty data structure
         empty_data = {
@@ -1540,19 +1830,25 @@ def import_meals():
         if not meals:
             return jsonify({'success': False, 'error': 'No meals provided'}), 400
         
-        data = load_data()
+        dates = [m['date'] for m in meals if m.get('date')]
         
-        # Add meals (avoid duplicates by checking timestamp)
-        existing_times = {(m['date'], m['time']) for m in data['meals']}
-        added = 0
+        def add_meals(data):
+            # Add meals (avoid duplicates by checking timestamp), archived months included
+            existing_times = {(m['date'], m['time']) for m in data['meals']}
+            if dates and data.get(ARCHIVE_KEY):
+                existing_times.update((m['date'], m['time']) for m in load_meals(min(dates), max(dates)))
+            totals = ensure_rollups(data)
+            added = 0
+            
+            for meal in meals:
+                key = (meal.get('date'), meal.get('time'))
+                if key not in existing_times:
+                    insert_ordered(data['meals'], meal)
+                    add_to_rollups(totals, meal, data[STREAK_KEY])
+                    added += 1
+            return added
         
-        for meal in meals:
-            key = (meal.get('date'), meal.get('time'))
-            if key not in existing_times:
-                data['meals'].append(meal)
-                added += 1
-        
-        save_data(data)
+        added = update_data(add_meals)
         
         return jsonify({
             'success': True,
@@ -1579,10 +1875,25 @@ def debug_versions():
         'openai_key_set': bool(os.getenv('OPENAI_API_KEY'))
     })
 
+@app.route('/api/debug/storage')
+def debug_storage():
+    """Debug endpoint for the storage engine and its document cache"""
+    return jsonify({
+        'backend': store.name,
+        'cache': store.cache_stats()
+    })
+
+@app.route('/api/debug/http')
+def debug_http():
+    """Debug endpoint for outbound API calls: attempts, retries and latency per upstream, and calls saved by the cache"""
+    from http_client import http
+    return jsonify({'calls': http.stats(), 'jobs': jobs.stats(), 'vision_cache': vision_cache.stats(),
+                    'streams': live.stats()})
+
 
 @app.route('/api/photo_log', methods=['POST'])
 def photo_log():
-    """Process meal photo and log meal (auto-save)."""
+    """Accept a meal photo and log it in the background (auto-save); see voice_log."""
     try:
         if 'photo' not in request.files:
             return jsonify({'success': False, 'error': 'No photo provided'}), 400
@@ -1592,32 +1903,44 @@ def photo_log():
         if not image_bytes:
             return jsonify({'success': False, 'error': 'Empty photo file'}), 400
 
-        from voice_fix import analyze_meal_photo_direct
-        api_key = os.getenv('OPENAI_API_KEY')
-
-        result_text = analyze_meal_photo_direct(image_bytes, api_key)
-        meal_data = json.loads(result_text)
-
+        uid = _current_uid()
+        _maybe_migrate_legacy(uid)
         now = datetime.now(ZoneInfo('America/Chicago'))
-        new_meal = {
-            'date': now.strftime('%Y-%m-%d'),
-            'time': now.strftime('%H:%M'),
-            'description': meal_data.get('food', 'Meal (photo)'),
-            'calories': int(meal_data.get('calories', 0)),
-            'protein': int(meal_data.get('protein', 0)),
-            'carbs': int(meal_data.get('carbs', 0)),
-            'fat': int(meal_data.get('fat', 0))
-        }
 
-        data = load_data()
-        data['meals'].append(new_meal)
-        save_data(data)
+        # A photo analyzed before (a retry, a saved picture) is logged at once, without a job or API call
+        from voice_fix import PHOTO_MODEL
+        meal_data = vision_cache.get(image_bytes, PHOTO_MODEL)
+        if meal_data is not None:
+            _append_meal(uid, _ai_meal(meal_data, meal_data.get('food', 'Meal (photo)'), now))
+            return jsonify({'success': True, 'meal': meal_data, 'cached': True})
 
-        return jsonify({'success': True, 'meal': meal_data})
+        return _submit_job(uid, 'photo_log', _photo_log_job, uid, image_bytes, os.getenv('OPENAI_API_KEY'), now)
 
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def _photo_log_job(uid, image_bytes, api_key, now):
+    """Estimate and save a photographed meal (runs on the job pool)"""
+    from voice_fix import PHOTO_MODEL, analyze_meal_photo_direct
+
+    result_text = analyze_meal_photo_direct(image_bytes, api_key)
+    meal_data = json.loads(result_text)
+
+    _append_meal(uid, _ai_meal(meal_data, meal_data.get('food', 'Meal (photo)'), now))
+    vision_cache.put(image_bytes, PHOTO_MODEL, meal_data)
+
+    return {'success': True, 'meal': meal_data}
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """Status of a voice_log / photo_log job: queued, running, done (with 'result') or failed (with 'error')"""
+    job = jobs.get(job_id)
+    if job is None or job['uid'] != _current_uid():
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+    response = jsonify(_job_payload(job))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=3000, debug=True)
 
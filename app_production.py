@@ -21,6 +21,8 @@ import logging
 from logging.handlers import RotatingFileHandler
 import traceback
 
+from meal_frame import as_number, cached_frame, file_stamp
+
 # Load environment variables
 load_dotenv()
 
@@ -383,28 +385,35 @@ def api_stats():
         if len(week_logs) > 1:
             weekly_change = week_logs[-1]['weight'] - week_logs[0]['weight']
         
-        # Today's macros
+        # Per-day macros for the last 30 days from the columnar food log
         today = datetime.now().strftime('%Y-%m-%d')
-        today_logs = [f for f in food_logs if f.get('date') == today]
-        today_calories = sum(f.get('calories', 0) for f in today_logs)
-        today_protein = sum(f.get('protein', 0) for f in today_logs)
-        today_carbs = sum(f.get('carbs', 0) for f in today_logs)
-        today_fat = sum(f.get('fat', 0) for f in today_logs)
+        path = get_user_data_file(current_user.id)
+        frame = cached_frame(('food_logs', path), file_stamp(path), food_logs)
+        daily = frame.daily((datetime.now() - timedelta(days=29)).strftime('%Y-%m-%d'), today)
+        
+        # Today's macros
+        today_calories = as_number(daily['calories'][-1])
+        today_protein = as_number(daily['protein'][-1])
+        today_carbs = as_number(daily['carbs'][-1])
+        today_fat = as_number(daily['fat'][-1])
+        
+        # First weight logged on each day
+        weight_by_date = {}
+        for w in weight_logs:
+            weight_by_date.setdefault(w.get('date'), w['weight'])
         
         # History (last 30 days)
         history = []
         for i in range(30):
             date = (datetime.now() - timedelta(days=29-i)).strftime('%Y-%m-%d')
-            day_logs = [f for f in food_logs if f.get('date') == date]
-            day_weight = next((w['weight'] for w in weight_logs if w.get('date') == date), None)
             
             history.append({
                 'date': date,
-                'calories': sum(f.get('calories', 0) for f in day_logs),
-                'protein': sum(f.get('protein', 0) for f in day_logs),
-                'carbs': sum(f.get('carbs', 0) for f in day_logs),
-                'fat': sum(f.get('fat', 0) for f in day_logs),
-                'weight': day_weight
+                'calories': as_number(daily['calories'][i]),
+                'protein': as_number(daily['protein'][i]),
+                'carbs': as_number(daily['carbs'][i]),
+                'fat': as_number(daily['fat'][i]),
+                'weight': weight_by_date.get(date)
             })
         
         return jsonify({
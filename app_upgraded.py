@@ -8,6 +8,8 @@ import subprocess
 import tempfile
 from werkzeug.utils import secure_filename
 
+from meal_frame import as_number, cached_frame, file_stamp
+
 app = Flask(__name__)
 CORS(app)
 
@@ -175,27 +177,31 @@ def weekly_trends():
     settings = data['settings']
     days = int(request.args.get('days', 7))  # Default 7 days, support 7/14/30
     
+    # Per-day sums from the columnar food log (one bincount per macro)
+    start = datetime.now() - timedelta(days=days-1)
+    frame = cached_frame(('food_logs', DATA_FILE), file_stamp(DATA_FILE), data['food_logs'])
+    daily = frame.daily(start.strftime('%Y-%m-%d'), datetime.now().strftime('%Y-%m-%d'))
+    
     trends = []
     for i in range(days):
-        date = (datetime.now() - timedelta(days=days-1-i)).strftime('%Y-%m-%d')
-        day_logs = [f for f in data['food_logs'] if f['date'] == date]
+        day = start + timedelta(days=i)
         
         trends.append({
-            'date': date,
-            'date_label': datetime.strptime(date, '%Y-%m-%d').strftime('%a %m/%d'),
-            'calories': sum(f.get('calories', 0) for f in day_logs),
-            'protein': sum(f.get('protein', 0) for f in day_logs),
-            'carbs': sum(f.get('carbs', 0) for f in day_logs),
-            'fat': sum(f.get('fat', 0) for f in day_logs),
-            'meal_count': len(day_logs)
+            'date': day.strftime('%Y-%m-%d'),
+            'date_label': day.strftime('%a %m/%d'),
+            'calories': as_number(daily['calories'][i]),
+            'protein': as_number(daily['protein'][i]),
+            'carbs': as_number(daily['carbs'][i]),
+            'fat': as_number(daily['fat'][i]),
+            'meal_count': int(daily['meal_count'][i])
         })
     
     # Calculate averages
-    avg_calories = sum(t['calories'] for t in trends) / len(trends) if trends else 0
-    avg_protein = sum(t['protein'] for t in trends) / len(trends) if trends else 0
+    avg_calories = daily['calories'].mean() if trends else 0
+    avg_protein = daily['protein'].mean() if trends else 0
     
     # Calculate consistency (days hitting protein goal)
-    days_hit_protein = sum(1 for t in trends if t['protein'] >= settings['daily_protein'])
+    days_hit_protein = int((daily['protein'] >= settings['daily_protein']).sum())
     consistency = round((days_hit_protein / len(trends)) * 100) if trends else 0
     
     return jsonify({
@@ -429,36 +435,38 @@ def get_progress():
     meals = data.get('meals', [])
     food_logs = data.get('food_logs', [])
     
-    # Combine food_logs and meals into unified structure
-    all_foods = []
-    for log in food_logs:
-        all_foods.append({
-            'date': log.get('date'),
-            'time': datetime.fromtimestamp(log.get('timestamp', 0)).strftime('%H:%M') if log.get('timestamp') else '?:??',
-            'food': log.get('description'),
-            'calories': log.get('calories', 0),
-            'protein': log.get('protein', 0),
-            'carbs': log.get('carbs', 0),
-            'fat': log.get('fat', 0)
-        })
-    
-    for meal in meals:
-        all_foods.append({
-            'date': meal.get('date'),
-            'time': meal.get('time', '?:??'),
-            'food': meal.get('food'),
-            'calories': meal.get('calories', 0),
-            'protein': meal.get('protein', 0),
-            'carbs': meal.get('carbs', 0),
-            'fat': meal.get('fat', 0)
-        })
-    
-    # Sort by date and time
-    all_foods.sort(key=lambda x: (x['date'], x['time']))
+    def all_foods():
+        """food_logs and meals in one structure - only built when the cached frame is stale"""
+        foods = []
+        for log in food_logs:
+            foods.append({
+                'date': log.get('date'),
+                'time': datetime.fromtimestamp(log.get('timestamp', 0)).strftime('%H:%M') if log.get('timestamp') else '?:??',
+                'food': log.get('description'),
+                'calories': log.get('calories', 0),
+                'protein': log.get('protein', 0),
+                'carbs': log.get('carbs', 0),
+                'fat': log.get('fat', 0)
+            })
+        
+        for meal in meals:
+            foods.append({
+                'date': meal.get('date'),
+                'time': meal.get('time', '?:??'),
+                'food': meal.get('food'),
+                'calories': meal.get('calories', 0),
+                'protein': meal.get('protein', 0),
+                'carbs': meal.get('carbs', 0),
+                'fat': meal.get('fat', 0)
+            })
+        return foods
     
     # Calculate week totals (last 7 days)
     today = datetime.now()
     week_start = today - timedelta(days=6)
+    week_dates = [(week_start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(7)]
+    frame = cached_frame(('all_foods', DATA_FILE), file_stamp(DATA_FILE), all_foods)
+    daily = frame.daily(week_dates[0], week_dates[-1])
     
     week_totals = {
         'total_calories': 0,
@@ -471,24 +479,22 @@ def get_progress():
         'daily_fat': settings.get('daily_fat', 70)
     }
     
-    # Group meals by date
+    # Group this week's meals by date, straight from the frame's (date, time) ordered rows
     meal_log = {}
     daily_breakdown = []
     
-    for i in range(7):
-        date = (week_start + timedelta(days=i)).strftime('%Y-%m-%d')
-        date_meals = [f for f in all_foods if f['date'] == date]
-        
-        if date_meals:
-            meal_log[date] = date_meals
-            
+    for f in frame.rows(week_dates[0], week_dates[-1]):
+        meal_log.setdefault(f['date'], []).append(f)
+    
+    for i, date in enumerate(week_dates):
+        if daily['meal_count'][i]:
             day_total = {
                 'day': (datetime.strptime(date, '%Y-%m-%d')).strftime('%a'),
                 'date': date,
-                'calories': sum(f['calories'] for f in date_meals),
-                'protein': sum(f['protein'] for f in date_meals),
-                'carbs': sum(f['carbs'] for f in date_meals),
-                'fat': sum(f['fat'] for f in date_meals)
+                'calories': as_number(daily['calories'][i]),
+                'protein': as_number(daily['protein'][i]),
+                'carbs': as_number(daily['carbs'][i]),
+                'fat': as_number(daily['fat'][i])
             }
             
             daily_breakdown.append(day_total)
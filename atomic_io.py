@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Crash-safe JSON file writes for Lean
+Write to a temp file in the same directory, then rename it into place, so
+readers (including the other gunicorn worker) never see a truncated file.
+
+Durability (LEAN_FSYNC):
+    always - fsync every write before it is renamed into place
+    batch  - group commit: writes to the same file arriving within
+             LEAN_GROUP_COMMIT_MS are coalesced into one write + fsync
+             (user documents are coalesced per user by user_storage,
+             through the same GroupCommit, before the user's lock is taken)
+    none   - rename only, leave flushing to the OS
+
+Documents are serialized by json_codec (compact unless LEAN_JSON_INDENT=2).
+User documents are written through write_document_atomic(), which stores
+large ones compressed (compressed_io.py).
+"""
+
+import os
+import threading
+import time
+
+import compressed_io
+import json_codec
+
+FSYNC_MODE = os.getenv('LEAN_FSYNC', 'batch')
+GROUP_COMMIT_MS = float(os.getenv('LEAN_GROUP_COMMIT_MS', 5))
+
+FSYNC_MODES = ('always', 'batch', 'none')
+
+
+def _fsync_dir(path):
+    """Persist the rename itself (directory entry)"""
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def ensure_dir(path, fsync=True):
+    """Create directory path and any missing parents; with fsync, persist their entries too"""
+    missing = []
+    while path and not os.path.isdir(path):
+        missing.append(path)
+        path = os.path.dirname(path)
+    for directory in reversed(missing):
+        try:
+            os.mkdir(directory)
+        except FileExistsError:
+            pass  # created concurrently by another worker
+        if fsync:
+            _fsync_dir(directory)
+
+
+def write_file_atomic(path, text, fsync=True):
+    """Replace path with text (str or bytes) via temp file + rename"""
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp, 'wb' if isinstance(text, bytes) else 'w') as f:
+            f.write(text)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    if fsync:
+        _fsync_dir(path)
+
+
+def write_document_atomic(path, text, fsync=True, compression=compressed_io.COMPRESSION,
+                          min_bytes=compressed_io.COMPRESS_MIN_BYTES):
+    """
+    Replace the document at path with text, as path itself or - above
+    min_bytes - as a compressed path.zst / path.gz, then drop the other
+    variants. Read it back with compressed_io.read_document(path).
+    text may be a list of byte blocks (compressed_io.encode_blocks()).
+    Returns (variant path written, block extents or None).
+    """
+    if isinstance(text, list):
+        target, payload, extents = compressed_io.encode_blocks(path, text, compression, min_bytes)
+    else:
+        target, payload = compressed_io.encode(path, text, compression, min_bytes)
+        extents = None
+    write_file_atomic(target, payload, fsync)
+    compressed_io.remove_variants(path, keep=target)
+    return target, extents
+
+
+class _Batch:
+    def __init__(self):
+        self.changes = []
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class GroupCommit:
+    """
+    Coalesces concurrent changes to the same key into one commit.
+    The first caller becomes the leader: it waits window_ms - holding no
+    lock of the caller's, so others can join - then calls commit(changes)
+    once with every change queued by then, in arrival order. commit returns
+    one result per change; a result that is an Exception is raised to that
+    change's caller alone, while commit raising fails every caller.
+    """
+
+    def __init__(self, window_ms=GROUP_COMMIT_MS):
+        self.window = window_ms / 1000.0
+        self._lock = threading.Lock()
+        self._pending = {}  # key -> _Batch
+        self.commits = 0
+        self.writes = 0
+
+    def submit(self, key, change, commit):
+        """This change's result, once the commit holding it is done"""
+        with self._lock:
+            self.writes += 1
+            batch = self._pending.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._pending[key] = _Batch()
+            position = len(batch.changes)
+            batch.changes.append(change)
+
+        if leader:
+            time.sleep(self.window)
+            with self._lock:
+                del self._pending[key]
+            try:
+                batch.results = commit(batch.changes)
+                with self._lock:
+                    self.commits += 1
+            except Exception as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        result = batch.results[position]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {'writes': self.writes, 'commits': self.commits}
+
+
+class GroupCommitWriter(GroupCommit):
+    """
+    Coalesces full-document writes to the same path: the leader serializes
+    and fsyncs the newest document once. Later documents replace earlier
+    ones, which is correct because every write is a complete snapshot of
+    the file.
+    """
+
+    def write(self, path, data, dump, write=write_file_atomic):
+        def commit(changes):
+            data, dump, write = changes[-1]
+            write(path, dump(data), fsync=True)
+            return [None] * len(changes)
+
+        self.submit(path, (data, dump, write), commit)
+
+
+_group_commit = GroupCommitWriter()
+
+
+def commit_document(path, data, dump, write, durability=None):
+    """
+    Persist data at path as write(path, dump(data), fsync) under the given
+    durability (default LEAN_FSYNC) - group-committed in batch mode
+    """
+    mode = durability or FSYNC_MODE
+    if mode not in FSYNC_MODES:
+        raise ValueError(f'Unknown LEAN_FSYNC mode: {mode}')
+    if mode == 'batch':
+        _group_commit.write(path, data, dump, write)
+    else:
+        write(path, dump(data), fsync=(mode == 'always'))
+
+
+def atomic_write_json(path, data, indent=json_codec.JSON_INDENT, durability=None, compression=None,
+                      compress_min_bytes=compressed_io.COMPRESS_MIN_BYTES):
+    """
+    Atomically replace path with data serialized as JSON. With a compression
+    setting (see compressed_io) path is a user document that may be stored
+    compressed; None writes exactly path.
+    """
+    def dump(doc):
+        return json_codec.dumpb(doc, indent=indent)
+
+    def write(target, text, fsync):
+        if compression is None:
+            write_file_atomic(target, text, fsync)
+        else:
+            write_document_atomic(target, text, fsync, compression, compress_min_bytes)
+
+    commit_document(path, data, dump, write, durability)
+
+
+def group_commit(key, change, commit):
+    """GroupCommit.submit() on the process-wide group commit (LEAN_GROUP_COMMIT_MS window)"""
+    return _group_commit.submit(key, change, commit)
+
+
+def group_commit_stats():
+    """Logical writes and physical commits of every group-committed write in this process"""
+    return _group_commit.stats()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Storage Micro-Benchmarks for Lean
+Times hot paths of the storage layer as history grows, so regressions show
+up as numbers rather than as a slow dashboard. `memory` reports what a
+cached user's meals cost as parsed dicts vs compact records (records.py);
+`json` compares the json_codec backend with the stdlib; `compress` times
+document writes and reads per on-disk format (compressed_io.py); `layout`
+times user creation and lookup with every user in one flat directory vs
+hashed shards; `sections` compares a cold whole-document load with the
+partial reads /api/today makes (doc_sections.py); `tiers` times document
+loads and meal appends with old months archived vs all meals in the
+document (meal_archive.py).
+
+Usage:
+    python benchmarks.py insert [--sizes 100,1000,10000,100000] [--repeat 200]
+    python benchmarks.py aggregate [--years 1,3,10] [--repeat 50]
+    python benchmarks.py frame [--sizes 1000,10000,100000] [--repeat 20]
+    python benchmarks.py memory [--meals 50000]
+    python benchmarks.py json [--meals 1000,10000,50000] [--repeat 5]
+    python benchmarks.py compress [--meals 1000,10000,50000] [--repeat 5]
+    python benchmarks.py layout [--users 1000000] [--repeat 2000]
+    python benchmarks.py sections [--meals 1000,10000,50000] [--repeat 20]
+    python benchmarks.py tiers [--years 1,3,10] [--repeat 20]
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import compressed_io
+import json_codec
+from atomic_io import write_document_atomic
+from daily_rollups import build_rollups
+from meal_frame import MACROS, MealFrame
+from records import Meal
+from range_aggregates import AggregateIndex, aggregate
+from user_storage import CachedUserStore, JSONUserStore, JournalUserStore, _sort_key, insert_ordered
+
+DEFAULT_SIZES = (100, 1_000, 10_000, 100_000)
+
+
+def _history(n, seed=1):
+    """n meals spread a few per day, ending yesterday, in (date, time) order"""
+    rng = random.Random(seed)
+    first = date.today() - timedelta(days=n // 4 + 1)
+    meals = [{
+        'date': (first + timedelta(days=i // 4)).isoformat(),
+        'time': f'{7 + (i % 4) * 4:02d}:{rng.randrange(60):02d}',
+        'description': 'Benchmark meal',
+        'calories': rng.randrange(100, 900),
+        'protein': rng.randrange(5, 60),
+        'carbs': rng.randrange(5, 80),
+        'fat': rng.randrange(2, 40),
+    } for i in range(n)]
+    meals.sort(key=_sort_key)
+    return meals
+
+
+def _todays_meal(i):
+    return {'date': date.today().isoformat(), 'time': f'{8 + i % 12:02d}:{i % 60:02d}',
+            'description': 'Benchmark meal', 'calories': 500, 'protein': 30, 'carbs': 40, 'fat': 15}
+
+
+def _per_call_us(fn, repeat):
+    start = time.perf_counter()
+    for i in range(repeat):
+        fn(i)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def bench_insert(sizes, repeat):
+    """Ordering step of a meal log: full re-sort vs ordered insert, then an end-to-end cached append"""
+    print(f"{'meals':>8}  {'re-sort':>12}  {'ordered insert':>15}  {'cached journal append':>22}")
+    for n in sizes:
+        history = _history(n)
+
+        meals = list(history)
+        def resort(i):
+            meals.append(_todays_meal(i))
+            meals.sort(key=_sort_key)
+        resort_us = _per_call_us(resort, repeat)
+
+        meals = list(history)
+        insert_us = _per_call_us(lambda i: insert_ordered(meals, _todays_meal(i)), repeat)
+
+        store = CachedUserStore(JournalUserStore(tempfile.mkdtemp()))
+        store.save('bench', {'meals': history, 'settings': {}})
+        store.load('bench')  # warm the document cache
+        append_us = _per_call_us(lambda i: store.append_meal('bench', _todays_meal(i)), repeat)
+
+        print(f"{n:>8}  {resort_us:>10.1f}us  {insert_us:>13.1f}us  {append_us:>20.1f}us")
+
+
+def bench_aggregate(years, repeat):
+    """Whole-history month view: Fenwick range sums vs summing every day in each bucket"""
+    print(f"{'years':>6}  {'days':>6}  {'months by day sums':>19}  {'months by index':>16}")
+    for n in years:
+        totals = build_rollups(_history(n * 365 * 4))
+        start, end = min(totals), max(totals)
+        index = AggregateIndex(totals)
+        scan_us = _per_call_us(lambda i: aggregate(totals, start, end, 'month'), repeat)
+        index_us = _per_call_us(lambda i: aggregate(totals, start, end, 'month', index), repeat)
+        print(f"{n:>6}  {len(totals):>6}  {scan_us:>17.1f}us  {index_us:>14.1f}us")
+
+
+def bench_frame(sizes, repeat):
+    """30-day macro history from a raw log: per-day sum() loops vs MealFrame bincounts"""
+    print(f"{'meals':>8}  {'per-day loops':>14}  {'frame build':>12}  {'frame query':>12}")
+    for n in sizes:
+        meals = _history(n)
+        days = [(date.today() - timedelta(days=29 - i)).isoformat() for i in range(30)]
+
+        def loops(i):
+            for day in days:
+                day_logs = [m for m in meals if m.get('date') == day]
+                [sum(m.get(k, 0) for m in day_logs) for k in MACROS]
+        loop_us = _per_call_us(loops, repeat)
+
+        build_us = _per_call_us(lambda i: MealFrame(meals), max(repeat // 10, 1))
+        frame = MealFrame(meals)
+        query_us = _per_call_us(lambda i: frame.daily(days[0], days[-1]), repeat)
+        print(f"{n:>8}  {loop_us:>12.1f}us  {build_us:>10.1f}us  {query_us:>10.1f}us")
+
+
+def _traced_bytes(build):
+    """Bytes still allocated by what build() returns (it gets the parsed meals and may drop them)"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        value = build()
+        gc.collect()
+        return value, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_memory(n):
+    """Resident bytes per meal for one cached user: parsed JSON dicts vs slotted records"""
+    meals = _history(n)
+    for i, meal in enumerate(meals):
+        meal['id'] = f'm{i:012x}'
+    text = json.dumps({'meals': meals})
+    del meals
+
+    parsed, dict_bytes = _traced_bytes(lambda: json.loads(text)['meals'])
+    del parsed
+    records, record_bytes = _traced_bytes(lambda: [Meal.from_dict(m) for m in json.loads(text)['meals']])
+
+    start = time.perf_counter()
+    [m.to_dict() for m in records]
+    expand_ms = (time.perf_counter() - start) * 1e3
+    print(f"{'meals':>8}  {'dicts':>14}  {'records':>14}  {'saved':>6}  {'expand all':>11}")
+    print(f"{n:>8}  {dict_bytes / n:>7.0f} B/meal  {record_bytes / n:>7.0f} B/meal  "
+          f"{1 - record_bytes / dict_bytes:>6.0%}  {expand_ms:>9.1f}ms")
+
+
+def bench_json(sizes, repeat):
+    """Whole-document encode/decode: stdlib as the storage used it (indent=2) vs json_codec"""
+    print(f"codec: {json_codec.CODEC}")
+    print(f"{'meals':>8}  {'size':>12}  {'stdlib dump':>12}  {'codec dump':>11}  "
+          f"{'stdlib load':>12}  {'codec load':>11}  {'jsonify-style':>14}")
+    for n in sizes:
+        doc = {'meals': _history(n), 'settings': {}}
+        pretty, compact = json.dumps(doc, indent=2), json_codec.dumpb(doc)
+        size = f'{len(pretty) // 1024}k->{len(compact) // 1024}k'
+        stdlib_dump = _per_call_us(lambda i: json.dumps(doc, indent=2), repeat) / 1e3
+        codec_dump = _per_call_us(lambda i: json_codec.dumpb(doc), repeat) / 1e3
+        stdlib_load = _per_call_us(lambda i: json.loads(pretty), repeat) / 1e3
+        codec_load = _per_call_us(lambda i: json_codec.loads(compact), repeat) / 1e3
+        # Flask's default response: sorted keys; stdlib time / codec time
+        response = (_per_call_us(lambda i: json.dumps(doc, sort_keys=True), repeat) /
+                    _per_call_us(lambda i: json_codec.dumpb(doc, sort_keys=True), repeat))
+        mb = len(pretty) / 1e6
+        print(f"{n:>8}  {size:>12}  {stdlib_dump:>6.1f}ms {mb / stdlib_dump * 1e3:>4.0f}MB/s"
+              f"  {codec_dump:>5.1f}ms {mb / codec_dump * 1e3:>4.0f}MB/s"
+              f"  {stdlib_load:>6.1f}ms {mb / stdlib_load * 1e3:>4.0f}MB/s"
+              f"  {codec_load:>5.1f}ms {mb / codec_load * 1e3:>4.0f}MB/s  {response:>12.1f}x")
+
+
+def bench_compress(sizes, repeat):
+    """Document write (serialize + compress + rename) and read (read + decompress + parse) per format"""
+    formats = ['none', 'gzip'] + (['zstd'] if compressed_io.zstandard is not None else [])
+    print(f"{'meals':>8}  {'format':>6}  {'on disk':>9}  {'write':>9}  {'read':>9}")
+    for n in sizes:
+        doc = {'meals': _history(n), 'settings': {}}
+        for fmt in formats:
+            path = f'{tempfile.mkdtemp()}/bench.json'
+            write_ms = _per_call_us(lambda i: write_document_atomic(path, json_codec.dumpb(doc), False, fmt, 0),
+                                    repeat) / 1e3
+            read_ms = _per_call_us(lambda i: json_codec.loads(compressed_io.read_document(path)), repeat) / 1e3
+            on_disk = compressed_io.resolve(path)[1].st_size
+            print(f"{n:>8}  {fmt:>6}  {on_disk // 1024:>7}k  {write_ms:>7.1f}ms  {read_ms:>7.1f}ms")
+
+
+def bench_layout(users, repeat):
+    """
+    Directory-size cost with `users` documents in place: save a new user
+    (lock file + temp file + rename into the directory), load an existing
+    one, and check a uid that doesn't exist (a first-time visitor)
+    """
+    print(f"{'layout':>8}  {'users':>9}  {'populate':>9}  {'create':>9}  {'lookup':>9}  {'miss':>9}")
+    doc = json_codec.dumpb({'meals': [], 'settings': {}, '_version': 1})
+    rng = random.Random(3)
+    for layout in ('flat', 'sharded'):
+        store = JSONUserStore(tempfile.mkdtemp(), compression='none', layout=layout)
+        made = set()
+        start = time.perf_counter()
+        for i in range(users):
+            path = store.path(f'user-{i}')
+            directory = os.path.dirname(path)
+            if directory not in made:
+                os.makedirs(directory, exist_ok=True)
+                made.add(directory)
+            with open(path, 'wb') as f:
+                f.write(doc)
+        populate_s = time.perf_counter() - start
+
+        create_us = _per_call_us(lambda i: store.save(f'new-{i}', {'meals': [], 'settings': {}}), repeat)
+        lookup_us = _per_call_us(lambda i: store.load(f'user-{rng.randrange(users)}'), repeat)
+        miss_us = _per_call_us(lambda i: store.exists(f'visitor-{i}'), repeat)
+        print(f"{layout:>8}  {users:>9}  {populate_s:>8.1f}s  {create_us:>7.1f}us  {lookup_us:>7.1f}us  {miss_us:>7.1f}us")
+
+
+def bench_sections(sizes, repeat):
+    """Cold reads (nothing cached): the whole document vs today's meals, the settings and the last weight"""
+    formats = ['none'] + (['zstd'] if compressed_io.zstandard is not None else ['gzip'])
+    today = date.today().isoformat()
+    print(f"{'meals':>8}  {'format':>6}  {'full load':>10}  {'today':>9}  {'settings':>9}  {'weight':>9}")
+    for n in sizes:
+        weights = [{'date': m['date'], 'time': '07:00', 'weight': 180} for m in _history(n)[::4]]
+        doc = {'meals': _history(n) + [_todays_meal(i) for i in range(3)], 'weight_history': weights,
+               'settings': {'daily_calorie_goal': 2000}}
+        for fmt in formats:
+            store = JSONUserStore(tempfile.mkdtemp(), compression=fmt, compress_min_bytes=0)
+            store.save('u1', doc)
+            full_ms = _per_call_us(lambda i: store.load('u1'), repeat) / 1e3
+            today_ms = _per_call_us(lambda i: store.meals_between('u1', today, today), repeat) / 1e3
+            settings_ms = _per_call_us(lambda i: store.settings('u1'), repeat) / 1e3
+            weight_ms = _per_call_us(lambda i: store.latest_weights('u1', 1), repeat) / 1e3
+            print(f"{n:>8}  {fmt:>6}  {full_ms:>8.2f}ms  {today_ms:>7.2f}ms  {settings_ms:>7.2f}ms  {weight_ms:>7.2f}ms")
+
+
+def bench_tiers(years, repeat):
+    """Uncached document load and full read-modify-write append, all meals in the document vs 90-day hot tier"""
+    print(f"{'years':>6}  {'archive':>8}  {'document':>9}  {'load':>9}  {'append':>9}  {'all meals':>10}")
+    for y in years:
+        meals = _history(y * 365 * 4)
+        for after_days in (0, 90):
+            store = JSONUserStore(tempfile.mkdtemp(), archive_after_days=after_days)
+            store.save('u1', {'meals': [dict(m) for m in meals], 'settings': {}})
+            load_ms = _per_call_us(lambda i: store.load('u1'), repeat) / 1e3
+            append_ms = _per_call_us(lambda i: store.append_meal('u1', _todays_meal(i)), repeat) / 1e3
+            all_ms = _per_call_us(lambda i: store.meals_between('u1'), repeat) / 1e3
+            size = store.size_hint('u1')
+            label = f'{after_days}d' if after_days else 'off'
+            print(f"{y:>6}  {label:>8}  {size // 1024:>7}k  {load_ms:>7.2f}ms  {append_ms:>7.2f}ms  {all_ms:>8.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lean storage micro-benchmarks')
+    sub = parser.add_subparsers(dest='command', required=True)
+    insert = sub.add_parser('insert', help='meal log ordering cost as history grows')
+    insert.add_argument('--sizes', default=','.join(str(n) for n in DEFAULT_SIZES),
+                        help='comma-separated history sizes')
+    insert.add_argument('--repeat', type=int, default=200, help='appends timed per size')
+    agg = sub.add_parser('aggregate', help='month view over the whole history')
+    agg.add_argument('--years', default='1,3,10', help='comma-separated history lengths in years')
+    agg.add_argument('--repeat', type=int, default=50, help='queries timed per size')
+    frame = sub.add_parser('frame', help='raw-log daily macro history')
+    frame.add_argument('--sizes', default='1000,10000,100000', help='comma-separated log sizes')
+    frame.add_argument('--repeat', type=int, default=20, help='queries timed per size')
+    memory = sub.add_parser('memory', help='cached meal footprint, dicts vs compact records')
+    memory.add_argument('--meals', type=int, default=50_000, help='meals in the user document')
+    codec = sub.add_parser('json', help='document encode/decode, json_codec vs stdlib')
+    codec.add_argument('--meals', default='1000,10000,50000', help='comma-separated document sizes')
+    codec.add_argument('--repeat', type=int, default=5, help='round trips timed per size')
+    compress = sub.add_parser('compress', help='document write/read latency per on-disk format')
+    compress.add_argument('--meals', default='1000,10000,50000', help='comma-separated document sizes')
+    compress.add_argument('--repeat', type=int, default=5, help='writes and reads timed per size')
+    layout = sub.add_parser('layout', help='user create/lookup latency, flat directory vs hashed shards')
+    layout.add_argument('--users', type=int, default=1_000_000, help='documents on disk before timing')
+    layout.add_argument('--repeat', type=int, default=2000, help='operations timed per kind')
+    sections = sub.add_parser('sections', help='cold whole-document load vs partial section reads')
+    sections.add_argument('--meals', default='1000,10000,50000', help='comma-separated history sizes')
+    sections.add_argument('--repeat', type=int, default=20, help='reads timed per kind')
+    tiers = sub.add_parser('tiers', help='document load/append latency with old months archived')
+    tiers.add_argument('--years', default='1,3,10', help='comma-separated history lengths in years')
+    tiers.add_argument('--repeat', type=int, default=20, help='operations timed per kind')
+    args = parser.parse_args()
+
+    if args.command == 'insert':
+        bench_insert([int(n) for n in args.sizes.split(',')], args.repeat)
+    elif args.command == 'aggregate':
+        bench_aggregate([int(n) for n in args.years.split(',')], args.repeat)
+    elif args.command == 'frame':
+        bench_frame([int(n) for n in args.sizes.split(',')], args.repeat)
+    elif args.command == 'memory':
+        bench_memory(args.meals)
+    elif args.command == 'json':
+        bench_json([int(n) for n in args.meals.split(',')], args.repeat)
+    elif args.command == 'compress':
+        bench_compress([int(n) for n in args.meals.split(',')], args.repeat)
+    elif args.command == 'layout':
+        bench_layout(args.users, args.repeat)
+    elif args.command == 'sections':
+        bench_sections([int(n) for n in args.meals.split(',')], args.repeat)
+    elif args.command == 'tiers':
+        bench_tiers([int(n) for n in args.years.split(',')], args.repeat)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Compressed Document Files for Lean
+Large user documents are stored as <uid>.json.zst or <uid>.json.gz instead
+of <uid>.json, cutting disk footprint and page-cache pressure (embedded
+base64 progress photos and long meal histories compress 5-10x). Documents
+below the threshold stay plain JSON, easy to inspect.
+
+Settings:
+    LEAN_COMPRESSION         auto  - zstd if the zstandard package is installed, else gzip (default)
+                             zstd / gzip - force one (zstd falls back to gzip if not installed)
+                             none  - write plain JSON (existing compressed files still read)
+    LEAN_COMPRESS_MIN_BYTES  serialized size from which a document is compressed (default 256 KiB)
+
+Readers go through resolve() / read_document(), which pick the newest
+existing variant of a path, so a document changing format - or both
+variants left behind by a crash between writing one and removing the
+other - is transparent. atomic_io.write_document_atomic() does the writes.
+
+Existing files are converted by `python user_storage.py recompress`.
+"""
+
+import gzip
+import os
+
+COMPRESSION = os.getenv('LEAN_COMPRESSION', 'auto')
+COMPRESS_MIN_BYTES = int(os.getenv('LEAN_COMPRESS_MIN_BYTES', 256 * 1024))
+GZIP_LEVEL = 1  # fastest; large documents still shrink ~7x
+ZSTD_LEVEL = 3
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIONS = ('auto', 'zstd', 'gzip', 'none')
+SUFFIXES = {'zstd': '.zst', 'gzip': '.gz'}
+
+
+def codec_for(compression, nbytes, min_bytes=COMPRESS_MIN_BYTES):
+    """'zstd', 'gzip' or None (plain) for a serialized document of nbytes"""
+    if compression not in COMPRESSIONS:
+        raise ValueError(f'Unknown LEAN_COMPRESSION: {compression}')
+    if compression == 'none' or nbytes < min_bytes:
+        return None
+    if compression in ('auto', 'zstd') and zstandard is not None:
+        return 'zstd'
+    return 'gzip'
+
+
+def _compressor(codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress
+    return lambda data: gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress(data, codec):
+    return _compressor(codec)(data)
+
+
+def _zstd_decompress(data):
+    """Every concatenated zstd frame in data"""
+    out = []
+    while data:
+        frame = zstandard.ZstdDecompressor().decompressobj()
+        out.append(frame.decompress(data))
+        data = frame.unused_data
+    return b''.join(out)
+
+
+def decompress(data, path):
+    """
+    Contents of the variant at path (chosen by its suffix) as bytes. data may
+    be several concatenated gzip members / zstd frames, as encode_blocks() writes.
+    """
+    if path.endswith(SUFFIXES['gzip']):
+        return gzip.decompress(data)
+    if path.endswith(SUFFIXES['zstd']):
+        if zstandard is None:
+            raise OSError(f'{path}: zstd-compressed but the zstandard package is not installed')
+        return _zstd_decompress(data)
+    return data
+
+
+def encode(path, text, compression=COMPRESSION, min_bytes=COMPRESS_MIN_BYTES):
+    """(variant path, bytes to write) for a serialized document destined for path"""
+    if isinstance(text, str):
+        text = text.encode('utf-8')
+    codec = codec_for(compression, len(text), min_bytes)
+    if codec is None:
+        return path, text
+    return path + SUFFIXES[codec], compress(text, codec)
+
+
+def encode_blocks(path, blocks, compression=COMPRESSION, min_bytes=COMPRESS_MIN_BYTES):
+    """
+    encode() for a document given as consecutive byte blocks: (variant path,
+    bytes to write, [(offset, length)] of each block within them). Compressed,
+    every block is its own gzip member / zstd frame, so a block can be read
+    back on its own while the whole file still decompresses to the document.
+    """
+    codec = codec_for(compression, sum(len(b) for b in blocks), min_bytes)
+    if codec is not None:
+        squeeze = _compressor(codec)
+        blocks = [squeeze(b) for b in blocks]
+        path += SUFFIXES[codec]
+    extents, offset = [], 0
+    for block in blocks:
+        extents.append((offset, len(block)))
+        offset += len(block)
+    return path, b''.join(blocks), extents
+
+
+def base_path(variant):
+    """The <uid>.json a variant path belongs to"""
+    for suffix in SUFFIXES.values():
+        if variant.endswith(suffix):
+            return variant[:-len(suffix)]
+    return variant
+
+
+def variants(path):
+    return [path] + [path + suffix for suffix in SUFFIXES.values()]
+
+
+def resolve(path):
+    """(variant path, os.stat_result) of the newest existing variant of path, or (path, None)"""
+    found = (path, None)
+    for candidate in variants(path):
+        try:
+            st = os.stat(candidate)
+        except FileNotFoundError:
+            continue
+        if found[1] is None or st.st_mtime_ns > found[1].st_mtime_ns:
+            found = (candidate, st)
+    return found
+
+
+def remove_variants(path, keep):
+    """Drop every variant of path except keep (after keep was renamed into place)"""
+    for candidate in variants(path):
+        if candidate != keep:
+            try:
+                os.remove(candidate)
+            except FileNotFoundError:
+                pass
+
+
+def read_document(path):
+    """Decompressed bytes of the newest variant of path (FileNotFoundError if there is none)"""
+    actual, _ = resolve(path)
+    with open(actual, 'rb') as f:
+        return decompress(f.read(), actual)
+
+
+def decoded_size(path, st):
+    """Uncompressed size of the variant at path - what the parsed document is sized by"""
+    try:
+        if path.endswith(SUFFIXES['gzip']):
+            with open(path, 'rb') as f:
+                f.seek(-4, os.SEEK_END)
+                return int.from_bytes(f.read(4), 'little')  # ISIZE trailer (mod 2**32)
+        if path.endswith(SUFFIXES['zstd']) and zstandard is not None:
+            with open(path, 'rb') as f:
+                size = zstandard.frame_content_size(f.read(18))
+            if size > 0:
+                return size
+    except OSError:
+        pass
+    return st.st_size
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Shared pytest setup for Lean's tests
+
+user_storage, app_pro and vision_cache read their LEAN_* paths once, at import.
+Pointing those paths at one session temp root here, before any test module is
+collected, keeps every test off the real data/ tree whatever the collection order,
+and the root is removed when the session ends.
+"""
+
+import os
+import shutil
+import tempfile
+
+import pytest
+
+TEST_ROOT = tempfile.mkdtemp(prefix='lean-tests-')
+
+os.environ['LEAN_USER_DATA_DIR'] = os.path.join(TEST_ROOT, 'users')
+os.environ['LEAN_USER_DB'] = os.path.join(TEST_ROOT, 'lean.db')
+os.environ['LEAN_VISION_CACHE'] = os.path.join(TEST_ROOT, 'vision_cache.db')
+os.environ.setdefault('LEAN_FSYNC', 'none')
+
+
+@pytest.fixture(scope='session')
+def lean_test_root():
+    """The session's temp root, for tests that want a path under it"""
+    return TEST_ROOT
+
+
+def pytest_sessionfinish(session, exitstatus):
+    # Here rather than in fixture teardown so an interrupted collection cleans up too
+    shutil.rmtree(TEST_ROOT, ignore_errors=True)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Daily Rollups for Lean
+Per-day macro totals kept in the user document under 'daily_totals':
+
+    {'2026-02-01': {'calories': 1850, 'protein': 160, 'carbs': 170, 'fat': 60, 'meal_count': 4}, ...}
+
+The storage engines update it on every meal append/delete, so trend
+endpoints read O(days) totals instead of re-summing raw meals. The logging
+streak state (streaks.py) follows the days that appear and disappear here.
+Rebuild from scratch with: python user_storage.py rebuild-rollups
+"""
+
+from datetime import date, timedelta
+
+from meal_archive import ARCHIVE_KEY, archived_meal_count
+from streaks import STREAK_KEY, day_added, day_removed, ensure_streak
+
+ROLLUP_KEY = 'daily_totals'
+METRICS = ('calories', 'protein', 'carbs', 'fat')
+
+
+def empty_day():
+    return {'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0, 'meal_count': 0}
+
+
+def add_meal(totals, meal, streak=None, sign=1):
+    """
+    Fold one meal into totals (sign=-1 takes it back out); day dicts are
+    replaced, never mutated. Pass the document's streak state to keep it in step.
+    """
+    day = meal.get('date') or ''
+    current = totals.get(day) or empty_day()
+    updated = {k: current[k] + sign * (meal.get(k) or 0) for k in METRICS}
+    updated['meal_count'] = current['meal_count'] + sign
+    if updated['meal_count'] > 0:
+        totals[day] = updated
+        if streak is not None and current['meal_count'] <= 0:
+            day_added(streak, totals, day)
+    elif totals.pop(day, None) is not None and streak is not None:
+        day_removed(streak, totals, day)
+
+
+def remove_meal(totals, meal, streak=None):
+    add_meal(totals, meal, streak, sign=-1)
+
+
+def build_rollups(meals):
+    totals = {}
+    for meal in meals:
+        add_meal(totals, meal)
+    return totals
+
+
+def ensure_rollups(data):
+    """
+    Return data's rollup table, rebuilding it when it is missing (documents
+    written before rollups existed) or its meal count disagrees with the meals
+    (those in archived months included, see meal_archive.py). The streak state
+    is checked against it too.
+    """
+    totals = data.get(ROLLUP_KEY)
+    meals = data.get('meals', [])
+    expected = len(meals) + archived_meal_count(data)
+    if not isinstance(totals, dict) or sum(d['meal_count'] for d in totals.values()) != expected:
+        rebuilt = build_rollups(meals)
+        if isinstance(totals, dict) and data.get(ARCHIVE_KEY):
+            # Archived meals aren't in the document - their days keep the totals they had
+            rebuilt.update((day, t) for day, t in totals.items() if day[:7] in data[ARCHIVE_KEY])
+        totals = data[ROLLUP_KEY] = rebuilt
+        data.pop(STREAK_KEY, None)
+    ensure_streak(data, totals)
+    return totals
+
+
+def totals_between(totals, start=None, end=None):
+    """{date: totals} for logged days with start <= date <= end (either bound optional)"""
+    if start is not None and end is not None:
+        first, last = date.fromisoformat(start), date.fromisoformat(end)
+        span = (last - first).days + 1
+        if span < len(totals):
+            # Short window over a long history: look up each calendar day
+            days = ((first + timedelta(days=i)).isoformat() for i in range(span))
+            return {day: totals[day] for day in days if day in totals}
+    return {
+        day: t for day, t in totals.items()
+        if (start is None or day >= start) and (end is None or day <= end)
+    }
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Deficit Ledger for Lean
+Prefix sums over day ordinals from a start date for one daily calorie goal,
+built from the per-day rollups (daily_rollups.py), so /api/goal_projection
+reads cumulative deficit, days under target and logging runs as O(1) lookups
+instead of walking every calendar day since the start.
+
+Index i is day start + i. For the days start..start+i:
+
+    cum_calories[i + 1]  calories logged
+    cum_logged[i + 1]    days with meals
+    cum_under[i + 1]     days with meals under the goal
+    run[i]               consecutive logged days ending at day i (0 = nothing logged)
+    best[i]              longest run so far
+    last[i]              index of the latest logged day so far (-1 = none)
+
+A goal or start change builds a new ledger (one accumulate() pass per
+array); logging a meal updates the suffix from that day on, which for
+today's meals is the last entry only.
+"""
+
+from itertools import accumulate
+
+from meal_index import day_ordinal
+
+
+class DeficitLedger:
+
+    def __init__(self, totals, start, goal):
+        self.start = day_ordinal(start)
+        self.goal = goal
+        calories = {}
+        for day, t in totals.items():
+            ordinal = day_ordinal(day)
+            if ordinal >= self.start > 0:
+                calories[ordinal - self.start] = t['calories']
+        size = max(calories) + 1 if calories else 0
+        self.calories = [calories.get(i, 0) for i in range(size)]
+        self.logged = [1 if i in calories else 0 for i in range(size)]
+        self.cum_calories = [0, *accumulate(self.calories)]
+        self.cum_logged = [0, *accumulate(self.logged)]
+        self.cum_under = [0, *accumulate(1 if logged and goal - cal > 0 else 0
+                                         for cal, logged in zip(self.calories, self.logged))]
+        self.run = list(accumulate(self.logged, lambda run, logged: run + 1 if logged else 0))
+        self.best = list(accumulate(self.run, max))
+        self.last = list(accumulate((i if logged else -1 for i, logged in enumerate(self.logged)), max))
+
+    def copy(self):
+        ledger = DeficitLedger.__new__(DeficitLedger)
+        ledger.__dict__ = {k: list(v) if isinstance(v, list) else v for k, v in self.__dict__.items()}
+        return ledger
+
+    def update_day(self, day, totals):
+        """Re-read one day from the rollups after its meals changed"""
+        i = day_ordinal(day) - self.start
+        if i < 0 or self.start <= 0:
+            return
+        t = totals.get(day)
+        first = min(i, len(self.run))  # everything before day i (or the old end) stays valid
+        while len(self.calories) <= i:
+            self.calories.append(0)
+            self.logged.append(0)
+        self.calories[i] = t['calories'] if t else 0
+        self.logged[i] = 1 if t else 0
+        while self.logged and not self.logged[-1]:
+            self.calories.pop()
+            self.logged.pop()
+        size = len(self.calories)
+        first = min(first, size)
+        for array in (self.cum_calories, self.cum_logged, self.cum_under):
+            del array[first + 1:]
+        for array in (self.run, self.best, self.last):
+            del array[first:]
+        for j in range(first, size):
+            cal, logged = self.calories[j], self.logged[j]
+            self.cum_calories.append(self.cum_calories[j] + cal)
+            self.cum_logged.append(self.cum_logged[j] + logged)
+            self.cum_under.append(self.cum_under[j] + (1 if logged and self.goal - cal > 0 else 0))
+            run = (self.run[j - 1] + 1 if j else 1) if logged else 0
+            self.run.append(run)
+            self.best.append(max(self.best[j - 1], run) if j else run)
+            self.last.append(j if logged else (self.last[j - 1] if j else -1))
+
+    def summary(self, today):
+        """
+        Totals for start..today ('YYYY-MM-DD'): total_deficit, days_logged,
+        days_under_target, logging_streak (longest run) and current_streak
+        (the run ending at the latest logged day)
+        """
+        i = min(day_ordinal(today) - self.start, len(self.calories) - 1)
+        if i < 0:
+            return {'total_deficit': 0, 'days_logged': 0, 'days_under_target': 0,
+                    'logging_streak': 0, 'current_streak': 0}
+        days_logged = self.cum_logged[i + 1]
+        last = self.last[i]
+        return {
+            'total_deficit': self.goal * days_logged - self.cum_calories[i + 1],
+            'days_logged': days_logged,
+            'days_under_target': self.cum_under[i + 1],
+            'logging_streak': self.best[i],
+            'current_streak': self.run[last] if last >= 0 else 0,
+        }
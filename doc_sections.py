@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Sectioned User Documents for Lean
+A user document is written as a run of byte blocks - one per top-level
+value, and one per calendar month of the date-ordered collections (meals,
+weight_history) - plus a small <uid>.idx sidecar recording where each block
+sits in the file. Concatenated, the blocks are exactly the compact JSON
+document, so whole-document readers see nothing new; a compressed document
+is one gzip member / zstd frame per block (compressed_io.encode_blocks()),
+which whole-file decompression reads straight through.
+
+Partial readers use the index to fetch only what a request needs - the
+settings, the months overlapping a date range, the latest weights - so
+/api/today reads kilobytes however long the history is.
+
+The index records the (inode, mtime, size) of the file it describes. Any
+write that doesn't go through here (pretty-printed LEAN_JSON_INDENT=2
+documents, a crash between the document and its index) leaves it stale,
+and read_sections() answers None: the caller loads the whole document.
+"""
+
+import os
+
+import compressed_io
+import json_codec
+from atomic_io import write_document_atomic, write_file_atomic
+
+# Collections kept in (date, time) order, cut into one block per month
+MONTHLY_KEYS = ('meals', 'weight_history')
+
+
+class SplitDocument:
+    """A document as blocks: blocks[i] = prefix + value JSON + suffix, trims[i] = (len(prefix), len(suffix))"""
+
+    def __init__(self):
+        self.blocks = []
+        self.trims = []
+        self.layout = {}  # key -> block number, or {month: block number} for MONTHLY_KEYS
+
+    def add(self, prefix, payload, suffix=b''):
+        self.blocks.append(prefix + payload + suffix)
+        self.trims.append((len(prefix), len(suffix)))
+        return len(self.blocks) - 1
+
+
+def _month_runs(entries):
+    """[(month, entries)] for an ordered collection, or None if its months aren't in order"""
+    runs = []
+    for entry in entries:
+        day = entry.get('date') if isinstance(entry, dict) else None
+        month = day[:7] if isinstance(day, str) else ''
+        if runs and runs[-1][0] == month:
+            runs[-1][1].append(entry)
+        elif runs and runs[-1][0] > month:
+            return None
+        else:
+            runs.append((month, [entry]))
+    return runs
+
+
+def split(data):
+    """data as a SplitDocument, or None if it can't be cut (non-string keys)"""
+    if not data or not all(isinstance(key, str) for key in data):
+        return None
+    doc = SplitDocument()
+    for i, (key, value) in enumerate(data.items()):
+        glue = (b'{' if i == 0 else b',') + json_codec.dumpb(key) + b':'
+        runs = _month_runs(value) if key in MONTHLY_KEYS and isinstance(value, list) and value else None
+        if runs is None:
+            doc.layout[key] = doc.add(glue, json_codec.dumpb(value))
+            continue
+        months = doc.layout[key] = {}
+        for j, (month, entries) in enumerate(runs):
+            months[month] = doc.add(glue + b'[' if j == 0 else b',', json_codec.dumpb(entries)[1:-1],
+                                    b']' if j == len(runs) - 1 else b'')
+    # Closing brace rides on the last block
+    doc.blocks[-1] += b'}'
+    doc.trims[-1] = (doc.trims[-1][0], doc.trims[-1][1] + 1)
+    return doc
+
+
+def index_path(path):
+    """<uid>.idx next to <uid>.json"""
+    return path[:-len('.json')] + '.idx'
+
+
+def _stamp(st):
+    return [st.st_ino, st.st_mtime_ns, st.st_size]
+
+
+def write(path, doc, fsync, compression=compressed_io.COMPRESSION, min_bytes=compressed_io.COMPRESS_MIN_BYTES):
+    """Write a SplitDocument as the document at path, then its index"""
+    target, extents = write_document_atomic(path, doc.blocks, fsync, compression, min_bytes)
+    index = {
+        'file': os.path.basename(target),
+        'stamp': _stamp(os.stat(target)),
+        'size': sum(len(b) for b in doc.blocks),
+        'blocks': [[offset, length, skip, trail] for (offset, length), (skip, trail) in zip(extents, doc.trims)],
+        'layout': doc.layout,
+    }
+    # Derived data: losing it to a crash only means whole-document reads until the next write
+    write_file_atomic(index_path(path), json_codec.dumpb(index), fsync=False)
+
+
+def read_index(path):
+    """The index written with the document at path (unchecked), or None"""
+    try:
+        with open(index_path(path), 'rb') as f:
+            return json_codec.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def decoded_size(path, variant, st):
+    """Uncompressed size of the document at variant (stat st) - exact for multi-block files too"""
+    if variant.endswith(tuple(compressed_io.SUFFIXES.values())):
+        index = read_index(path)
+        if index is not None and index['stamp'] == _stamp(st):
+            return index['size']
+    return compressed_io.decoded_size(variant, st)
+
+
+class _Reader:
+    """Reads runs of blocks from an open document that its index describes"""
+
+    def __init__(self, f, variant, index):
+        self.f = f
+        self.variant = variant
+        self.blocks = index['blocks']
+
+    def read(self, first, last):
+        """JSON text of blocks first..last, without the glue before the first and after the last"""
+        start = self.blocks[first][0]
+        end = self.blocks[last][0] + self.blocks[last][1]
+        self.f.seek(start)
+        raw = compressed_io.decompress(self.f.read(end - start), self.variant)
+        return raw[self.blocks[first][2]:len(raw) - self.blocks[last][3]]
+
+    def value(self, block):
+        return json_codec.loads(self.read(block, block))
+
+    def entries(self, first, last):
+        return json_codec.loads(b'[' + self.read(first, last) + b']')
+
+
+def _open(path):
+    """(open document file, variant path, index) when path's index is current, else None"""
+    index = read_index(path)
+    if index is None:
+        return None
+    variant = os.path.join(os.path.dirname(path), index['file'])
+    try:
+        f = open(variant, 'rb')
+    except FileNotFoundError:
+        return None
+    if _stamp(os.fstat(f.fileno())) != index['stamp']:
+        f.close()  # rewritten since the index was made
+        return None
+    return f, variant, index
+
+
+def is_current(path):
+    """Whether the document at path has an index describing it"""
+    opened = _open(path)
+    if opened is not None:
+        opened[0].close()
+    return opened is not None
+
+
+def _tail(reader, blocks, n):
+    """Entries of the last few month blocks, at least n of them unless there are fewer"""
+    tail = []
+    for block in reversed(blocks):
+        if len(tail) >= n:
+            break
+        tail = reader.entries(block, block) + tail
+    return tail
+
+
+def read_sections(path, keys, start=None, end=None, latest=None):
+    """
+    {key: value} for the top-level keys of the document at path that it has.
+    MONTHLY_KEYS are cut to the months overlapping start..end ('YYYY-MM-DD',
+    either optional; the caller filters exact days), or with latest=n to a
+    tail holding at least their last n entries. None without a current index.
+    """
+    opened = _open(path)
+    if opened is None:
+        return None
+    f, variant, index = opened
+    with f:
+        reader = _Reader(f, variant, index)
+        out = {}
+        for key in keys:
+            where = index['layout'].get(key)
+            if where is None:
+                continue
+            if isinstance(where, int):
+                out[key] = reader.value(where)
+                continue
+            if latest is not None:
+                out[key] = _tail(reader, list(where.values()), latest)
+                continue
+            blocks = [block for month, block in where.items()
+                      if (start is None or month >= start[:7]) and (end is None or month <= end[:7])]
+            out[key] = reader.entries(blocks[0], blocks[-1]) if blocks else []
+        return out
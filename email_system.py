@@ -9,19 +9,21 @@ import os
 import json
 from datetime import datetime
 
+import json_codec
+from atomic_io import atomic_write_json
+
 EMAIL_FILE = 'email_subscribers.json'
 
 def load_subscribers():
     """Load subscriber data"""
     if not os.path.exists(EMAIL_FILE):
         return {'subscribers': []}
-    with open(EMAIL_FILE) as f:
-        return json.load(f)
+    with open(EMAIL_FILE, 'rb') as f:
+        return json_codec.load(f)
 
 def save_subscribers(data):
     """Save subscriber data"""
-    with open(EMAIL_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+    atomic_write_json(EMAIL_FILE, data)
 
 def capture_email(email, source='landing', name=None, metadata=None):
     """
@@ -76,7 +78,7 @@ def _send_to_airtable(subscriber):
         return
     
     try:
-        import requests
+        from http_client import http
         
         url = f'https://api.airtable.com/v0/{airtable_base_id}/{airtable_table_name}'
         headers = {
@@ -94,7 +96,8 @@ def _send_to_airtable(subscriber):
             }
         }
         
-        response = requests.post(url, headers=headers, json=data)
+        # Not retried: a create the upstream acted on but failed to answer would be duplicated
+        response = http.post(url, headers=headers, json=data, name='airtable.create', retries=0)
         return response.json()
     
     except Exception as e:
@@ -109,7 +112,7 @@ def _send_to_loops(subscriber):
         return
     
     try:
-        import requests
+        from http_client import http
         
         url = 'https://app.loops.so/api/v1/contacts/create'
         headers = {
@@ -124,7 +127,7 @@ def _send_to_loops(subscriber):
             'userGroup': 'lean_subscribers'
         }
         
-        response = requests.post(url, headers=headers, json=data)
+        response = http.post(url, headers=headers, json=data, name='loops.create', retries=0)
         return response.json()
     
     except Exception as e:
@@ -5,7 +5,7 @@ Telegram food photo handler - integrates with photo_analyzer and fitness tracker
 
 import sys
 import json
-import requests
+from http_client import http
 from photo_analyzer import analyze_food_image
 
 FITNESS_TRACKER_URL = "http://localhost:3000"
@@ -20,9 +20,10 @@ def log_to_tracker(analysis_data):
         "fat": analysis_data['fat']
     }
     
-    response = requests.post(
+    response = http.post(
         f"{FITNESS_TRACKER_URL}/api/log-food",
-        json=food_data
+        json=food_data,
+        name='tracker.log_food'
     )
     
     return response.json()
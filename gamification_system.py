@@ -4,10 +4,11 @@ Gamification System for Fitness Tracker
 Handles XP, levels, quests, achievements, combos
 """
 
-import json
 from datetime import datetime, timedelta
 import random
 
+import json_codec
+
 class GamificationEngine:
     
     # XP Values
@@ -32,8 +33,8 @@ class GamificationEngine:
     def load_data(self):
         """Load user gamification data"""
         try:
-            with open(self.data_file) as f:
-                return json.load(f)
+            with open(self.data_file, 'rb') as f:
+                return json_codec.load(f)
         except:
             return {
                 'total_xp': 0,
@@ -49,8 +50,8 @@ class GamificationEngine:
     
     def save_data(self):
         """Save user gamification data"""
-        with open(self.data_file, 'w') as f:
-            json.dump(self.data, f, indent=2)
+        with open(self.data_file, 'wb') as f:
+            f.write(json_codec.dumpb(self.data, indent=json_codec.JSON_INDENT))
     
     def calculate_level(self, xp):
         """Calculate level from XP"""
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Outbound HTTP Client for Lean
+One pooled, keep-alive requests.Session for every third-party API call
+(OpenAI, Airtable, Loops, a local Ollama), so repeat calls reuse their
+TCP + TLS connection, none can hang a worker forever, and brief upstream
+failures are retried instead of surfacing to the user.
+
+Settings:
+    LEAN_HTTP_CONNECT_TIMEOUT  seconds to establish a connection (default 5)
+    LEAN_HTTP_READ_TIMEOUT     seconds to wait between bytes of the response (default 60)
+    LEAN_HTTP_RETRIES          extra attempts after a connection error or a
+                               429 / 5xx answer (default 2)
+    LEAN_HTTP_BACKOFF          base backoff in seconds, doubled per attempt with
+                               +/-50% jitter, capped at 10s (default 0.5)
+    LEAN_HTTP_POOL_SIZE        keep-alive connections kept per host (default 16)
+
+A read timeout is only retried for idempotent methods: the upstream may
+already be acting on a POST it has not answered. Upload bodies must be
+bytes rather than open files so a retry can resend them.
+
+Every attempt is timed per call name (the host unless given); stats()
+reports counts, errors, retries and latency percentiles over the most
+recent calls.
+
+Callers catch the re-exported Timeout / ConnectError / RequestError
+rather than importing requests themselves.
+
+Usage:
+    from http_client import http, Timeout
+    response = http.post(url, json=payload, name='openai.chat')
+    http.stats()
+"""
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError as ConnectError, RequestException as RequestError, Timeout
+
+CONNECT_TIMEOUT = float(os.getenv('LEAN_HTTP_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.getenv('LEAN_HTTP_READ_TIMEOUT', 60))
+RETRIES = int(os.getenv('LEAN_HTTP_RETRIES', 2))
+BACKOFF_SECONDS = float(os.getenv('LEAN_HTTP_BACKOFF', 0.5))
+POOL_SIZE = int(os.getenv('LEAN_HTTP_POOL_SIZE', 16))
+
+MAX_BACKOFF_SECONDS = 10
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+
+# Latency samples kept per call name for the percentiles in stats()
+LATENCY_WINDOW = 256
+
+
+class _CallStats:
+    __slots__ = ('calls', 'errors', 'retries', 'latencies')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def summary(self):
+        ordered = sorted(self.latencies)
+
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 1) if ordered else None
+        return {'calls': self.calls, 'errors': self.errors, 'retries': self.retries,
+                'p50_ms': pct(0.5), 'p95_ms': pct(0.95), 'max_ms': round(ordered[-1], 1) if ordered else None}
+
+
+class HTTPClient:
+    """requests.Session wrapper adding default timeouts, jittered retries and latency metrics; thread-safe"""
+
+    def __init__(self, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, retries=RETRIES,
+                 backoff=BACKOFF_SECONDS, pool_size=POOL_SIZE):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    @property
+    def session(self):
+        # Created on first use and again after a fork: pooled sockets must not be shared across processes
+        with self._lock:
+            if self._session is None or self._pid != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._session, self._pid = session, os.getpid()
+            return self._session
+
+    def _record(self, name, started, error=False, retry=False):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = _CallStats()
+            stats.calls += 1
+            stats.errors += error
+            stats.retries += retry
+            stats.latencies.append(elapsed_ms)
+
+    def _delay(self, attempt, response=None):
+        delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        return min(delay, MAX_BACKOFF_SECONDS)
+
+    def request(self, method, url, name=None, retries=None, timeout=None, **kwargs):
+        """
+        session.request() with the client's timeout unless one is given,
+        retrying connection errors and 429 / 5xx answers up to `retries`
+        times. Returns the last response (whatever its status); raises the
+        last requests exception if no attempt got one.
+        """
+        name = name or urlsplit(url).netloc
+        retries = self.retries if retries is None else retries
+        timeout = self.timeout if timeout is None else timeout
+        method = method.upper()
+        for attempt in range(retries + 1):
+            last = attempt == retries
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except RequestError as e:
+                retryable = isinstance(e, ConnectError) or (isinstance(e, Timeout) and method in IDEMPOTENT_METHODS)
+                self._record(name, started, error=True, retry=retryable and not last)
+                if last or not retryable:
+                    raise
+                time.sleep(self._delay(attempt))
+                continue
+            retry = response.status_code in RETRY_STATUSES and not last
+            self._record(name, started, error=response.status_code >= 500, retry=retry)
+            if not retry:
+                return response
+            response.close()
+            time.sleep(self._delay(attempt, response))
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """{call name: {'calls', 'errors', 'retries', 'p50_ms', 'p95_ms', 'max_ms'}} (attempts, not logical calls)"""
+        with self._lock:
+            return {name: stats.summary() for name, stats in sorted(self._stats.items())}
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+# Shared by every module making outbound calls
+http = HTTPClient()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Background Jobs for Lean
+Slow AI calls (Whisper, GPT-4o vision) run on a small in-process thread
+pool instead of holding a request open, so an upload returns a job id at
+once and a few users logging photos no longer tie up every worker.
+
+Settings:
+    LEAN_JOB_WORKERS    threads running jobs per process (default 4)
+    LEAN_JOB_QUEUE_MAX  jobs queued or running per process before submit()
+                        raises QueueFull (default 32)
+    LEAN_JOB_TTL        seconds a job record is kept for polling (default 3600)
+
+Each job's state lives in a small JSON file, <directory>/<job id>.json,
+rewritten atomically as it moves queued -> running -> done | failed, so
+whichever gunicorn worker a poll lands on can answer it. The work itself
+stays in the process that accepted it. Each record names that owner (host,
+pid and the process's start time, so a recycled pid can't pass for it); a
+job whose owner has exited, e.g. a worker restarted mid-job, is reported
+'failed' on the next poll. Where the owner can't be checked (another host,
+no /proc) that happens once the job has been stuck longer than the TTL.
+Expired records are swept on later submits.
+
+Usage:
+    jobs = JobQueue('data/users/.jobs', on_finish=notify)
+    job = jobs.submit(uid, 'photo_log', analyze, image_bytes)
+    jobs.get(job['id'])  # {'id', 'uid', 'kind', 'owner', 'status', 'created', 'updated', 'result' | 'error'}
+"""
+
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import json_codec
+from atomic_io import ensure_dir, write_file_atomic
+
+JOB_WORKERS = int(os.getenv('LEAN_JOB_WORKERS', 4))
+JOB_QUEUE_MAX = int(os.getenv('LEAN_JOB_QUEUE_MAX', 32))
+JOB_TTL_SECONDS = float(os.getenv('LEAN_JOB_TTL', 3600))
+
+# Seconds between sweeps of expired job records
+SWEEP_INTERVAL = 60
+
+FINISHED = ('done', 'failed')
+
+INTERRUPTED = 'Job was interrupted, please try again'
+
+HOST = socket.gethostname()
+
+
+class QueueFull(Exception):
+    """Raised by submit() when this process already has max_pending jobs"""
+
+
+def _is_job_id(job_id):
+    return isinstance(job_id, str) and len(job_id) == 32 and all(ch in '0123456789abcdef' for ch in job_id)
+
+
+def _start_token(pid):
+    """The process's start time in clock ticks since boot (Linux /proc), or None where unavailable"""
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            # Fields after the parenthesised command name start at field 3; starttime is field 22
+            return int(f.read().rsplit(b')', 1)[1].split()[19])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _owner():
+    # Per submit rather than at import: gunicorn forks workers after loading the app
+    pid = os.getpid()
+    return {'host': HOST, 'pid': pid, 'start': _start_token(pid)}
+
+
+def _owner_gone(owner):
+    """True only when the job's owning process has certainly exited"""
+    if not owner or owner.get('host') != HOST or os.name != 'posix':
+        return False
+    try:
+        os.kill(owner['pid'], 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass  # EPERM: alive, under another user
+    start = owner.get('start')
+    return start is not None and _start_token(owner['pid']) not in (start, None)
+
+
+class JobQueue:
+    """Bounded thread pool whose job states are shared through files"""
+
+    def __init__(self, directory, workers=JOB_WORKERS, max_pending=JOB_QUEUE_MAX, ttl=JOB_TTL_SECONDS,
+                 on_finish=None):
+        self.directory = directory
+        self.workers = workers
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.on_finish = on_finish
+        self.pending = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._last_sweep = 0.0
+
+    def _pool(self):
+        # Started on first use, so importing the app (or forking workers) starts no threads
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='lean-job')
+            return self._executor
+
+    def path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def _write(self, job):
+        # Job records are transient: a crash loses the running work anyway, so no fsync
+        write_file_atomic(self.path(job['id']), json_codec.dumpb(job), fsync=False)
+
+    def submit(self, uid, kind, fn, *args):
+        """
+        Queue fn(*args) for uid and return the new job record. fn's return
+        value becomes the job's 'result' (JSON-serializable); an exception
+        marks it failed with the message as 'error'.
+        """
+        with self._lock:
+            if self.pending >= self.max_pending:
+                raise QueueFull(f'{self.pending} jobs already pending')
+            self.pending += 1
+        try:
+            now = time.time()
+            job = {'id': uuid.uuid4().hex, 'uid': uid, 'kind': kind, 'owner': _owner(), 'status': 'queued',
+                   'created': now, 'updated': now}
+            ensure_dir(self.directory, fsync=False)
+            self._write(job)
+            self._pool().submit(self._run, job, fn, args)
+        except BaseException:
+            with self._lock:
+                self.pending -= 1
+            raise
+        self._maybe_sweep(now)
+        return job
+
+    def _run(self, job, fn, args):
+        try:
+            self._write({**job, 'status': 'running', 'updated': time.time()})
+            job = {**job, 'status': 'done', 'result': fn(*args)}
+        except Exception as e:
+            job = {**job, 'status': 'failed', 'error': str(e)}
+        finally:
+            with self._lock:
+                self.pending -= 1
+        job['updated'] = time.time()
+        self._write(job)
+        if self.on_finish is not None:
+            self.on_finish(job)
+
+    def get(self, job_id):
+        """The job's current record, or None for an unknown or expired id"""
+        if not _is_job_id(job_id):
+            return None
+        try:
+            with open(self.path(job_id), 'rb') as f:
+                job = json_codec.load(f)
+        except (FileNotFoundError, ValueError):
+            return None  # ValueError: a record torn by a crash mid-write
+        age = time.time() - job['updated']
+        if age > self.ttl:
+            if job['status'] in FINISHED:
+                return None
+            return {**job, 'status': 'failed', 'error': INTERRUPTED}
+        if job['status'] not in FINISHED and _owner_gone(job.get('owner')):
+            return {**job, 'status': 'failed', 'error': INTERRUPTED}
+        return job
+
+    def _maybe_sweep(self, now):
+        with self._lock:
+            if now - self._last_sweep < SWEEP_INTERVAL:
+                return
+            self._last_sweep = now
+        self.sweep(now)
+
+    def sweep(self, now=None):
+        """Remove job records untouched for twice the TTL (finished, or orphaned by a restart)"""
+        cutoff = (now or time.time()) - 2 * self.ttl
+        removed = 0
+        try:
+            with os.scandir(self.directory) as entries:
+                stale = [e.path for e in entries if e.name.endswith('.json') and e.stat().st_mtime < cutoff]
+        except FileNotFoundError:
+            return 0
+        for path in stale:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def stats(self):
+        return {'pending': self.pending, 'max_pending': self.max_pending, 'workers': self.workers}
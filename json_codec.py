@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+JSON Codec for Lean
+The one place documents become JSON and back: the storage engines
+(user_storage.py, atomic_io.py), the payment / referral / email /
+gamification stores, and Flask responses (app_pro.CodecJSONProvider).
+
+Backends (LEAN_JSON_CODEC):
+    auto    - orjson if installed, else msgspec, else the stdlib (default)
+    orjson  - force one; falls back to the stdlib if it isn't installed
+    msgspec
+    stdlib
+
+Files are written compact by default; LEAN_JSON_INDENT=2 writes the old
+pretty-printed layout. Whatever the fast backend refuses - ints beyond 64
+bits, NaN/Infinity in legacy files, indents other than 2 - is retried with
+the stdlib, so the backend never changes what can be stored or read.
+Mappings that aren't dicts (e.g. records.Record) encode as objects.
+
+Usage:
+    python benchmarks.py json   # throughput of the fast backend vs the stdlib
+"""
+
+import json
+import os
+from collections.abc import Mapping
+
+JSON_CODEC = os.getenv('LEAN_JSON_CODEC', 'auto')
+JSON_INDENT = int(os.getenv('LEAN_JSON_INDENT', 0))
+
+orjson = msgspec = None
+if JSON_CODEC in ('auto', 'orjson'):
+    try:
+        import orjson
+    except ImportError:
+        orjson = None
+if orjson is None and JSON_CODEC in ('auto', 'msgspec'):
+    try:
+        import msgspec
+    except ImportError:
+        msgspec = None
+
+CODEC = 'orjson' if orjson is not None else 'msgspec' if msgspec is not None else 'stdlib'
+
+# What the fast backend raises for input it won't handle (orjson's errors subclass these)
+_FALLBACK_ERRORS = (TypeError, ValueError, OverflowError) + ((msgspec.MsgspecError,) if msgspec is not None else ())
+
+
+def _encoder_default(default):
+    """default() hook that also turns non-dict Mappings into dicts"""
+    def encode(obj):
+        if isinstance(obj, Mapping):
+            return dict(obj)
+        if default is not None:
+            return default(obj)
+        raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+    return encode
+
+
+def _stdlib_dumps(obj, indent=0, sort_keys=False, default=None):
+    if indent:
+        return json.dumps(obj, indent=indent, sort_keys=sort_keys, default=_encoder_default(default))
+    return json.dumps(obj, separators=(',', ':'), sort_keys=sort_keys, default=_encoder_default(default))
+
+
+def _fast_dumpb(obj, indent, sort_keys, default):
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if default is not None:
+            # Let the caller's default() decide these, as it would with the stdlib
+            option |= orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        return orjson.dumps(obj, default=_encoder_default(default), option=option)
+    out = msgspec.json.encode(obj, enc_hook=_encoder_default(default), order='sorted' if sort_keys else None)
+    return msgspec.json.format(out, indent=2) if indent else out
+
+
+def dumpb(obj, indent=0, sort_keys=False, default=None):
+    """obj as UTF-8 JSON bytes; indent 0 is compact"""
+    if CODEC != 'stdlib' and indent in (0, 2):
+        try:
+            return _fast_dumpb(obj, indent, sort_keys, default)
+        except _FALLBACK_ERRORS:
+            pass
+    return _stdlib_dumps(obj, indent, sort_keys, default).encode('utf-8')
+
+
+def dumps(obj, indent=0, sort_keys=False, default=None):
+    """obj as a JSON str; indent 0 is compact"""
+    if CODEC == 'stdlib':
+        return _stdlib_dumps(obj, indent, sort_keys, default)
+    return dumpb(obj, indent, sort_keys, default).decode('utf-8')
+
+
+def loads(data):
+    """Parse JSON from str or bytes"""
+    if CODEC != 'stdlib':
+        try:
+            return orjson.loads(data) if orjson is not None else msgspec.json.decode(data)
+        except _FALLBACK_ERRORS:
+            pass  # not valid for the fast parser (NaN, ...): the stdlib decides
+    return json.loads(data)
+
+
+def load(f):
+    """Parse JSON from an open file (binary mode avoids a decode)"""
+    return loads(f.read())
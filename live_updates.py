@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Live Updates for Lean
+In-process fan-out of per-user change events to open Server-Sent Events
+streams (/api/stream), so every device showing a user's dashboard sees a
+meal or weight logged on another one without polling.
+
+Settings:
+    LEAN_STREAM_HEARTBEAT  seconds an idle stream waits before a keep-alive
+                           comment (and a check for writes made by another
+                           worker process) - default 15
+    LEAN_STREAM_BACKLOG    events queued per stream before it is sent one
+                           'sync' event instead of the backlog - default 64
+    LEAN_STREAM_MAX        streams one worker process serves at once - default 8.
+                           Each holds a server thread for as long as it is
+                           open, so keep this below gunicorn's --threads;
+                           beyond it /api/stream answers 503 and the
+                           dashboard stays on 60s polling
+
+Publishing to a user nobody is watching is one dict lookup. An idle stream
+is one thread parked on its own condition until an event or the heartbeat
+wakes it. The hub only reaches streams served by the same process; the
+stream view covers the rest by comparing the store's stamp at each
+heartbeat.
+
+Usage:
+    hub = LiveHub()
+    subscription = hub.subscribe(uid)  # raises TooManyStreams at LEAN_STREAM_MAX
+    hub.publish(uid, 'meal', {...})
+    events, overflowed = subscription.wait(timeout)
+    subscription.close()
+"""
+
+import os
+import threading
+from collections import deque
+
+import json_codec
+
+HEARTBEAT_SECONDS = float(os.getenv('LEAN_STREAM_HEARTBEAT', 15))
+BACKLOG = int(os.getenv('LEAN_STREAM_BACKLOG', 64))
+MAX_STREAMS = int(os.getenv('LEAN_STREAM_MAX', 8))
+
+
+class TooManyStreams(Exception):
+    """This process already serves max_streams streams"""
+
+
+def format_event(event, data):
+    """One SSE frame: 'event: <event>' and the JSON payload as its data line"""
+    return f'event: {event}\ndata: {json_codec.dumps(data)}\n\n'
+
+
+class Subscription:
+    """One open stream's queue of (event, data) pairs"""
+
+    def __init__(self, hub, uid, backlog):
+        self.hub = hub
+        self.uid = uid
+        self.backlog = backlog
+        self.events = deque()
+        self.overflowed = False
+        self.closed = False
+        self.cond = threading.Condition(threading.Lock())
+
+    def put(self, event, data):
+        with self.cond:
+            if len(self.events) >= self.backlog:
+                # A stalled client gets a single resync rather than unbounded memory
+                self.events.clear()
+                self.overflowed = True
+            else:
+                self.events.append((event, data))
+            self.cond.notify()
+
+    def wait(self, timeout):
+        """
+        Block until events arrive, the subscription closes or timeout
+        passes. Returns (events, overflowed): the queued events in order
+        (empty on timeout) and whether some were dropped since the last call.
+        """
+        with self.cond:
+            if not self.events and not self.overflowed and not self.closed:
+                self.cond.wait(timeout)
+            events, self.events = list(self.events), deque()
+            overflowed, self.overflowed = self.overflowed, False
+            return events, overflowed
+
+    def close(self):
+        """Detach from the hub and wake a waiting reader (idempotent)"""
+        with self.cond:
+            if self.closed:
+                return
+            self.closed = True
+            self.cond.notify()
+        self.hub._unsubscribe(self)
+
+
+class LiveHub:
+    """uid -> open subscriptions; thread-safe"""
+
+    def __init__(self, backlog=BACKLOG, max_streams=MAX_STREAMS):
+        self.backlog = backlog
+        self.max_streams = max_streams
+        self.rejected = 0
+        self._subscribers = {}
+        self._streams = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, uid):
+        subscription = Subscription(self, uid, self.backlog)
+        with self._lock:
+            if self._streams >= self.max_streams:
+                self.rejected += 1
+                raise TooManyStreams(f'{self._streams} streams open')
+            self._subscribers.setdefault(uid, set()).add(subscription)
+            self._streams += 1
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.uid)
+            if subscribers is not None and subscription in subscribers:
+                subscribers.discard(subscription)
+                self._streams -= 1
+                if not subscribers:
+                    del self._subscribers[subscription.uid]
+
+    def watching(self, uid):
+        """Whether any stream is open for uid - publishers skip building payloads otherwise"""
+        return uid in self._subscribers
+
+    def publish(self, uid, event, data):
+        """Queue (event, data) on every stream open for uid; returns how many"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(uid, ()))
+        for subscription in subscribers:
+            subscription.put(event, data)
+        return len(subscribers)
+
+    def stats(self):
+        with self._lock:
+            return {'users': len(self._subscribers), 'streams': self._streams,
+                    'max_streams': self.max_streams, 'rejected': self.rejected}
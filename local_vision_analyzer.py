@@ -8,16 +8,13 @@ import sys
 import json
 import os
 import base64
-import requests
+
+from http_client import ConnectError, Timeout, http
+from vision_cache import vision_cache
 
 OLLAMA_API_URL = "http://localhost:11434/api/generate"
 VISION_MODEL = "llava:latest"
 
-def encode_image_to_base64(image_path):
-    """Encode image to base64 for ollama"""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
-
 def analyze_food_image_local(image_path):
     """
     Analyze a food image using local ollama vision model
@@ -29,8 +26,20 @@ def analyze_food_image_local(image_path):
         dict: Nutritional information
     """
     try:
+        with open(image_path, "rb") as image_file:
+            image_bytes = image_file.read()
+        
+        # Same photo analyzed before: no model call
+        cached = vision_cache.get(image_bytes, VISION_MODEL)
+        if cached is not None:
+            return {
+                'success': True,
+                'data': cached,
+                'cached': True
+            }
+        
         # Encode image
-        base64_image = encode_image_to_base64(image_path)
+        base64_image = base64.b64encode(image_bytes).decode('utf-8')
         
         # Prompt for macro estimation
         prompt = """Analyze this food image and estimate the macros. You are a nutrition expert.
@@ -55,7 +64,7 @@ Respond ONLY with valid JSON in this exact format (no markdown, no extra text):
 Be conservative with portions if uncertain. Provide your best estimate."""
 
         # Call ollama API
-        response = requests.post(
+        response = http.post(
             OLLAMA_API_URL,
             json={
                 "model": VISION_MODEL,
@@ -63,7 +72,7 @@ Be conservative with portions if uncertain. Provide your best estimate."""
                 "images": [base64_image],
                 "stream": False
             },
-            timeout=60
+            name='ollama.generate'
         )
         
         if response.status_code != 200:
@@ -134,6 +143,8 @@ Be conservative with portions if uncertain. Provide your best estimate."""
                     
                 data[field] = float(value)
             
+            vision_cache.put(image_bytes, VISION_MODEL, data)
+            
             return {
                 'success': True,
                 'data': data
@@ -152,12 +163,12 @@ Be conservative with portions if uncertain. Provide your best estimate."""
             'raw_response': text if 'text' in locals() else None,
             'parse_error': str(e)
         }
-    except requests.exceptions.Timeout:
+    except Timeout:
         return {
             'success': False,
             'error': 'Request timed out. The model might still be loading.'
         }
-    except requests.exceptions.ConnectionError:
+    except ConnectError:
         return {
             'success': False,
             'error': 'Could not connect to Ollama. Is it running? (ollama serve)'
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Meal Archive Tiers for Lean
+Meals older than a horizon move out of the user document into immutable
+per-month archive segments beside it, so the document every request loads
+(the hot tier) holds recent meals only, however many years a user logs:
+
+    ab/cd/<uid>.json                          hot document
+    ab/cd/<uid>.archive/2025-03.5f0c9a1e.json.zst  one compressed segment per archived month
+
+Settings:
+    LEAN_ARCHIVE_AFTER_DAYS  months that ended more than this many days ago are
+                             archived on the document's next write (default 0: keep
+                             every meal in the document)
+
+The document's ARCHIVE_KEY maps each archived month to its precomputed
+rollup (calories, protein, carbs, fat, meal_count, days) and segment file.
+Daily rollups and the streak stay in the document, so totals, aggregates
+and projections never open a segment; the stores' meals_between() and
+load_all() merge in the segments a read reaches.
+
+A segment file is never rewritten. A later change to an archived month (a
+back-dated meal, an edit or delete of an archived one) is folded into a
+new segment under a new name, and the old file is pruned once the
+document pointing at the new one is in place - a crash in between leaves
+an unreferenced file, never a document referencing a missing one.
+"""
+
+import os
+import uuid
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import compressed_io
+import json_codec
+from atomic_io import ensure_dir, write_document_atomic
+
+ARCHIVE_AFTER_DAYS = int(os.getenv('LEAN_ARCHIVE_AFTER_DAYS', 0))
+
+# Document key: {'YYYY-MM': {'segment': file name, 'meal_count': n, 'days': n, 'calories': ..., ...}}
+ARCHIVE_KEY = 'archived_months'
+
+
+def _month(meal):
+    day = meal.get('date')
+    return day[:7] if isinstance(day, str) else ''
+
+
+def _sort_key(meal):
+    return (meal.get('date', ''), meal.get('time', '00:00'))
+
+
+def archive_dir(path):
+    """<uid>.archive/ next to the document <uid>.json"""
+    return path[:-len('.json')] + '.archive'
+
+
+def hot_from(after_days, today=None):
+    """
+    First month ('YYYY-MM') kept in the document, or None when archiving is
+    off. today defaults to the app's day (America/Chicago), not the server's
+    """
+    if after_days <= 0:
+        return None
+    today = today or datetime.now(ZoneInfo("America/Chicago")).date()
+    return (today - timedelta(days=after_days)).isoformat()[:7]
+
+
+def archived_meal_count(data):
+    """Meals the document's archived months hold"""
+    return sum(entry['meal_count'] for entry in (data.get(ARCHIVE_KEY) or {}).values())
+
+
+def months_in(archive, start=None, end=None):
+    """Archived months overlapping start..end ('YYYY-MM-DD', either optional), oldest first"""
+    return sorted(month for month in archive
+                  if (start is None or month >= start[:7]) and (end is None or month <= end[:7]))
+
+
+def has_cold_meals(data, first_hot):
+    """
+    Whether the document may hold meals that belong in the archive - older
+    than first_hot, or in an already archived month. Meals are in date order,
+    so only the oldest is checked.
+    """
+    meals = data.get('meals')
+    if not meals:
+        return False
+    oldest = _month(meals[0])
+    archive = data.get(ARCHIVE_KEY)
+    return (first_hot is not None and oldest < first_hot) or (bool(archive) and oldest <= max(archive))
+
+
+def merge(archived, meals):
+    """
+    Archived meals and document meals as one (date, time)-ordered list. The
+    two never share a meal: a month is only ever in one of them.
+    """
+    if not archived:
+        return meals
+    if meals and _sort_key(archived[-1]) > _sort_key(meals[0]):
+        return sorted(archived + list(meals), key=_sort_key)
+    return archived + list(meals)  # archived months all precede the document's - the usual case
+
+
+def read_months(directory, archive, months):
+    """Meals of the given archived months, in order (FileNotFoundError if a segment was replaced meanwhile)"""
+    meals = []
+    for month in months:
+        text = compressed_io.read_document(os.path.join(directory, archive[month]['segment']))
+        meals.extend(json_codec.loads(text)['meals'])
+    return meals
+
+
+def month_rollup(totals, month):
+    """The month's totals summed from the daily rollups, plus how many days were logged"""
+    rollup = {'days': 0}
+    for day, day_totals in totals.items():
+        if day.startswith(month):
+            rollup['days'] += 1
+            for metric, value in day_totals.items():
+                rollup[metric] = rollup.get(metric, 0) + value
+    return rollup
+
+
+def freeze(directory, data, first_hot, totals, fsync=True, compression=compressed_io.COMPRESSION):
+    """
+    Move data's meals older than first_hot, and any in months already
+    archived, into new segments (merged with the old segment of their month)
+    and record them under ARCHIVE_KEY. data is a document about to be
+    written with meals in order and rollups matching them; prune() after
+    writing it. Returns the months written.
+    """
+    if not has_cold_meals(data, first_hot):
+        return []
+    archive = data.setdefault(ARCHIVE_KEY, {})
+    cold, hot = {}, []
+    for meal in data['meals']:
+        month = _month(meal)
+        if (first_hot is not None and month < first_hot) or month in archive:
+            cold.setdefault(month, []).append(meal)
+        else:
+            hot.append(meal)
+    if not cold:
+        return []
+    ensure_dir(directory, fsync)
+    for month, meals in cold.items():
+        if month in archive:
+            meals = merge(read_months(directory, archive, [month]), meals)
+        segment = f'{month}.{uuid.uuid4().hex[:8]}.json'
+        rollup = month_rollup(totals, month)
+        write_document_atomic(os.path.join(directory, segment),
+                              json_codec.dumpb({'month': month, 'meals': meals, 'totals': rollup}),
+                              fsync, compression, 0)
+        archive[month] = {'segment': segment, **rollup, 'meal_count': len(meals)}
+    data['meals'] = hot
+    return sorted(cold)
+
+
+def prune(directory, data):
+    """Remove segments data's ARCHIVE_KEY no longer references (after data was written)"""
+    try:
+        with os.scandir(directory) as entries:
+            names = [entry.name for entry in entries]
+    except FileNotFoundError:
+        return
+    keep = {entry['segment'] for entry in (data.get(ARCHIVE_KEY) or {}).values()}
+    for name in names:
+        if compressed_io.base_path(name) not in keep:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+    if not keep:
+        try:
+            os.rmdir(directory)
+        except OSError:
+            pass  # a segment written by a concurrent freeze
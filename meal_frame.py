@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Meal Frame for Lean
+Columnar NumPy view of a user's meal / food-log records for analytics:
+
+    day      int32    day ordinal ('YYYY-MM-DD' -> date.toordinal(), 0 if missing)
+    minute   int16    minute of day from 'HH:MM' (-1 if missing)
+    calories, protein, carbs, fat   float32
+
+Rows are sorted by (day, minute), so a date window is two searchsorted()
+calls and per-day grouping is one np.bincount() per macro, instead of a
+Python sum() over every record for every day and macro. Sums accumulate in
+float64 (bincount weights), so whole-number macros come back exact.
+
+The frame also keeps the records themselves in that order, so rows() hands
+back a date window's records without another pass over the whole list.
+
+cached_frame() keeps built frames per source (e.g. a data file) until its
+stamp changes, so repeated requests skip the build - and, given a builder
+instead of a list, skip assembling the records too.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+
+import numpy as np
+
+from meal_index import day_ordinal
+
+MACROS = ('calories', 'protein', 'carbs', 'fat')
+FRAME_CACHE_ENTRIES = 64
+
+
+def _minute(value):
+    try:
+        hours, minutes = str(value).split(':')[:2]
+        return int(hours) * 60 + int(minutes)
+    except (TypeError, ValueError):
+        return -1
+
+
+def as_number(value):
+    """numpy scalar -> int when whole (matching Python sums of int macros), else a rounded float"""
+    value = float(value)
+    return int(value) if value.is_integer() else round(value, 2)
+
+
+class MealFrame:
+
+    def __init__(self, records=()):
+        records = list(records)
+        n = len(records)
+        day = np.fromiter((day_ordinal(r.get('date')) for r in records), dtype=np.int32, count=n)
+        minute = np.fromiter((_minute(r.get('time')) for r in records), dtype=np.int16, count=n)
+        order = np.lexsort((minute, day))
+        self.day = day[order]
+        self.minute = minute[order]
+        self.records = [records[i] for i in order]
+        self.columns = {
+            k: np.fromiter((r.get(k) or 0 for r in records), dtype=np.float32, count=n)[order]
+            for k in MACROS
+        }
+
+    def __len__(self):
+        return len(self.day)
+
+    def _bounds(self, start, end):
+        first, last = date.fromisoformat(start).toordinal(), date.fromisoformat(end).toordinal()
+        lo = np.searchsorted(self.day, first, side='left')
+        hi = np.searchsorted(self.day, last, side='right')
+        return first, last, lo, hi
+
+    def daily(self, start, end):
+        """
+        Per-day arrays for start..end ('YYYY-MM-DD', inclusive), index 0 = start:
+        one float64 array per macro plus an int 'meal_count' array
+        """
+        first, last, lo, hi = self._bounds(start, end)
+        span = max(last - first + 1, 0)
+        offsets = self.day[lo:hi] - first
+        result = {k: np.bincount(offsets, weights=self.columns[k][lo:hi], minlength=span) for k in MACROS}
+        result['meal_count'] = np.bincount(offsets, minlength=span)
+        return result
+
+    def rows(self, start, end):
+        """The records dated start..end, in (day, minute) order"""
+        _, _, lo, hi = self._bounds(start, end)
+        return self.records[lo:hi]
+
+    def totals(self, start, end):
+        """{macro: total, 'meal_count': n} over start..end"""
+        _, _, lo, hi = self._bounds(start, end)
+        result = {k: as_number(self.columns[k][lo:hi].sum(dtype=np.float64)) for k in MACROS}
+        result['meal_count'] = int(hi - lo)
+        return result
+
+
+_frames = OrderedDict()  # key -> (stamp, MealFrame)
+_frames_lock = threading.Lock()
+
+
+def cached_frame(key, stamp, records):
+    """
+    MealFrame of records, reused while stamp (e.g. file mtime and size) is
+    unchanged. records may be a zero-argument callable returning them, called
+    only when the frame has to be built.
+    """
+    with _frames_lock:
+        entry = _frames.get(key)
+        if entry is not None and stamp is not None and entry[0] == stamp:
+            _frames.move_to_end(key)
+            return entry[1]
+    frame = MealFrame(records() if callable(records) else records)
+    if stamp is not None:
+        with _frames_lock:
+            _frames[key] = (stamp, frame)
+            _frames.move_to_end(key)
+            while len(_frames) > FRAME_CACHE_ENTRIES:
+                _frames.popitem(last=False)
+    return frame
+
+
+def file_stamp(path):
+    """(mtime_ns, size) of path, or None if it doesn't exist"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Meal Date Index for Lean
+Keeps a user's meals ordered by (day ordinal, time) so date-range reads are
+two bisects and a slice - O(log n + k) - instead of a scan of every meal
+comparing 'YYYY-MM-DD' strings.
+
+The index is maintained incrementally (insert / remove) by the document
+cache in user_storage.py and rebuilt only when a full document is saved.
+
+Every meal carries a stable 'id' assigned when it is first stored, and the
+index keeps an id -> record map so meals can be addressed without positions.
+"""
+
+import uuid
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+MEAL_ID_KEY = 'id'
+
+
+def new_meal_id():
+    return uuid.uuid4().hex[:12]
+
+
+def assign_meal_ids(meals):
+    """
+    Give every meal without an id a new one (backfill for older documents).
+    Records are replaced rather than mutated, since cached documents share them.
+    Returns how many ids were assigned.
+    """
+    assigned = 0
+    for i, meal in enumerate(meals):
+        if not meal.get(MEAL_ID_KEY):
+            meals[i] = {**meal, MEAL_ID_KEY: new_meal_id()}
+            assigned += 1
+    return assigned
+
+
+def day_ordinal(day):
+    """'YYYY-MM-DD' -> proleptic Gregorian ordinal (0 for missing/malformed dates)"""
+    try:
+        return date.fromisoformat(day).toordinal()
+    except (TypeError, ValueError):
+        return 0
+
+
+def meal_key(meal):
+    return (day_ordinal(meal.get('date')), meal.get('time') or '00:00')
+
+
+class MealDateIndex:
+    """
+    Meals sorted by (day ordinal, time), with parallel key list for bisect,
+    plus an id -> record map. Ties keep insertion order, matching the stable
+    sort the storage engines use.
+    Treat a published index as read-only: copy() before inserting/removing.
+    """
+
+    def __init__(self, meals=()):
+        pairs = sorted(((meal_key(m), m) for m in meals), key=lambda p: p[0])
+        self.keys = [k for k, _ in pairs]
+        self.meals = [m for _, m in pairs]
+        self.by_id = {m[MEAL_ID_KEY]: m for m in self.meals if m.get(MEAL_ID_KEY)}
+
+    def copy(self):
+        index = MealDateIndex()
+        index.keys = list(self.keys)
+        index.meals = list(self.meals)
+        index.by_id = dict(self.by_id)
+        return index
+
+    def get(self, meal_id):
+        return self.by_id.get(meal_id)
+
+    def __len__(self):
+        return len(self.meals)
+
+    def insert(self, meal):
+        """Insert after any meals with the same date and time; returns the position"""
+        key = meal_key(meal)
+        pos = bisect_right(self.keys, key)
+        self.keys.insert(pos, key)
+        self.meals.insert(pos, meal)
+        if meal.get(MEAL_ID_KEY):
+            self.by_id[meal[MEAL_ID_KEY]] = meal
+        return pos
+
+    def remove(self, meal):
+        """Remove one occurrence of meal (same object if present, else an equal one)"""
+        key = meal_key(meal)
+        lo = bisect_left(self.keys, key)
+        hi = bisect_right(self.keys, key, lo)
+        candidates = range(lo, hi)
+        pos = next((i for i in candidates if self.meals[i] is meal), None)
+        if pos is None:
+            pos = next((i for i in candidates if self.meals[i] == meal), None)
+        if pos is None:
+            return False
+        del self.keys[pos]
+        removed = self.meals.pop(pos)
+        if self.by_id.get(removed.get(MEAL_ID_KEY)) is removed:
+            del self.by_id[removed[MEAL_ID_KEY]]
+        return True
+
+    def between(self, start=None, end=None):
+        """Meals with start <= date <= end ('YYYY-MM-DD', either bound optional), in order"""
+        lo = 0 if start is None else bisect_left(self.keys, (day_ordinal(start),))
+        hi = len(self.keys) if end is None else bisect_left(self.keys, (day_ordinal(end) + 1,), lo)
+        return self.meals[lo:hi]
@@ -5,9 +5,12 @@ Test mode integration for Pro subscriptions
 """
 
 import os
-import json
 from datetime import datetime, timedelta
 
+import json_codec
+
+from atomic_io import atomic_write_json
+
 # Stripe client - lazy load
 _stripe = None
 
@@ -38,13 +41,12 @@ def load_subscriptions():
     """Load subscription data"""
     if not os.path.exists(SUBSCRIPTION_FILE):
         return {'users': {}}
-    with open(SUBSCRIPTION_FILE) as f:
-        return json.load(f)
+    with open(SUBSCRIPTION_FILE, 'rb') as f:
+        return json_codec.load(f)
 
 def save_subscriptions(data):
     """Save subscription data"""
-    with open(SUBSCRIPTION_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+    atomic_write_json(SUBSCRIPTION_FILE, data)
 
 def get_user_tier(user_id):
     """
@@ -84,10 +86,9 @@ def check_usage_limit(user_id):
     
     # Count this month's meals
     from datetime import datetime
-    import json
     
-    with open('fitness_data.json') as f:
-        data = json.load(f)
+    with open('fitness_data.json', 'rb') as f:
+        data = json_codec.load(f)
     
     current_month = datetime.now().strftime('%Y-%m')
     user_meals = [
@@ -10,13 +10,11 @@ import os
 import base64
 from openai import OpenAI
 
+from vision_cache import vision_cache
+
 # Configure OpenAI
 client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
-def encode_image(image_path):
-    """Encode image to base64"""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+MODEL = "gpt-4o"
 
 def analyze_food_image(image_path):
     """
@@ -29,8 +27,20 @@ def analyze_food_image(image_path):
         dict: Nutritional information
     """
     try:
+        with open(image_path, "rb") as image_file:
+            image_bytes = image_file.read()
+        
+        # Same photo analyzed before: no API call
+        cached = vision_cache.get(image_bytes, MODEL)
+        if cached is not None:
+            return {
+                'success': True,
+                'data': cached,
+                'cached': True
+            }
+        
         # Encode image
-        base64_image = encode_image(image_path)
+        base64_image = base64.b64encode(image_bytes).decode('utf-8')
         
         # Detailed analysis prompt
         prompt = """Analyze this food image and provide detailed macro estimates.
@@ -56,7 +66,7 @@ Be conservative with portions if uncertain. Provide your best estimate based on
 Return ONLY the JSON object, nothing else."""
 
         response = client.chat.completions.create(
-            model="gpt-4o",
+            model=MODEL,
             messages=[
                 {
                     "role": "user",
@@ -86,6 +96,7 @@ Return ONLY the JSON object, nothing else."""
                 text = text[4:].strip()
         
         data = json.loads(text)
+        vision_cache.put(image_bytes, MODEL, data)
         
         return {
             'success': True,
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Range Aggregates for Lean
+Macro totals for any date window grouped by day, ISO week or month, served
+by /api/aggregate (and the /api/history, /api/week, /api/last_14_days
+wrappers).
+
+Day buckets are read straight from the per-day rollups (daily_rollups.py).
+Week and month buckets are range sums over an AggregateIndex: one Fenwick
+tree per metric over day ordinals, so a bucket costs O(log n) however many
+days or meals it spans - a multi-year log grouped by month is a few dozen
+lookups. The document cache keeps one index per user and updates it per
+changed day on meal writes.
+"""
+
+from datetime import date, timedelta
+
+from daily_rollups import METRICS, empty_day
+from meal_index import day_ordinal
+
+GROUPS = ('day', 'week', 'month')
+COUNTS = ('meal_count', 'days_logged')
+
+
+def _zeros():
+    return dict.fromkeys(METRICS + COUNTS, 0)
+
+
+def _day_values(t):
+    values = {k: t[k] for k in METRICS + ('meal_count',)}
+    values['days_logged'] = 1
+    return values
+
+
+class AggregateIndex:
+    """Fenwick trees (1-indexed) over day ordinals base, base+1, ... for every metric"""
+
+    def __init__(self, totals):
+        days = {o: t for o, t in ((day_ordinal(d), t) for d, t in totals.items()) if o}
+        self.base = min(days) if days else 0
+        size = max(days) - self.base + 1 if days else 0
+        self.trees = {}
+        for key in METRICS + COUNTS:
+            tree = [0] * (size + 1)
+            for ordinal, t in days.items():
+                tree[ordinal - self.base + 1] = _day_values(t)[key]
+            for i in range(1, size + 1):
+                parent = i + (i & -i)
+                if parent <= size:
+                    tree[parent] += tree[i]
+            self.trees[key] = tree
+
+    def copy(self):
+        index = AggregateIndex.__new__(AggregateIndex)
+        index.base = self.base
+        index.trees = {k: list(v) for k, v in self.trees.items()}
+        return index
+
+    def _size(self):
+        return len(self.trees['meal_count']) - 1
+
+    def _prefix(self, tree, i):
+        total = 0
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def _grow(self, size):
+        """Extend every tree to size slots (new days empty), O(log n) per slot"""
+        for tree in self.trees.values():
+            for i in range(len(tree), size + 1):
+                tree.append(self._prefix(tree, i - 1) - self._prefix(tree, i - (i & -i)))
+
+    def sum(self, first, last):
+        """Totals over the days first..last (ordinals, inclusive)"""
+        lo = max(first - self.base + 1, 1)
+        hi = min(last - self.base + 1, self._size())
+        if not self.base or lo > hi:
+            return _zeros()
+        return {k: self._prefix(tree, hi) - self._prefix(tree, lo - 1) for k, tree in self.trees.items()}
+
+    def update_day(self, day, totals):
+        """Re-read one day from the rollups after its meals changed"""
+        ordinal = day_ordinal(day)
+        if not ordinal:
+            return
+        if not self.base or ordinal < self.base:
+            self.__init__(totals)  # earlier than anything indexed: rebuild
+            return
+        i = ordinal - self.base + 1
+        if i > self._size():
+            self._grow(i)
+        t = totals.get(day)
+        new = _day_values(t) if t else _zeros()
+        old = self.sum(ordinal, ordinal)
+        for key, tree in self.trees.items():
+            delta = new[key] - old[key]
+            if delta:
+                j = i
+                while j < len(tree):
+                    tree[j] += delta
+                    j += j & -j
+
+
+def buckets(start, end, group):
+    """Calendar buckets (label, first day, last day) covering start..end (date objects), clipped to it"""
+    out = []
+    day = start
+    while day <= end:
+        if group == 'day':
+            label, last = day.isoformat(), day
+        elif group == 'week':
+            year, week, weekday = day.isocalendar()
+            label, last = f'{year}-W{week:02d}', day + timedelta(days=7 - weekday)
+        else:
+            label = day.strftime('%Y-%m')
+            last = (day.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+        last = min(last, end)
+        out.append((label, day, last))
+        day = last + timedelta(days=1)
+    return out
+
+
+def aggregate(totals, start, end, group='day', index=None):
+    """
+    [{'label', 'start', 'end', calories, protein, carbs, fat, meal_count, days_logged}]
+    for every bucket of start..end ('YYYY-MM-DD'), oldest first. Week/month
+    buckets use index (an AggregateIndex over totals) when given, else sum
+    the window's days from totals.
+    """
+    first, last = date.fromisoformat(start), date.fromisoformat(end)
+    result = []
+    for label, lo, hi in buckets(first, last, group):
+        if group == 'day':
+            t = totals.get(label)
+            values = _day_values(t) if t else {**empty_day(), 'days_logged': 0}
+        elif index is not None:
+            values = index.sum(lo.toordinal(), hi.toordinal())
+        else:
+            values = _zeros()
+            for i in range((hi - lo).days + 1):
+                t = totals.get((lo + timedelta(days=i)).isoformat())
+                if t:
+                    for k, v in _day_values(t).items():
+                        values[k] += v
+        result.append({'label': label, 'start': lo.isoformat(), 'end': hi.isoformat(), **values})
+    return result
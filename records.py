@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Compact Records for Lean
+Slotted, read-only record types for the meals, weight entries and progress
+photos held in the per-process document cache (LEAN_USER_CACHE_COMPACT=1,
+see user_storage.UserDocCache).
+
+A parsed JSON record is a dict with a hash table sized for its keys plus a
+fresh str for every date and time. A record keeps one slot per known field
+instead: 'YYYY-MM-DD' dates are stored as day ordinals and 'HH:MM' times as
+minutes of the day, and those ints (and small integer macros) are shared
+between records. The original key order is kept as a layout tuple shared by
+every record with the same keys, and unknown keys go to a per-record extra
+dict, so to_dict() gives back exactly the dict that was compacted - dates and
+times that aren't canonical strings are kept as they came.
+
+Records are Mappings (get / [] / in / items / ==), so rollups, the meal
+index and the range readers use them unchanged; user_storage expands them
+back to dicts wherever they leave the cache.
+
+Usage:
+    python benchmarks.py memory   # bytes per meal, dicts vs records
+"""
+
+from collections.abc import Mapping
+from datetime import date
+
+SHARED_INTS_MAX = 1 << 16
+
+_layouts = {}      # key tuple -> the shared instance
+_date_codes = {}   # 'YYYY-MM-DD' -> ordinal
+_date_strings = {}  # ordinal -> 'YYYY-MM-DD'
+_time_codes = {}   # 'HH:MM' -> minute of day
+_time_strings = {}  # minute of day -> 'HH:MM'
+_ints = {}
+
+
+def _shared(value):
+    """One int object per distinct value (CPython only caches -5..256)"""
+    if type(value) is not int:
+        return value
+    shared = _ints.get(value)
+    if shared is None:
+        if len(_ints) >= SHARED_INTS_MAX:
+            return value
+        shared = _ints.setdefault(value, value)
+    return shared
+
+
+def _encode_date(value):
+    """Day ordinal for a canonical 'YYYY-MM-DD' string, else None"""
+    if type(value) is not str:
+        return None
+    code = _date_codes.get(value)
+    if code is None and len(value) == 10:
+        try:
+            ordinal = date.fromisoformat(value).toordinal()
+        except ValueError:
+            return None
+        if date.fromordinal(ordinal).isoformat() != value:
+            return None
+        code = _date_codes.setdefault(value, _shared(ordinal))
+        _date_strings.setdefault(code, value)
+    return code
+
+
+def _decode_date(code):
+    value = _date_strings.get(code)
+    if value is None:
+        value = _date_strings.setdefault(code, date.fromordinal(code).isoformat())
+    return value
+
+
+def _encode_time(value):
+    """Minute of day for a canonical 'HH:MM' string, else None"""
+    if type(value) is not str:
+        return None
+    code = _time_codes.get(value)
+    if code is None and len(value) == 5 and value[2] == ':':
+        hours, minutes = value[:2], value[3:]
+        if not (hours.isascii() and hours.isdigit() and minutes.isascii() and minutes.isdigit()):
+            return None
+        if int(hours) > 23 or int(minutes) > 59:
+            return None
+        code = _time_codes.setdefault(value, _shared(int(hours) * 60 + int(minutes)))
+        _time_strings.setdefault(code, value)
+    return code
+
+
+def _decode_time(code):
+    value = _time_strings.get(code)
+    if value is None:
+        value = _time_strings.setdefault(code, f'{code // 60:02d}:{code % 60:02d}')
+    return value
+
+
+_MISSING = object()
+_ENCODERS = {'date': _encode_date, 'time': _encode_time}
+_DECODERS = {'date': _decode_date, 'time': _decode_time}
+
+
+class Record(Mapping):
+    """Read-only mapping over named slots; subclasses list their known fields"""
+
+    __slots__ = ('_layout', '_extra')
+    FIELDS = ()
+    _field_set = frozenset()
+
+    @classmethod
+    def from_dict(cls, entry):
+        record = cls.__new__(cls)
+        fields = cls._field_set
+        extra = None
+        for key, value in entry.items():
+            if key in fields:
+                encode = _ENCODERS.get(key)
+                if encode is None:
+                    setattr(record, key, _shared(value))
+                    continue
+                code = encode(value)
+                if code is not None:
+                    setattr(record, key, code)
+                    continue
+            # Unknown keys, and dates/times that aren't canonical strings
+            if extra is None:
+                extra = {}
+            extra[key] = value
+        layout = tuple(entry)
+        record._layout = _layouts.setdefault(layout, layout)
+        record._extra = extra
+        return record
+
+    def __getitem__(self, key):
+        if key in self._field_set:
+            try:
+                value = getattr(self, key)
+            except AttributeError:
+                pass
+            else:
+                decode = _DECODERS.get(key)
+                return decode(value) if decode else value
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in self._layout
+
+    def __iter__(self):
+        return iter(self._layout)
+
+    def __len__(self):
+        return len(self._layout)
+
+    def to_dict(self):
+        fields, extra = self._field_set, self._extra
+        result = {}
+        for key in self._layout:
+            value = getattr(self, key, _MISSING) if key in fields else _MISSING
+            if value is _MISSING:
+                result[key] = extra[key]
+            elif key in _DECODERS:
+                result[key] = _DECODERS[key](value)
+            else:
+                result[key] = value
+        return result
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._field_set = frozenset(cls.FIELDS)
+
+
+class Meal(Record):
+    FIELDS = ('id', 'date', 'time', 'description', 'calories', 'protein', 'carbs', 'fat')
+    __slots__ = FIELDS
+
+
+class WeightEntry(Record):
+    FIELDS = ('date', 'time', 'weight', 'notes')
+    __slots__ = FIELDS
+
+
+class ProgressPhoto(Record):
+    FIELDS = ('date', 'weight', 'waist', 'photo_url', 'notes')
+    __slots__ = FIELDS
+
+
+# Document collections held as records in a compact cache
+RECORD_TYPES = {'meals': Meal, 'weight_history': WeightEntry, 'progress_photos': ProgressPhoto}
+
+
+def compact(key, entry):
+    """entry as a record if key names a record collection and entry is a plain dict"""
+    cls = RECORD_TYPES.get(key)
+    return cls.from_dict(entry) if cls is not None and type(entry) is dict else entry
+
+
+def expand(entry):
+    """A plain dict for a record, anything else as is"""
+    return entry.to_dict() if isinstance(entry, Record) else entry
+
+
+def compact_doc(data):
+    """Copy of a user document with its meals, weights and photos as records"""
+    doc = {}
+    for key, value in data.items():
+        if isinstance(value, list):
+            value = [compact(key, e) for e in value] if key in RECORD_TYPES else list(value)
+        elif isinstance(value, dict):
+            value = dict(value)
+        doc[key] = value
+    return doc
+
+
+def expand_doc(data):
+    """Copy of a (possibly compact) user document with plain dict records, safe to mutate and save"""
+    doc = {}
+    for key, value in data.items():
+        if isinstance(value, list):
+            value = [expand(e) for e in value] if key in RECORD_TYPES else list(value)
+        elif isinstance(value, dict):
+            value = dict(value)
+        doc[key] = value
+    return doc
@@ -4,24 +4,25 @@ Referral System for Lean
 "Give 1 month Pro, get 1 month Pro" mechanic
 """
 
-import json
 import os
 import secrets
 from datetime import datetime, timedelta
 
+import json_codec
+from atomic_io import atomic_write_json
+
 REFERRAL_FILE = 'referral_data.json'
 
 def load_referrals():
     """Load referral data"""
     if not os.path.exists(REFERRAL_FILE):
         return {'users': {}, 'referrals': []}
-    with open(REFERRAL_FILE) as f:
-        return json.load(f)
+    with open(REFERRAL_FILE, 'rb') as f:
+        return json_codec.load(f)
 
 def save_referrals(data):
     """Save referral data"""
-    with open(REFERRAL_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+    atomic_write_json(REFERRAL_FILE, data)
 
 def generate_referral_code(user_id):
     """Generate unique referral code for user"""
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Logging Streaks for Lean
+Per-user streak state kept in the user document under 'streak', next to the
+per-day rollups it is derived from:
+
+    {'run_start': 739650, 'last_day': 739662, 'longest': 21, 'days': 180}
+
+run_start/last_day are day ordinals of the run ending at the latest logged
+day, longest is the longest run ever, days is how many days have meals
+(checked against the rollup table to catch documents edited behind its back).
+
+Logging a meal on a new day updates the state in O(1) (O(run) for a
+back-filled day); only a day disappearing from the current or longest run
+triggers a rebuild from the rollup keys.
+"""
+
+from datetime import date, timedelta
+
+from meal_index import day_ordinal
+
+STREAK_KEY = 'streak'
+
+
+def _logged(totals, ordinal):
+    return date.fromordinal(ordinal).isoformat() in totals
+
+
+def build_streak(totals):
+    """Streak state from scratch, given the rollup table (any {day: ...} mapping)"""
+    state = {'run_start': 0, 'last_day': 0, 'longest': 0, 'days': len(totals)}
+    for ordinal in sorted(o for o in map(day_ordinal, totals) if o):
+        if ordinal != state['last_day'] + 1:
+            state['run_start'] = ordinal
+        state['last_day'] = ordinal
+        state['longest'] = max(state['longest'], ordinal - state['run_start'] + 1)
+    return state
+
+
+def ensure_streak(data, totals):
+    """Return data's streak state, rebuilding it when missing or out of step with totals"""
+    state = data.get(STREAK_KEY)
+    if not isinstance(state, dict) or state.get('days') != len(totals):
+        state = data[STREAK_KEY] = build_streak(totals)
+    return state
+
+
+def day_added(state, totals, day):
+    """day just got its first meal (totals already include it)"""
+    state['days'] += 1
+    ordinal = day_ordinal(day)
+    if not ordinal:
+        return
+    start, last = state['run_start'], state['last_day']
+    if last and ordinal == last + 1:
+        state['last_day'] = ordinal
+        length = ordinal - start + 1
+    elif ordinal > last:
+        state['run_start'] = state['last_day'] = ordinal
+        length = 1
+    else:
+        # Back-filled day: measure the run it joins, which may reach the current one
+        first = end = ordinal
+        while _logged(totals, first - 1):
+            first -= 1
+        while _logged(totals, end + 1):
+            end += 1
+        if end == last:
+            state['run_start'] = first
+        length = end - first + 1
+    state['longest'] = max(state['longest'], length)
+
+
+def day_removed(state, totals, day):
+    """day just lost its last meal (totals no longer include it)"""
+    state['days'] -= 1
+    ordinal = day_ordinal(day)
+    if not ordinal:
+        return
+    if state['run_start'] <= ordinal <= state['last_day']:
+        state.update(build_streak(totals))
+        return
+    first = end = ordinal
+    while _logged(totals, first - 1):
+        first -= 1
+    while _logged(totals, end + 1):
+        end += 1
+    if end - first + 1 >= state['longest']:
+        state.update(build_streak(totals))  # may have been the longest run
+
+
+def streak_summary(state, totals, today):
+    """
+    {'current', 'longest', 'logged_today'} as of today ('YYYY-MM-DD').
+    The current run counts while the latest logged day's run includes today
+    or yesterday (one day of grace).
+    """
+    yesterday = (date.fromisoformat(today) - timedelta(days=1)).isoformat()
+    logged_today = today in totals
+    current = 0
+    if state['last_day'] and (logged_today or yesterday in totals):
+        current = state['last_day'] - state['run_start'] + 1
+    return {'current': current, 'longest': state['longest'], 'logged_today': logged_today}
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Tests for crash-safe JSON writes and group commit (atomic_io.py)
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+
+from atomic_io import GroupCommitWriter, atomic_write_json
+
+
+def test_atomic_write_replaces_file():
+    """Each durability mode leaves a complete file and no temp files"""
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, 'doc.json')
+    for mode in ('always', 'batch', 'none'):
+        atomic_write_json(path, {'mode': mode}, durability=mode)
+        with open(path) as f:
+            assert json.load(f) == {'mode': mode}
+    assert os.listdir(tmp) == ['doc.json']
+
+
+def test_group_commit_coalesces_concurrent_writes():
+    """Writes to one file inside the window share a single commit"""
+    path = os.path.join(tempfile.mkdtemp(), 'doc.json')
+    writer = GroupCommitWriter(window_ms=50)
+    barrier = threading.Barrier(8)
+
+    def write(i):
+        barrier.wait()
+        writer.write(path, {'writer': i}, json.dumps)
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    stats = writer.stats()
+    assert stats['writes'] == 8
+    assert stats['commits'] < 8
+    with open(path) as f:
+        assert 'writer' in json.load(f)
+
+
+def test_group_commit_reports_errors_to_every_writer():
+    """A failed commit raises in the leader and in every coalesced writer"""
+    path = os.path.join(tempfile.mkdtemp(), 'missing-dir', 'doc.json')
+    writer = GroupCommitWriter(window_ms=20)
+    errors = []
+
+    def write():
+        try:
+            writer.write(path, {}, json.dumps)
+        except OSError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(errors) == 3
+
+
+def main():
+    tests = [test_atomic_write_replaces_file, test_group_commit_coalesces_concurrent_writes,
+             test_group_commit_reports_errors_to_every_writer]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Tests for compressed user documents (compressed_io.py) in the json and journal engines
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# Set before the project imports so USER_DATA_DIR never resolves to the real data tree
+os.environ.setdefault('LEAN_USER_DATA_DIR', tempfile.mkdtemp())
+
+import compressed_io
+from user_storage import CachedUserStore, JSONUserStore, JournalUserStore, VERSION_KEY, recompress_documents
+
+PHOTO = 'data:image/jpeg;base64,' + 'QUJDRA==' * 4000
+
+
+def _doc(meals=50):
+    return {'meals': [{'date': f'2026-01-{1 + i % 28:02d}', 'time': '12:00', 'description': f'meal {i}',
+                       'calories': 400 + i} for i in range(meals)],
+            'progress_photos': [{'date': '2026-01-05', 'photo_url': PHOTO, 'notes': ''}], 'settings': {}}
+
+
+def _files(store):
+    """Every file the store keeps, across its shard directories"""
+    return sorted(f for _, _, files in os.walk(store.data_dir) for f in files if not f.endswith(('.lock', '.idx')))
+
+
+def test_large_documents_are_compressed_and_read_back():
+    for engine in (JSONUserStore, JournalUserStore):
+        store = engine(tempfile.mkdtemp(), compression='gzip', compress_min_bytes=16 * 1024)
+        store.save('small', {'meals': [], 'settings': {}})
+        store.save('big', _doc())
+        names = _files(store)
+        assert 'small.json' in names and 'big.json.gz' in names and 'big.json' not in names, names
+        assert os.path.getsize(store.path('big') + '.gz') < len(PHOTO) / 4
+        assert store.uids() == ['big', 'small'] and store.exists('big')
+        assert store.load('big')['progress_photos'][0]['photo_url'] == PHOTO
+        assert store.size_hint('big') > len(PHOTO)  # cache accounting uses the decoded size
+
+        # Shrinking below the threshold moves it back to plain JSON
+        small = store.load('big')
+        small['progress_photos'] = []
+        store.save('big', small, expected_version=small[VERSION_KEY])
+        assert 'big.json' in _files(store) and 'big.json.gz' not in _files(store)
+        assert sorted(m['description'] for m in store.load('big')['meals']) == \
+            sorted(m['description'] for m in _doc()['meals'])
+
+
+def test_journal_appends_on_compressed_snapshot():
+    store = CachedUserStore(JournalUserStore(tempfile.mkdtemp(), compression='gzip', compress_min_bytes=0))
+    store.save('u1', _doc(5))
+    for i in range(3):
+        store.append_meal('u1', {'date': '2026-02-01', 'time': f'0{i}:00', 'calories': 100})
+    assert 'u1.json.gz' in _files(store.inner) and 'u1.jsonl' in _files(store.inner)
+    fresh = JournalUserStore(store.inner.data_dir, compression='gzip', compress_min_bytes=0)
+    assert len(fresh.load('u1')['meals']) == 8 == len(store.load('u1')['meals'])
+    store.inner.compact('u1')
+    assert len(fresh.load('u1')['meals']) == 8
+
+
+def test_newest_variant_wins():
+    """A crash between writing the new variant and removing the old leaves both - the newer is the document"""
+    store = JSONUserStore(tempfile.mkdtemp(), compression='none')
+    store.save('u1', {'meals': [], 'settings': {'v': 'old'}})
+    base = store.path('u1')
+    time.sleep(0.01)
+    path, payload = compressed_io.encode(base, b'{"settings": {"v": "new"}, "meals": []}', 'gzip', 0)
+    with open(path, 'wb') as f:
+        f.write(payload)
+    assert store.load('u1')['settings'] == {'v': 'new'} and store.uids() == ['u1']
+
+
+def test_recompress_converts_existing_files():
+    data_dir, journal_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    JSONUserStore(data_dir, compression='none').save('a', _doc())
+    journal = JournalUserStore(journal_dir, compression='none')
+    journal.save('b', _doc())
+    journal.append_meal('b', {'date': '2026-02-01', 'time': '09:00', 'calories': 100})
+    versions = {'a': JSONUserStore(data_dir).load('a')[VERSION_KEY], 'b': journal.load('b')[VERSION_KEY]}
+
+    store = JSONUserStore(data_dir, compression='gzip', compress_min_bytes=16 * 1024)
+    assert recompress_documents(store) == 1 and recompress_documents(store) == 0
+    assert _files(store) == ['a.json.gz'] and store.load('a')[VERSION_KEY] == versions['a']
+
+    store = JournalUserStore(journal_dir, compression='gzip', compress_min_bytes=16 * 1024)
+    assert recompress_documents(store) == 1
+    assert 'b.json.gz' in _files(store)
+    loaded = store.load('b')
+    assert loaded[VERSION_KEY] == versions['b'] and len(loaded['meals']) == 51
+
+
+def main():
+    tests = [test_large_documents_are_compressed_and_read_back, test_journal_appends_on_compressed_snapshot,
+             test_newest_variant_wins, test_recompress_converts_existing_files]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
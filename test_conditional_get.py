@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Tests for ETag / If-None-Match on read endpoints (app_pro.conditional_get)
+A poll with nothing new must be answered 304 without reading the user
+document; any write, other parameters or another user must miss.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import app_pro
+from job_queue import JobQueue
+from user_storage import CachedUserStore, JSONUserStore
+
+ENDPOINTS = ('/api/today', '/api/meals?days=30', '/api/history?days=14', '/api/streak', '/api/week',
+             '/api/meal_history', '/api/progress_card', '/api/weight/history', '/api/dashboard_bundle')
+
+
+_saved = {}
+
+
+def setup_module():
+    """Point app_pro at a fresh store and job directory under a temp dir"""
+    global TMP
+    TMP = tempfile.mkdtemp()
+    _saved.update(store=app_pro.store, jobs=app_pro.jobs)
+    app_pro.store = CachedUserStore(JSONUserStore(TMP))
+    app_pro.jobs = JobQueue(os.path.join(TMP, '.jobs'), on_finish=app_pro._publish_job)
+
+
+def teardown_module():
+    app_pro.store, app_pro.jobs = _saved['store'], _saved['jobs']
+    shutil.rmtree(TMP, ignore_errors=True)
+
+
+def _client(uid):
+    client = app_pro.app.test_client()
+    client.set_cookie('lean_uid', uid)
+    return client
+
+
+def _reads():
+    stats = app_pro.store.cache_stats()
+    return stats['hits'] + stats['misses'] + stats['partial_reads']
+
+
+def test_unchanged_poll_is_304_without_reading():
+    client = _client('etag-user')
+    client.post('/api/add_meal', json={'description': 'eggs', 'calories': 300, 'protein': 25})
+    for endpoint in ENDPOINTS:
+        first = client.get(endpoint)
+        etag = first.headers['ETag']
+        assert first.status_code == 200 and etag.startswith('W/"'), endpoint
+        assert first.headers['Cache-Control'] == 'private, no-cache'
+        reads = _reads()
+        again = client.get(endpoint, headers={'If-None-Match': etag})
+        assert again.status_code == 304 and again.data == b'' and again.headers['ETag'] == etag, endpoint
+        assert _reads() == reads, f'{endpoint} read the document for a 304'
+
+
+def test_writes_params_and_users_change_the_etag():
+    client = _client('etag-writer')
+    client.post('/api/add_meal', json={'description': 'toast', 'calories': 200, 'protein': 8})
+    before = client.get('/api/today')
+    assert client.get('/api/history?days=7').headers['ETag'] != client.get('/api/history?days=14').headers['ETag']
+
+    client.post('/api/add_meal', json={'description': 'soup', 'calories': 250, 'protein': 12})
+    after = client.get('/api/today', headers={'If-None-Match': before.headers['ETag']})
+    assert after.status_code == 200 and after.headers['ETag'] != before.headers['ETag']
+    assert after.get_json()['totals']['calories'] == before.get_json()['totals']['calories'] + 250
+
+    other = _client('etag-other')
+    other.post('/api/add_meal', json={'description': 'toast', 'calories': 200, 'protein': 8})
+    assert other.get('/api/today', headers={'If-None-Match': after.headers['ETag']}).status_code == 200
+
+
+def test_errors_and_new_users_are_not_tagged():
+    client = _client('etag-errors')
+    client.post('/api/add_meal', json={'description': 'rice', 'calories': 400, 'protein': 9})
+    bad = client.get('/api/aggregate?group=fortnight')
+    assert bad.status_code == 400 and 'ETag' not in bad.headers
+    fresh = _client('etag-fresh').get('/api/today')  # document created by this request
+    assert fresh.status_code == 200 and 'ETag' not in fresh.headers
+
+
+def test_dashboard_page_revalidates():
+    client = _client('etag-page')
+    page = client.get('/')
+    assert page.status_code == 200 and page.headers['Cache-Control'] == 'private, no-cache'
+    assert client.get('/', headers={'If-None-Match': page.headers['ETag']}).status_code == 304
+
+
+def main():
+    tests = [test_unchanged_poll_is_304_without_reading, test_writes_params_and_users_change_the_etag,
+             test_errors_and_new_users_are_not_tagged, test_dashboard_page_revalidates]
+    failed = 0
+    setup_module()
+    try:
+        for test in tests:
+            try:
+                test()
+                print(f"✅ {test.__name__}")
+            except AssertionError as e:
+                failed += 1
+                print(f"❌ {test.__name__}: {e}")
+    finally:
+        teardown_module()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
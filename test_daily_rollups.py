@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-day macro rollups (daily_rollups.py) kept by every storage engine
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+from daily_rollups import ROLLUP_KEY, add_meal, build_rollups, remove_meal, totals_between
+from user_storage import CachedUserStore, JSONUserStore, JournalUserStore, SQLiteUserStore, rebuild_rollups
+
+
+def _meal(day, time, calories, protein=10, carbs=5, fat=2):
+    return {'date': day, 'time': time, 'calories': calories, 'protein': protein, 'carbs': carbs, 'fat': fat}
+
+
+def _stores():
+    """Every engine, bare and behind the document cache"""
+    stores = []
+    for cached in (False, True):
+        tmp = tempfile.mkdtemp()
+        for inner in (JSONUserStore(tmp), JournalUserStore(f'{tmp}/journal'), SQLiteUserStore(f'{tmp}/lean.db')):
+            stores.append(CachedUserStore(inner) if cached else inner)
+    return stores
+
+
+def test_add_and_remove():
+    totals = {}
+    add_meal(totals, _meal('2026-02-01', '08:00', 300))
+    add_meal(totals, _meal('2026-02-01', '12:00', 500, carbs=None))
+    assert totals['2026-02-01'] == {'calories': 800, 'protein': 20, 'carbs': 5, 'fat': 4, 'meal_count': 2}
+
+    remove_meal(totals, _meal('2026-02-01', '08:00', 300))
+    assert totals['2026-02-01']['calories'] == 500
+    remove_meal(totals, _meal('2026-02-01', '12:00', 500, carbs=None))
+    assert totals == {}
+
+
+def test_totals_between():
+    totals = build_rollups([_meal(f'2026-02-{d:02d}', '08:00', 100 * d) for d in range(1, 29, 3)])
+    assert sorted(totals_between(totals, '2026-02-03', '2026-02-10')) == ['2026-02-04', '2026-02-07', '2026-02-10']
+    assert sorted(totals_between(totals, '2026-01-01', '2026-12-31')) == sorted(totals)
+    assert sorted(totals_between(totals, start='2026-02-25')) == ['2026-02-25', '2026-02-28']
+
+
+def test_engines_keep_rollups_on_write():
+    """Appends, deletes and full saves leave the same rollups a rebuild would"""
+    for store in _stores():
+        store.save('u1', {'meals': [_meal('2026-02-01', '08:00', 300)], 'settings': {}})
+        store.append_meal('u1', _meal('2026-02-01', '19:00', 700))
+        store.append_meal('u1', _meal('2026-02-02', '12:00', 450))
+        store.delete_meal('u1', store.load('u1')['meals'][0]['id'])
+
+        doc = store.load('u1')
+        doc['meals'].append(_meal('2026-02-03', '09:00', 250))
+        store.save('u1', doc)  # ensure_rollups() catches the meal added behind its back
+
+        doc = store.load('u1')
+        assert doc[ROLLUP_KEY] == build_rollups(doc['meals']), store.name
+        assert store.daily_totals('u1', '2026-02-01', '2026-02-01') == {
+            '2026-02-01': {'calories': 700, 'protein': 10, 'carbs': 5, 'fat': 2, 'meal_count': 1}
+        }, store.name
+        assert len(store.daily_totals('u1')) == 3, store.name
+
+
+def test_legacy_documents_and_rebuild():
+    """Documents written before rollups existed get them on load; rebuild persists them"""
+    tmp = tempfile.mkdtemp()
+    store = JSONUserStore(tmp)
+    os.makedirs(os.path.dirname(store.path('old')), exist_ok=True)
+    with open(store.path('old'), 'w') as f:
+        json.dump({'meals': [_meal('2026-02-01', '08:00', 300), _meal('2026-02-01', '09:00', 200)]}, f)
+
+    assert store.daily_totals('old')['2026-02-01']['calories'] == 500
+    assert rebuild_rollups(store) == 1
+    with open(store.path('old')) as f:
+        assert json.load(f)[ROLLUP_KEY]['2026-02-01']['meal_count'] == 2
+
+
+def main():
+    tests = [test_add_and_remove, test_totals_between, test_engines_keep_rollups_on_write,
+             test_legacy_documents_and_rebuild]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
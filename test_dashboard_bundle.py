@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Tests for /api/dashboard_bundle
+Every section must be exactly what its standalone endpoint returns, from a
+single load of the user document. Runs through the Flask test client.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import app_pro
+from job_queue import JobQueue
+from user_storage import CachedUserStore, JSONUserStore
+
+ENDPOINTS = {
+    'streak': '/api/streak',
+    'today': '/api/today',
+    'meals': '/api/meals?days=30',
+    'history': '/api/history?days=14',
+    'progress_card': '/api/progress_card',
+    'progress_photos': '/api/progress_photos',
+}
+
+
+_saved = {}
+
+
+def setup_module():
+    """Point app_pro at a fresh store and job directory under a temp dir"""
+    global TMP
+    TMP = tempfile.mkdtemp()
+    _saved.update(store=app_pro.store, jobs=app_pro.jobs)
+    app_pro.store = CachedUserStore(JSONUserStore(TMP))
+    app_pro.jobs = JobQueue(os.path.join(TMP, '.jobs'), on_finish=app_pro._publish_job)
+
+
+def teardown_module():
+    app_pro.store, app_pro.jobs = _saved['store'], _saved['jobs']
+    shutil.rmtree(TMP, ignore_errors=True)
+
+
+def _client(uid):
+    client = app_pro.app.test_client()
+    client.set_cookie('lean_uid', uid)
+    return client
+
+
+def _seed(client):
+    now = datetime.now(ZoneInfo("America/Chicago"))
+    client.post('/api/import_meals', json={'meals': [{
+        'date': (now - timedelta(days=i % 45)).strftime('%Y-%m-%d'), 'time': f'{8 + i % 12:02d}:00',
+        'description': f'meal {i}', 'calories': 300 + i, 'protein': 20, 'carbs': 30, 'fat': 10,
+    } for i in range(120)]})
+    client.post('/api/add_meal', json={'description': 'lunch', 'calories': 500, 'protein': 40})
+    client.post('/api/weight', json={'weight': 181.0})
+    client.post('/api/weight', json={'weight': 180.2})
+
+
+def test_bundle_matches_standalone_endpoints():
+    client = _client('bundle-user')
+    _seed(client)
+    bundle = client.get('/api/dashboard_bundle').get_json()
+    assert set(bundle) == set(ENDPOINTS)
+    for section, endpoint in ENDPOINTS.items():
+        assert bundle[section] == client.get(endpoint).get_json(), section
+
+
+def test_bundle_sections_and_windows():
+    client = _client('sections-user')
+    _seed(client)
+    bundle = client.get('/api/dashboard_bundle?sections=today,history&history_days=30').get_json()
+    assert set(bundle) == {'today', 'history'}
+    assert bundle['history'] == client.get('/api/history?days=30').get_json()
+
+    week = client.get('/api/dashboard_bundle?sections=meals&days=7').get_json()['meals']
+    assert week == client.get('/api/meals?days=7').get_json()
+
+    response = client.get('/api/dashboard_bundle?sections=today,bogus')
+    assert response.status_code == 400 and 'bogus' in response.get_json()['error']
+
+
+def test_bundle_for_new_user():
+    bundle = _client('brand-new-user').get('/api/dashboard_bundle').get_json()
+    assert bundle['streak'] == {'current': 0, 'longest': 0, 'logged_today': False}
+    assert bundle['meals'] == {'meals': [], 'count': 0}
+    assert bundle['today']['totals']['calories'] == 0
+
+
+def main():
+    tests = [test_bundle_matches_standalone_endpoints, test_bundle_sections_and_windows, test_bundle_for_new_user]
+    failed = 0
+    setup_module()
+    try:
+        for test in tests:
+            try:
+                test()
+                print(f"✅ {test.__name__}")
+            except AssertionError as e:
+                failed += 1
+                print(f"❌ {test.__name__}: {e}")
+    finally:
+        teardown_module()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Tests for the prefix-sum deficit ledger (deficit_ledger.py) behind /api/goal_projection
+"""
+
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+
+from daily_rollups import add_meal, remove_meal
+from deficit_ledger import DeficitLedger
+from user_storage import CachedUserStore, JSONUserStore, JournalUserStore, SQLiteUserStore
+
+BASE = date(2026, 1, 1)
+
+
+def _reference(totals, start, today, goal):
+    """The original goal_projection loop: every calendar day from start to today"""
+    start, today = date.fromisoformat(start), date.fromisoformat(today)
+    total_deficit = days_logged = days_under_target = logging_streak = current_streak = 0
+    last_logged_date = None
+    for i in range((today - start).days + 1):
+        day = start + timedelta(days=i)
+        if day.isoformat() in totals:
+            day_deficit = goal - totals[day.isoformat()]['calories']
+            total_deficit += day_deficit
+            days_logged += 1
+            if day_deficit > 0:
+                days_under_target += 1
+            if last_logged_date and (day - last_logged_date).days == 1:
+                current_streak += 1
+            else:
+                current_streak = 1
+            logging_streak = max(logging_streak, current_streak)
+            last_logged_date = day
+    return {'total_deficit': total_deficit, 'days_logged': days_logged, 'days_under_target': days_under_target,
+            'logging_streak': logging_streak, 'current_streak': current_streak}
+
+
+def _random_meal(rng):
+    return {'date': (BASE + timedelta(days=rng.randrange(60))).isoformat(), 'time': '12:00',
+            'calories': rng.randrange(300, 1500)}
+
+
+def test_summary_matches_daily_walk():
+    """Built and incrementally updated ledgers answer exactly like the per-day loop"""
+    for seed in range(20):
+        rng = random.Random(seed)
+        start = (BASE + timedelta(days=rng.randrange(10))).isoformat()
+        totals, meals = {}, []
+        ledger = DeficitLedger(totals, start, 2000)
+        for step in range(150):
+            if meals and rng.random() < 0.4:
+                meal = meals.pop(rng.randrange(len(meals)))
+                remove_meal(totals, meal)
+            else:
+                meal = _random_meal(rng)
+                meals.append(meal)
+                add_meal(totals, meal)
+            ledger = ledger.copy()
+            ledger.update_day(meal['date'], totals)
+            assert ledger.__dict__ == DeficitLedger(totals, start, 2000).__dict__, (seed, step)
+            for offset in (-5, 0, 20, 45, 70):
+                today = (BASE + timedelta(days=offset)).isoformat()
+                assert ledger.summary(today) == _reference(totals, start, today, 2000), (seed, step, today)
+
+
+def test_goal_change_builds_new_ledger():
+    totals = {'2026-01-02': {'calories': 1800, 'meal_count': 1}, '2026-01-03': {'calories': 2100, 'meal_count': 1}}
+    assert DeficitLedger(totals, '2026-01-01', 2000).summary('2026-01-05')['days_under_target'] == 1
+    assert DeficitLedger(totals, '2026-01-01', 2200).summary('2026-01-05') == \
+        _reference(totals, '2026-01-01', '2026-01-05', 2200)
+
+
+def test_cached_ledger_follows_writes():
+    """The cached ledger is carried across appends, edits and deletes on every engine"""
+    rng = random.Random(9)
+    tmp = tempfile.mkdtemp()
+    for inner in (JSONUserStore(tmp), JournalUserStore(f'{tmp}/journal'), SQLiteUserStore(f'{tmp}/lean.db')):
+        store = CachedUserStore(inner)
+        store.save('u1', {'meals': [_random_meal(rng) for _ in range(20)], 'settings': {}})
+        store.deficit_ledger('u1', '2026-01-05', 2000)
+        for step in range(30):
+            meals = store.load('u1')['meals']
+            roll = rng.random()
+            if roll < 0.2:
+                store.delete_meal('u1', rng.choice(meals)['id'])
+            elif roll < 0.4:
+                store.update_meal('u1', rng.choice(meals)['id'], {'date': _random_meal(rng)['date'], 'calories': 999})
+            else:
+                store.append_meal('u1', _random_meal(rng))
+            totals = inner.daily_totals('u1')
+            assert store.deficit_ledger('u1', '2026-01-05', 2000).summary('2026-02-20') == \
+                _reference(totals, '2026-01-05', '2026-02-20', 2000), (inner.name, step)
+
+
+def main():
+    tests = [test_summary_matches_daily_walk, test_goal_change_builds_new_ledger, test_cached_ledger_follows_writes]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
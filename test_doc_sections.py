@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Tests for sectioned documents (doc_sections.py) and partial reads in the json and journal engines
+"""
+
+import os
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+
+import compressed_io
+import doc_sections
+import json_codec
+from atomic_io import write_file_atomic
+from daily_rollups import build_rollups, totals_between
+from streaks import build_streak, streak_summary
+from user_storage import CachedUserStore, JSONUserStore, JournalUserStore
+
+BASE = date(2025, 11, 1)
+
+
+def _doc(rng, meals=300):
+    def day(i):
+        return (BASE + timedelta(days=i)).isoformat()
+    return {
+        'meals': sorted(({'date': day(rng.randrange(120)), 'time': f'{rng.randrange(24):02d}:{rng.randrange(60):02d}',
+                          'description': f'meal {i}', 'calories': rng.randrange(100, 900), 'protein': 20.5}
+                         for i in range(meals)), key=lambda m: (m['date'], m['time'])),
+        'weight_history': [{'date': day(i * 3), 'time': '07:00', 'weight': 190 - i / 4} for i in range(40)],
+        'progress_photos': [{'date': day(5), 'photo_url': 'data:image/jpeg;base64,' + 'QUJD' * 500}],
+        'settings': {'daily_calorie_goal': 2100, 'name': 'Ünïcode'},
+    }
+
+
+def _ranges(rng):
+    for _ in range(12):
+        a, b = sorted(rng.randrange(-10, 130) for _ in range(2))
+        yield (BASE + timedelta(days=a)).isoformat(), (BASE + timedelta(days=b)).isoformat()
+    yield None, None
+    yield '2026-01-15', None
+    yield None, '2025-11-30'
+
+
+def test_blocks_are_the_compact_document():
+    rng = random.Random(1)
+    doc = _doc(rng)
+    split = doc_sections.split(doc)
+    assert b''.join(split.blocks) == json_codec.dumpb(doc)
+    assert list(split.layout['meals']) == ['2025-11', '2025-12', '2026-01', '2026-02']
+    assert isinstance(split.layout['settings'], int)
+    # Out-of-order months (a document written before ordered inserts) stay one block
+    assert isinstance(doc_sections.split({'meals': doc['meals'][::-1]}).layout['meals'], int)
+
+
+def test_sections_read_back_in_every_format():
+    rng = random.Random(2)
+    doc = _doc(rng)
+    formats = ['none', 'gzip'] + (['zstd'] if compressed_io.zstandard is not None else [])
+    for fmt in formats:
+        path = os.path.join(tempfile.mkdtemp(), 'u1.json')
+        doc_sections.write(path, doc_sections.split(doc), False, fmt, 0)
+        assert json_codec.loads(compressed_io.read_document(path)) == doc, fmt
+        part = doc_sections.read_sections(path, ('settings', 'meals', 'missing'), '2025-12-10', '2025-12-20')
+        assert part['settings'] == doc['settings'] and 'missing' not in part
+        assert {m['date'][:7] for m in part['meals']} == {'2025-12'}, fmt
+        tail = doc_sections.read_sections(path, ('weight_history',), latest=5)['weight_history']
+        assert 5 <= len(tail) < 40 and tail == doc['weight_history'][-len(tail):]
+        variant, st = compressed_io.resolve(path)
+        assert doc_sections.decoded_size(path, variant, st) == len(json_codec.dumpb(doc))
+
+
+def test_stale_index_is_ignored():
+    """A document rewritten without its index (or by an older version) is read whole"""
+    path = os.path.join(tempfile.mkdtemp(), 'u1.json')
+    doc = _doc(random.Random(3))
+    doc_sections.write(path, doc_sections.split(doc), False, 'none', 0)
+    assert doc_sections.is_current(path)
+    write_file_atomic(path, json_codec.dumpb({**doc, 'settings': {'daily_calorie_goal': 1}}), fsync=False)
+    assert not doc_sections.is_current(path) and doc_sections.read_sections(path, ('settings',)) is None
+
+
+def test_partial_reads_match_full_loads():
+    """Every read answered from sections matches the engine's whole-document answer"""
+    rng = random.Random(4)
+    for engine in (JSONUserStore, JournalUserStore):
+        for compression in ('none', 'gzip'):
+            inner = engine(tempfile.mkdtemp(), compression=compression, compress_min_bytes=8 * 1024)
+            store = CachedUserStore(inner)
+            store.save('u1', _doc(rng))
+            for i in range(5):  # journal appends on top of the snapshot
+                store.append_meal('u1', {'date': (BASE + timedelta(days=rng.randrange(130))).isoformat(),
+                                         'time': '12:00', 'description': f'late {i}', 'calories': 250})
+                store.append_weight('u1', {'date': (BASE + timedelta(days=125 + i)).isoformat(),
+                                           'time': '07:00', 'weight': 180})
+            doc = inner.load('u1')
+            totals = build_rollups(doc['meals'])
+            store.cache.discard('u1')
+            for start, end in _ranges(rng):
+                whole = [m for m in doc['meals']
+                         if (start is None or m['date'] >= start) and (end is None or m['date'] <= end)]
+                assert store.meals_between('u1', start, end) == whole, (engine.name, compression, start, end)
+                assert inner.meals_between('u1', start, end) == whole
+                assert store.daily_totals('u1', start, end) == totals_between(totals, start, end)
+            for n in (0, 1, 7, 100):
+                assert store.latest_weights('u1', n) == (doc['weight_history'][-n:] if n else [])
+            assert store.streak('u1', '2026-03-01') == streak_summary(build_streak(totals), totals, '2026-03-01')
+            assert store.settings('u1') == doc['settings']
+            assert store.cache_stats()['partial_reads'] > 0 and store.cache_stats()['entries'] == 0, engine.name
+
+
+def test_journal_edits_fall_back_to_full_load():
+    store = CachedUserStore(JournalUserStore(tempfile.mkdtemp()))
+    store.save('u1', _doc(random.Random(5), meals=20))
+    meal = store.load('u1')['meals'][3]
+    store.update_meal('u1', meal['id'], {'date': '2026-02-27', 'calories': 1})
+    assert store.inner.read_sections('u1', ('meals',)) is None
+    store.cache.discard('u1')
+    assert store.meals_between('u1', '2026-02-27', '2026-02-27')[-1]['calories'] == 1
+
+
+def main():
+    tests = [test_blocks_are_the_compact_document, test_sections_read_back_in_every_format,
+             test_stale_index_is_ignored, test_partial_reads_match_full_loads,
+             test_journal_edits_fall_back_to_full_load]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Tests for the outbound HTTP client (http_client.py) and voice_fix against a local stub API server
+"""
+
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import voice_fix
+from http_client import ConnectError, HTTPClient, Timeout
+
+
+class _Stub(BaseHTTPRequestHandler):
+    """Answers from the server's `script`: a list of (status, body, delay) popped per request"""
+
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def _answer(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        with server.lock:
+            server.requests.append((self.command, self.path, body))
+            server.peers.add(self.client_address)
+            status, payload, delay = server.script.pop(0) if server.script else (200, {'ok': True}, 0)
+        if delay:
+            time.sleep(delay)
+        data = json.dumps(payload).encode('utf-8')
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            if status == 429:
+                self.send_header('Retry-After', '0')
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up (read timeout)
+
+    do_GET = do_POST = _answer
+
+    def log_message(self, *args):
+        pass
+
+
+def _server(script=()):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Stub)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests, server.peers, server.script = [], set(), list(script)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def _client(**kwargs):
+    return HTTPClient(**{'connect_timeout': 1, 'read_timeout': 1, 'retries': 2, 'backoff': 0.01, **kwargs})
+
+
+def test_connections_are_reused():
+    server, url = _server()
+    client = _client()
+    for i in range(5):
+        assert client.post(f'{url}/echo', json={'i': i}, name='stub').json() == {'ok': True}
+    assert len(server.requests) == 5 and len(server.peers) == 1, server.peers
+    stats = client.stats()['stub']
+    assert stats['calls'] == 5 and stats['errors'] == 0 and stats['p50_ms'] is not None
+    server.shutdown()
+
+
+def test_retries_on_429_and_5xx_then_gives_up():
+    server, url = _server([(503, {}, 0), (429, {}, 0), (200, {'done': 1}, 0)])
+    client = _client()
+    response = client.post(f'{url}/flaky')
+    assert response.status_code == 200 and response.json() == {'done': 1} and len(server.requests) == 3
+    host = url.split('//')[1]
+    assert client.stats()[host]['retries'] == 2 and client.stats()[host]['errors'] == 1
+
+    server.script = [(502, {}, 0)] * 2
+    assert client.post(f'{url}/down', retries=1).status_code == 502 and len(server.requests) == 5
+    server.script = [(400, {'error': 'bad'}, 0)]
+    assert client.post(f'{url}/bad').status_code == 400 and len(server.requests) == 6  # not retried
+    server.shutdown()
+
+
+def test_timeouts_bound_a_hung_upstream():
+    server, url = _server([(200, {}, 2)] * 4)
+    client = _client(read_timeout=0.2)
+    started = time.perf_counter()
+    try:
+        client.post(f'{url}/hang')
+        assert False, 'Timeout expected'
+    except Timeout:
+        pass
+    # A POST the upstream may be acting on is not resent; a GET is
+    assert time.perf_counter() - started < 1.5 and len(server.requests) == 1
+    try:
+        client.get(f'{url}/hang', retries=1)
+        assert False, 'Timeout expected'
+    except Timeout:
+        pass
+    assert len(server.requests) == 3
+    server.shutdown()
+
+    with socket.socket() as s:  # a port nothing listens on
+        s.bind(('127.0.0.1', 0))
+        closed = f'http://127.0.0.1:{s.getsockname()[1]}'
+    try:
+        client.post(f'{closed}/x', name='refused')
+        assert False, 'ConnectionError expected'
+    except ConnectError:
+        pass
+    assert client.stats()['refused'] == {**client.stats()['refused'], 'calls': 3, 'errors': 3, 'retries': 2}
+
+
+def test_voice_fix_against_stub_api():
+    reply = {'choices': [{'message': {'content': '```json\n{"food": "oats", "calories": 300}\n```'}}]}
+    server, url = _server([(500, {}, 0), (200, {'text': 'a bowl of oats'}, 0), (200, reply, 0), (200, reply, 0)])
+    base, voice_fix.OPENAI_API_URL = voice_fix.OPENAI_API_URL, url
+    try:
+        audio = os.path.join(tempfile.mkdtemp(), 'voice.webm')
+        with open(audio, 'wb') as f:
+            f.write(b'RIFF' * 1000)
+        try:
+            assert voice_fix.transcribe_audio_direct(audio, 'sk-test') == 'a bowl of oats'
+        finally:
+            os.remove(audio)
+        # The retried upload carried the whole file again
+        assert all((b'RIFF' * 1000) in body for _, _, body in server.requests[:2])
+        assert json.loads(voice_fix.parse_meal_direct('oats', 'sk-test'))['calories'] == 300
+        assert json.loads(voice_fix.analyze_meal_photo_direct(b'\xff\xd8', 'sk-test'))['food'] == 'oats'
+        assert [path for _, path, _ in server.requests] == ['/audio/transcriptions'] * 2 + ['/chat/completions'] * 2
+    finally:
+        voice_fix.OPENAI_API_URL = base
+        server.shutdown()
+
+
+def main():
+    tests = [test_connections_are_reused, test_retries_on_429_and_5xx_then_gives_up,
+             test_timeouts_bound_a_hung_upstream, test_voice_fix_against_stub_api]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Tests for background jobs: the bounded pool (job_queue.py) and voice_log / photo_log answering with a job id
+"""
+
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import app_pro
+import voice_fix
+from job_queue import JobQueue, QueueFull
+from user_storage import CachedUserStore, JSONUserStore
+
+MEAL = {'food': 'chicken salad', 'calories': 450, 'protein': 38, 'carbs': 12, 'fat': 24}
+
+
+_saved = {}
+
+
+def setup_module():
+    """Point app_pro at a fresh store, job directory and vision cache under a temp dir"""
+    global TMP
+    TMP = tempfile.mkdtemp()
+    _saved.update(store=app_pro.store, jobs=app_pro.jobs, vision_db=app_pro.vision_cache.db_path)
+    app_pro.store = CachedUserStore(JSONUserStore(TMP))
+    app_pro.jobs = JobQueue(os.path.join(TMP, '.jobs'), on_finish=app_pro._publish_job)
+    app_pro.vision_cache.db_path = os.path.join(TMP, 'vision_cache.db')
+    app_pro.vision_cache._local = threading.local()
+
+
+def teardown_module():
+    app_pro.store, app_pro.jobs = _saved['store'], _saved['jobs']
+    app_pro.vision_cache.db_path = _saved['vision_db']
+    app_pro.vision_cache._local = threading.local()
+    shutil.rmtree(TMP, ignore_errors=True)
+
+
+def _client(uid):
+    client = app_pro.app.test_client()
+    client.set_cookie('lean_uid', uid)
+    return client
+
+
+def _wait(client, accepted, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(accepted['status_url']).get_json()
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'job {accepted["job_id"]} did not finish')
+
+
+def test_queue_bounds_and_shares_state_through_files():
+    directory = tempfile.mkdtemp()
+    release = threading.Event()
+    finished = []
+    jobs = JobQueue(directory, workers=1, max_pending=2, on_finish=finished.append)
+    first = jobs.submit('u1', 'slow', lambda: release.wait(5) and {'ok': 1})
+    second = jobs.submit('u1', 'boom', lambda: 1 / 0)
+    try:
+        jobs.submit('u1', 'slow', lambda: None)
+        assert False, 'QueueFull expected'
+    except QueueFull:
+        pass
+    assert jobs.stats()['pending'] == 2
+    assert jobs.get(first['id'])['status'] in ('queued', 'running') and jobs.get(second['id'])['status'] == 'queued'
+
+    release.set()
+    deadline = time.time() + 5
+    while len(finished) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    # Another process (a second queue on the same directory) sees the outcomes
+    other = JobQueue(directory)
+    assert other.get(first['id'])['result'] == {'ok': 1}
+    failed = other.get(second['id'])
+    assert failed['status'] == 'failed' and 'division' in failed['error']
+    assert jobs.stats()['pending'] == 0 and [j['id'] for j in finished] == [first['id'], second['id']]
+    assert other.get('../../etc/passwd') is None and other.get('0' * 32) is None
+
+
+def test_stale_records_fail_then_expire():
+    directory = tempfile.mkdtemp()
+    jobs = JobQueue(directory, ttl=60)
+    stuck = {'id': 'a' * 32, 'uid': 'u1', 'kind': 'photo_log', 'status': 'running',
+             'created': time.time() - 100, 'updated': time.time() - 100}
+    jobs._write(stuck)
+    assert jobs.get(stuck['id'])['status'] == 'failed'  # its process went away mid-job
+    old = time.time() - 1000
+    os.utime(jobs.path(stuck['id']), (old, old))
+    assert jobs.sweep() == 1 and jobs.get(stuck['id']) is None
+
+
+def test_jobs_of_an_exited_owner_fail_without_waiting_for_the_ttl():
+    directory = tempfile.mkdtemp()
+    jobs = JobQueue(directory, ttl=3600)
+    child = subprocess.Popen([sys.executable, '-c', 'pass'])
+    child.wait()
+    here = jobs.submit('u1', 'slow', lambda: None)['owner']
+    owners = {
+        'b' * 32: {**here, 'pid': child.pid, 'start': None},  # exited
+        'd' * 32: here,  # this process: still running
+        'e' * 32: {**here, 'host': 'elsewhere', 'pid': child.pid},  # can't tell, left to the TTL
+    }
+    if here['start'] is not None:
+        owners['c' * 32] = {**here, 'start': here['start'] + 1}  # our pid, recycled from an earlier process
+    for job_id, owner in owners.items():
+        jobs._write({'id': job_id, 'uid': 'u1', 'kind': 'photo_log', 'owner': owner, 'status': 'running',
+                     'created': time.time(), 'updated': time.time()})
+    assert jobs.get('b' * 32)['status'] == 'failed' and 'interrupted' in jobs.get('b' * 32)['error']
+    if 'c' * 32 in owners:
+        assert jobs.get('c' * 32)['status'] == 'failed'
+    assert jobs.get('d' * 32)['status'] == 'running' and jobs.get('e' * 32)['status'] == 'running'
+
+
+def test_photo_and_voice_log_run_in_background():
+    originals = (voice_fix.analyze_meal_photo_direct, voice_fix.transcribe_audio_direct, voice_fix.parse_meal_direct)
+    started = threading.Event()
+    release = threading.Event()
+
+    def analyze(image_bytes, api_key):
+        started.set()
+        release.wait(5)
+        return json.dumps(MEAL)
+
+    voice_fix.analyze_meal_photo_direct = analyze
+    voice_fix.transcribe_audio_direct = lambda path, api_key: 'a coffee with milk'
+    voice_fix.parse_meal_direct = lambda text, api_key: json.dumps({'food': 'coffee', 'calories': 60})
+    try:
+        client = _client('job-user')
+        accepted = client.post('/api/photo_log', data={'photo': (io.BytesIO(b'\xff\xd8jpeg'), 'meal.jpg')})
+        assert accepted.status_code == 202
+        accepted = accepted.get_json()
+        assert accepted['success'] and accepted['status_url'] == f"/api/jobs/{accepted['job_id']}"
+        # The request returned while the AI call is still in flight
+        assert started.wait(5) and client.get(accepted['status_url']).get_json()['status'] == 'running'
+        assert client.get('/api/today').get_json()['totals']['calories'] == 0
+        assert _client('job-other').get(accepted['status_url']).status_code == 404
+
+        release.set()
+        job = _wait(client, accepted)
+        assert job['status'] == 'done' and job['result'] == {'success': True, 'meal': MEAL}
+        assert client.get('/api/today').get_json()['totals']['calories'] == 450
+
+        accepted = client.post('/api/voice_log', data={'audio': (io.BytesIO(b'webm'), 'recording.webm')}).get_json()
+        job = _wait(client, accepted)
+        assert job['result']['transcript'] == 'a coffee with milk'
+        assert client.get('/api/today').get_json()['totals']['calories'] == 510
+
+        voice_fix.analyze_meal_photo_direct = lambda image_bytes, api_key: 'not json'
+        accepted = client.post('/api/photo_log', data={'photo': (io.BytesIO(b'jpeg'), 'meal.jpg')}).get_json()
+        job = _wait(client, accepted)
+        assert job['status'] == 'failed' and job['error'] and 'result' not in job
+        assert client.post('/api/photo_log', data={}).status_code == 400
+    finally:
+        release.set()
+        voice_fix.analyze_meal_photo_direct, voice_fix.transcribe_audio_direct, voice_fix.parse_meal_direct = originals
+
+
+def main():
+    tests = [test_queue_bounds_and_shares_state_through_files, test_stale_records_fail_then_expire,
+             test_jobs_of_an_exited_owner_fail_without_waiting_for_the_ttl, test_photo_and_voice_log_run_in_background]
+    failed = 0
+    setup_module()
+    try:
+        for test in tests:
+            try:
+                test()
+                print(f"✅ {test.__name__}")
+            except AssertionError as e:
+                failed += 1
+                print(f"❌ {test.__name__}: {e}")
+    finally:
+        teardown_module()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
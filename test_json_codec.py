@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests for the pluggable JSON codec (json_codec.py)
+"""
+
+import json
+import os
+import sys
+import tempfile
+from datetime import date
+
+import json_codec
+from atomic_io import atomic_write_json
+from records import Meal
+
+DOC = {
+    'meals': [{'date': '2026-03-01', 'time': '08:05', 'description': 'Café au lait', 'calories': 120, 'protein': 6.5}],
+    'settings': {'daily_calorie_goal': 2200, 'onboarded': True, 'name': None},
+    'daily_totals': {'2026-03-01': {'calories': 120, 'meal_count': 1}},
+    '_version': 3,
+}
+
+
+def test_round_trip_matches_stdlib():
+    for indent in (0, 2):
+        for sort_keys in (False, True):
+            text = json_codec.dumps(DOC, indent=indent, sort_keys=sort_keys)
+            assert json.loads(text) == DOC and json_codec.loads(text) == DOC
+            assert json_codec.loads(json_codec.dumpb(DOC, indent=indent)) == DOC
+            if sort_keys:
+                assert list(json.loads(text)) == sorted(DOC)
+    assert '\n' not in json_codec.dumps(DOC) and json_codec.dumps(DOC, indent=2).startswith('{\n  "meals"')
+    # Files written pretty by the stdlib still read back, and vice versa
+    assert json_codec.loads(json.dumps(DOC, indent=2)) == DOC
+
+
+def test_stdlib_fallbacks():
+    """Inputs the fast backends refuse still behave like the stdlib"""
+    assert json_codec.loads(json_codec.dumps({'big': 2 ** 70})) == {'big': 2 ** 70}
+    assert json_codec.loads('{"x": NaN}')['x'] != json_codec.loads('{"x": NaN}')['x']
+    assert json_codec.loads(json_codec.dumps({1: 'a'})) == {'1': 'a'}
+    assert json_codec.loads(json_codec.dumps(DOC, indent=4)) == DOC
+    try:
+        json_codec.loads('{"torn": ')
+        assert False, 'truncated JSON should raise'
+    except ValueError:
+        pass
+    try:
+        json_codec.dumps({'x': object()})
+        assert False, 'unknown types should raise'
+    except TypeError:
+        pass
+
+
+def test_mappings_and_default_hook():
+    record = Meal.from_dict(DOC['meals'][0])
+    assert json_codec.loads(json_codec.dumps({'meals': [record]})) == {'meals': DOC['meals']}
+    assert json_codec.dumps({'day': date(2026, 3, 1)}, default=lambda o: f'day:{o.isoformat()}') == \
+        '{"day":"day:2026-03-01"}'
+
+
+def test_atomic_write_is_compact_and_readable():
+    path = os.path.join(tempfile.mkdtemp(), 'doc.json')
+    atomic_write_json(path, DOC, durability='none')
+    with open(path, 'rb') as f:
+        raw = f.read()
+    assert json_codec.loads(raw) == DOC and json.loads(raw.decode('utf-8')) == DOC
+    atomic_write_json(path, DOC, indent=2, durability='none')
+    with open(path) as f:
+        assert json.load(f) == DOC
+
+
+def main():
+    tests = [test_round_trip_matches_stdlib, test_stdlib_fallbacks, test_mappings_and_default_hook,
+             test_atomic_write_is_compact_and_readable]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Tests for live updates: the in-process hub (live_updates.py) and the /api/stream SSE endpoint
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import app_pro
+import json_codec
+from job_queue import JobQueue
+from live_updates import LiveHub, TooManyStreams
+from user_storage import CachedUserStore, JSONUserStore
+
+
+_saved = {}
+
+
+def setup_module():
+    """Point app_pro at a fresh store and job directory under a temp dir"""
+    global TMP
+    TMP = tempfile.mkdtemp()
+    _saved.update(store=app_pro.store, jobs=app_pro.jobs)
+    app_pro.store = CachedUserStore(JSONUserStore(TMP))
+    app_pro.jobs = JobQueue(os.path.join(TMP, '.jobs'), on_finish=app_pro._publish_job)
+
+
+def teardown_module():
+    app_pro.store, app_pro.jobs = _saved['store'], _saved['jobs']
+    shutil.rmtree(TMP, ignore_errors=True)
+
+
+def _client(uid):
+    client = app_pro.app.test_client()
+    client.set_cookie('lean_uid', uid)
+    return client
+
+
+def _frames(chunk):
+    """[(event, data)] of the SSE frames in a chunk; comments come back as (None, text)"""
+    frames = []
+    for block in chunk.decode('utf-8').split('\n\n'):
+        if block.startswith(':'):
+            frames.append((None, block))
+        fields = dict(line.split(': ', 1) for line in block.split('\n') if line.startswith(('event', 'data')))
+        if 'event' in fields:
+            frames.append((fields['event'], json_codec.loads(fields['data'])))
+    return frames
+
+
+def test_hub_fans_out_per_user():
+    hub = LiveHub(backlog=3)
+    a1, a2, b = hub.subscribe('a'), hub.subscribe('a'), hub.subscribe('b')
+    assert hub.publish('a', 'meal', {'n': 1}) == 2 and hub.publish('nobody', 'meal', {}) == 0
+    assert a1.wait(0) == ([('meal', {'n': 1})], False) and a2.wait(0) == ([('meal', {'n': 1})], False)
+    assert b.wait(0.01) == ([], False)
+
+    # A reader blocked on its condition wakes as soon as an event is published
+    got = []
+    reader = threading.Thread(target=lambda: got.append(b.wait(5)))
+    reader.start()
+    time.sleep(0.05)
+    hub.publish('b', 'weight', {'entry': 1})
+    reader.join(1)
+    assert got == [([('weight', {'entry': 1})], False)]
+
+    # An undrained stream is bounded: the backlog collapses into one overflow flag
+    for i in range(10):
+        hub.publish('a', 'meal', {'n': i})
+    events, overflowed = a1.wait(0)
+    assert overflowed and len(events) < 3
+
+    for subscription in (a1, a2, b):
+        subscription.close()
+        subscription.close()
+    assert not hub.watching('a') and hub.stats() == {**hub.stats(), 'users': 0, 'streams': 0}
+
+
+def test_stream_pushes_meals_totals_and_streak():
+    watcher, phone = _client('live-user'), _client('live-user')
+    response = watcher.get('/api/stream', buffered=False)
+    assert response.status_code == 200 and response.mimetype == 'text/event-stream'
+    chunks = iter(response.response)
+    (event, snapshot), = [f for f in _frames(next(chunks)) if f[0]]
+    assert event == 'sync' and snapshot['streak']['current'] == 0
+    today = snapshot['today']
+    assert snapshot['totals'][today]['calories'] == 0
+
+    phone.post('/api/add_meal', json={'description': 'eggs', 'calories': 300, 'protein': 25})
+    phone.post('/api/add_meal', json={'description': 'toast', 'calories': 200, 'protein': 8})
+    frames = _frames(next(chunks))
+    assert [f[0] for f in frames] == ['meal', 'meal']
+    meal = frames[1][1]
+    assert meal['meal']['description'] == 'toast' and meal['meal']['id']
+    assert meal['totals'][today]['calories'] == 500 and meal['totals'][today]['meal_count'] == 2
+    assert meal['streak']['logged_today'] and meal['streak']['current'] == 1
+
+    phone.post('/api/delete_meal', json={'meal_id': meal['meal']['id']})
+    phone.post('/api/weight', json={'weight': 181.5})
+    (deleted, payload), (weight, entry) = _frames(next(chunks))
+    assert deleted == 'meal_deleted' and payload['totals'][today]['calories'] == 300
+    assert weight == 'weight' and entry['entry']['weight'] == 181.5
+
+    # Nobody else's writes reach this stream, and closing it detaches it from the hub
+    _client('live-other').post('/api/add_meal', json={'description': 'rice', 'calories': 400})
+    assert app_pro.live.watching('live-user') and not app_pro.live.watching('live-other')
+    response.close()
+    assert not app_pro.live.watching('live-user')
+
+
+def test_streams_per_worker_are_capped():
+    """Past LEAN_STREAM_MAX a stream is refused with 503 rather than taking another server thread"""
+    hub = LiveHub(max_streams=2)
+    first, second = hub.subscribe('a'), hub.subscribe('b')
+    try:
+        hub.subscribe('c')
+        assert False, 'TooManyStreams expected'
+    except TooManyStreams:
+        pass
+    first.close()
+    first.close()
+    hub.subscribe('c').close()
+    second.close()
+    assert hub.stats() == {'users': 0, 'streams': 0, 'max_streams': 2, 'rejected': 1}
+
+    cap, app_pro.live.max_streams = app_pro.live.max_streams, 1
+    try:
+        open_stream = _client('live-cap').get('/api/stream', buffered=False)
+        refused = _client('live-cap').get('/api/stream')
+        assert refused.status_code == 503 and refused.headers['Retry-After'] == '60'
+        open_stream.close()
+        again = _client('live-cap').get('/api/stream', buffered=False)
+        assert again.status_code == 200
+        again.close()
+    finally:
+        app_pro.live.max_streams = cap
+
+
+def test_idle_stream_heartbeats_and_resyncs():
+    """With no local events an idle stream sends keep-alives, or a sync once another process wrote"""
+    heartbeat = app_pro.HEARTBEAT_SECONDS
+    app_pro.HEARTBEAT_SECONDS = 0.05
+    try:
+        response = _client('live-idle').get('/api/stream', buffered=False)
+        chunks = iter(response.response)
+        next(chunks)
+        assert _frames(next(chunks)) == [(None, ': keep-alive')]
+        # A write that bypasses this process's hub, as another worker's would
+        meal = {'date': app_pro.datetime.now(app_pro.ZoneInfo('America/Chicago')).strftime('%Y-%m-%d'),
+                'time': '08:00', 'description': 'oats', 'calories': 350}
+        app_pro.store.append_meal('live-idle', meal)
+        (event, snapshot), = _frames(next(chunks))
+        assert event == 'sync' and snapshot['totals'][meal['date']]['calories'] == 350
+        response.close()
+    finally:
+        app_pro.HEARTBEAT_SECONDS = heartbeat
+
+
+def main():
+    tests = [test_hub_fans_out_per_user, test_stream_pushes_meals_totals_and_streak, test_streams_per_worker_are_capped,
+             test_idle_stream_heartbeats_and_resyncs]
+    failed = 0
+    setup_module()
+    try:
+        for test in tests:
+            try:
+                test()
+                print(f"✅ {test.__name__}")
+            except AssertionError as e:
+                failed += 1
+                print(f"❌ {test.__name__}: {e}")
+    finally:
+        teardown_module()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
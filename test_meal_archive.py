@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Tests for archive tiers (meal_archive.py): old months move into segments and every read merges them back
+"""
+
+import os
+import random
+import sys
+import tempfile
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import compressed_io
+import json_codec
+import meal_archive
+from daily_rollups import build_rollups
+from meal_archive import ARCHIVE_KEY
+from streaks import build_streak, streak_summary
+from user_storage import CachedUserStore, JSONUserStore, JournalUserStore
+
+TODAY = datetime.now(ZoneInfo("America/Chicago")).date()
+
+
+def _meals(rng, n=400, days=365):
+    meals = [{'date': (TODAY - timedelta(days=rng.randrange(days))).isoformat(),
+              'time': f'{rng.randrange(24):02d}:{rng.randrange(60):02d}',
+              'description': f'meal {i}', 'calories': rng.randrange(100, 900), 'protein': rng.randrange(60)}
+             for i in range(n)]
+    return sorted(meals, key=lambda m: (m['date'], m['time']))
+
+
+def _stores(tmp, archive_after_days=60):
+    for engine in (JSONUserStore, JournalUserStore):
+        inner = engine(tempfile.mkdtemp(dir=tmp), compression='gzip', compress_min_bytes=0,
+                       archive_after_days=archive_after_days)
+        yield inner
+        yield CachedUserStore(engine(tempfile.mkdtemp(dir=tmp), compression='gzip', compress_min_bytes=0,
+                                     archive_after_days=archive_after_days))
+
+
+def _engine(store):
+    return getattr(store, 'inner', store)
+
+
+def _segments(store, uid='u1'):
+    directory = meal_archive.archive_dir(_engine(store).path(uid))
+    return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+
+def _check(store, expected, uid='u1'):
+    """Every read of store agrees with the complete meal list expected"""
+    keys = sorted(m['description'] for m in expected)
+    assert sorted(m['description'] for m in store.load_all(uid)['meals']) == keys
+    for start, end in ((None, None), ((TODAY - timedelta(days=200)).isoformat(), None),
+                       ((TODAY - timedelta(days=300)).isoformat(), (TODAY - timedelta(days=100)).isoformat())):
+        got = store.meals_between(uid, start, end)
+        want = [m for m in expected if (start is None or m['date'] >= start) and (end is None or m['date'] <= end)]
+        assert [(m['date'], m['time'], m['description']) for m in got] == \
+            [(m['date'], m['time'], m['description']) for m in sorted(want, key=lambda m: (m['date'], m['time']))]
+    totals = build_rollups(expected)
+    assert store.daily_totals(uid) == totals
+    assert store.streak(uid, TODAY.isoformat()) == streak_summary(build_streak(totals), totals, TODAY.isoformat())
+
+
+def test_old_months_move_to_segments():
+    rng = random.Random(1)
+    tmp = tempfile.mkdtemp()
+    first_hot = meal_archive.hot_from(60)
+    for store in _stores(tmp):
+        meals = _meals(rng)
+        store.save('u1', {'meals': [dict(m) for m in meals], 'settings': {}})
+        hot = store.load('u1')
+        assert hot['meals'] and all(m['date'][:7] >= first_hot for m in hot['meals'])
+        archive = hot[ARCHIVE_KEY]
+        assert sorted(archive) == sorted({m['date'][:7] for m in meals if m['date'][:7] < first_hot})
+        for month, entry in archive.items():
+            in_month = [m for m in meals if m['date'][:7] == month]
+            assert entry['meal_count'] == len(in_month)
+            assert entry['calories'] == sum(m['calories'] for m in in_month)
+        assert all(name.endswith('.json.gz') for name in _segments(store))
+        _check(store, meals)
+
+
+def test_backfill_edit_and_delete_in_archived_months():
+    rng = random.Random(2)
+    tmp = tempfile.mkdtemp()
+    for store in _stores(tmp):
+        meals = _meals(rng)
+        store.save('u1', {'meals': [dict(m) for m in meals], 'settings': {}})
+        old_day = (TODAY - timedelta(days=250)).isoformat()
+        before = _segments(store)
+
+        late = {'date': old_day, 'time': '12:00', 'description': 'back-dated', 'calories': 321}
+        store.append_meal('u1', dict(late))
+        meals.append(late)
+        _check(store, meals)
+
+        archived = store.meals_between('u1', None, (TODAY - timedelta(days=200)).isoformat())
+        victim, edited = archived[3], archived[10]
+        store.delete_meal('u1', victim['id'])
+        meals = [m for m in meals if m['description'] != victim['description']]
+        updated = store.update_meal('u1', edited['id'], {'calories': 5, 'date': TODAY.isoformat()})
+        assert updated['calories'] == 5 and store.find_meal('u1', edited['id'])['date'] == TODAY.isoformat()
+        meals = [dict(m, calories=5, date=TODAY.isoformat()) if m['description'] == edited['description'] else m
+                 for m in meals]
+        if isinstance(_engine(store), JournalUserStore):
+            _engine(store).compact('u1')
+        _check(store, meals)
+        assert _segments(store) != before and len(_segments(store)) == len(store.load('u1')[ARCHIVE_KEY])
+        try:
+            store.delete_meal('u1', 'no-such-meal')
+            assert False, 'KeyError expected'
+        except KeyError:
+            pass
+
+
+def test_unreferenced_segments_are_pruned():
+    """A segment left by a crash before its document was written is ignored, then removed"""
+    tmp = tempfile.mkdtemp()
+    store = JSONUserStore(tmp, compression='none', archive_after_days=60)
+    meals = _meals(random.Random(3))
+    store.save('u1', {'meals': [dict(m) for m in meals], 'settings': {}})
+    directory = meal_archive.archive_dir(store.path('u1'))
+    with open(os.path.join(directory, '2000-01.deadbeef.json'), 'wb') as f:
+        f.write(json_codec.dumpb({'month': '2000-01', 'meals': [{'date': '2000-01-01', 'description': 'x'}]}))
+    _check(store, meals)
+    store.save('u1', store.load('u1'))
+    assert '2000-01.deadbeef.json' not in _segments(store)
+    # Clearing the document drops its archive too
+    store.save('u1', {'meals': [], 'settings': {}})
+    assert not os.path.exists(directory) and store.load_all('u1')['meals'] == []
+
+
+def test_archiving_off_keeps_meals_in_document():
+    tmp = tempfile.mkdtemp()
+    for store in _stores(tmp, archive_after_days=0):
+        meals = _meals(random.Random(4))
+        store.save('u1', {'meals': [dict(m) for m in meals], 'settings': {}})
+        assert len(store.load('u1')['meals']) == len(meals) and ARCHIVE_KEY not in store.load('u1')
+        assert _segments(store) == []
+    # Archives already written stay readable with archiving switched off
+    path = os.path.join(tmp, 'on')
+    JSONUserStore(path, archive_after_days=60).save('u1', {'meals': [dict(m) for m in meals], 'settings': {}})
+    _check(JSONUserStore(path, archive_after_days=0), meals)
+    assert compressed_io.resolve(JSONUserStore(path).path('u1'))[1] is not None
+
+
+def test_hot_from_counts_from_the_app_day():
+    assert meal_archive.hot_from(0) is None
+    assert meal_archive.hot_from(31, date(2026, 3, 1)) == '2026-01'
+    # 03:00 UTC on May 1st is still April 30th in Chicago, and 30 days before that is in March
+    original = meal_archive.datetime
+
+    class _Clock(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(2026, 5, 1, 3, 0, tzinfo=timezone.utc).astimezone(tz)
+
+    meal_archive.datetime = _Clock
+    try:
+        assert meal_archive.hot_from(30) == '2026-03'
+    finally:
+        meal_archive.datetime = original
+
+
+def main():
+    tests = [test_old_months_move_to_segments, test_backfill_edit_and_delete_in_archived_months,
+             test_unreferenced_segments_are_pruned, test_archiving_off_keeps_meals_in_document,
+             test_hot_from_counts_from_the_app_day]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
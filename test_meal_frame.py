@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Tests for the columnar meal frame (meal_frame.py) behind the raw-log analytics
+"""
+
+import os
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+
+from meal_frame import MACROS, MealFrame, as_number, cached_frame, file_stamp
+
+BASE = date(2026, 3, 1)
+
+
+def _random_log(rng, n):
+    return [{'date': (BASE + timedelta(days=rng.randrange(40))).isoformat(),
+             'time': f'{rng.randrange(24):02d}:{rng.randrange(60):02d}',
+             'calories': rng.randrange(100, 900), 'protein': rng.randrange(5, 60),
+             'carbs': rng.choice([rng.randrange(0, 90), None]), 'fat': rng.randrange(0, 40) + 0.5}
+            for _ in range(n)]
+
+
+def _reference(log, day):
+    day_logs = [f for f in log if f.get('date') == day]
+    return {**{k: round(sum(f.get(k) or 0 for f in day_logs), 2) for k in MACROS}, 'meal_count': len(day_logs)}
+
+
+def test_daily_matches_per_day_sums():
+    for seed in range(5):
+        rng = random.Random(seed)
+        log = _random_log(rng, 300)
+        frame = MealFrame(log)
+        start, end = (BASE + timedelta(days=5)).isoformat(), (BASE + timedelta(days=45)).isoformat()
+        daily = frame.daily(start, end)
+        for i in range(41):
+            day = (BASE + timedelta(days=5 + i)).isoformat()
+            got = {k: as_number(daily[k][i]) for k in MACROS}
+            got['meal_count'] = int(daily['meal_count'][i])
+            assert got == _reference(log, day), (seed, day)
+        totals = frame.totals(start, end)
+        assert totals['meal_count'] == sum(daily['meal_count'])
+        assert totals['calories'] == as_number(daily['calories'].sum())
+
+
+def test_missing_fields_and_time_order():
+    frame = MealFrame([{'date': '2026-03-02', 'time': '19:30', 'calories': 500},
+                       {'date': '2026-03-02', 'time': '?:??', 'protein': 20},
+                       {'date': '2026-03-01', 'time': '08:05', 'calories': 300},
+                       {'time': '09:00', 'calories': 999}])
+    assert list(frame.minute) == [9 * 60, 8 * 60 + 5, -1, 19 * 60 + 30]
+    assert frame.totals('2026-03-01', '2026-03-02') == \
+        {'calories': 800, 'protein': 20, 'carbs': 0, 'fat': 0, 'meal_count': 3}
+    assert frame.daily('2026-03-05', '2026-03-07')['meal_count'].tolist() == [0, 0, 0]
+    assert [r.get('time') for r in frame.rows('2026-03-01', '2026-03-02')] == ['08:05', '?:??', '19:30']
+    assert frame.rows('2026-03-02', '2026-03-02') == frame.records[2:]
+
+
+def test_cached_frame_follows_the_file():
+    path = os.path.join(tempfile.mkdtemp(), 'fitness_data.json')
+    with open(path, 'w') as f:
+        f.write('[]')
+    log = [{'date': '2026-03-01', 'time': '12:00', 'calories': 400}]
+    first = cached_frame(('food_logs', path), file_stamp(path), log)
+    assert cached_frame(('food_logs', path), file_stamp(path), log) is first
+
+    log.append({'date': '2026-03-01', 'time': '18:00', 'calories': 600})
+    with open(path, 'w') as f:
+        f.write('[{}, {}]')
+    second = cached_frame(('food_logs', path), file_stamp(path), log)
+    assert second is not first
+    assert second.totals('2026-03-01', '2026-03-01')['calories'] == 1000
+    assert cached_frame(('food_logs', 'missing'), file_stamp('missing'), log) is not \
+        cached_frame(('food_logs', 'missing'), file_stamp('missing'), log)
+
+    # A builder is only called when the frame has to be built
+    builds = []
+    build = lambda: builds.append(1) or list(log)
+    assert cached_frame(('built', path), file_stamp(path), build) is cached_frame(('built', path), file_stamp(path), build)
+    assert len(builds) == 1
+
+
+def main():
+    tests = [test_daily_matches_per_day_sums, test_missing_fields_and_time_order, test_cached_frame_follows_the_file]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
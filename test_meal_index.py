@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Tests for the bisect meal date index (meal_index.py) and its maintenance
+by the document cache in user_storage.py
+"""
+
+import json
+import os
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+
+from meal_index import MealDateIndex, day_ordinal, new_meal_id
+from user_storage import (
+    VERSION_KEY, CachedUserStore, JSONUserStore, JournalUserStore, SQLiteUserStore, backfill_meal_ids,
+)
+
+
+def _random_meals(n, seed=7):
+    rng = random.Random(seed)
+    start = date(2025, 1, 1)
+    return [{
+        'date': (start + timedelta(days=rng.randrange(400))).isoformat(),
+        'time': f'{rng.randrange(24):02d}:{rng.randrange(60):02d}',
+        'calories': rng.randrange(100, 900),
+        'protein': rng.randrange(5, 60),
+    } for _ in range(n)]
+
+
+def _linear(meals, start, end):
+    return [m for m in meals if (start is None or m['date'] >= start) and (end is None or m['date'] <= end)]
+
+
+def test_day_ordinal():
+    assert day_ordinal('2026-03-01') - day_ordinal('2026-02-28') == 1
+    assert day_ordinal('not a date') == 0
+    assert day_ordinal(None) == 0
+
+
+def test_between_matches_linear_scan():
+    """Range queries return exactly the meals a linear scan finds, in (date, time) order"""
+    meals = _random_meals(2000)
+    index = MealDateIndex(meals)
+    ordered = sorted(meals, key=lambda m: (m['date'], m['time']))
+    for start, end in [(None, None), ('2025-03-01', '2025-03-31'), ('2025-06-15', None),
+                       (None, '2025-01-10'), ('2025-05-05', '2025-05-05'), ('2027-01-01', None)]:
+        assert index.between(start, end) == _linear(ordered, start, end), (start, end)
+
+
+def test_incremental_insert_and_remove_match_rebuild():
+    """insert()/remove() leave the same order a full rebuild produces"""
+    meals = _random_meals(500)
+    index = MealDateIndex(meals[:250])
+    for meal in meals[250:]:
+        index.insert(meal)
+    for meal in meals[::3]:
+        assert index.remove(meal)
+    survivors = [m for i, m in enumerate(meals) if i % 3]
+    assert index.meals == MealDateIndex(survivors).meals
+    assert index.keys == sorted(index.keys)
+    assert not index.remove({'date': '1999-01-01', 'time': '00:00'})
+
+
+def test_cached_store_keeps_index_in_step():
+    """Appends and deletes through the cache match a fresh load from disk"""
+    tmp = tempfile.mkdtemp()
+    for inner in [JSONUserStore(tmp), JournalUserStore(f'{tmp}/journal'), SQLiteUserStore(f'{tmp}/lean.db')]:
+        store = CachedUserStore(inner)
+        store.save('u1', {'meals': _random_meals(50), 'settings': {}})
+        store.meals_between('u1', '2025-02-01', '2025-03-01')  # build the index
+
+        for meal in _random_meals(20, seed=11):
+            store.append_meal('u1', meal)
+        meals = store.load('u1')['meals']
+        store.delete_meal('u1', meals[5]['id'])
+        store.delete_meal('u1', meals[0]['id'])
+
+        on_disk = inner.load('u1')
+        cached = store.load('u1')
+        assert cached['meals'] == on_disk['meals'], inner.name
+        assert cached[VERSION_KEY] == on_disk[VERSION_KEY], inner.name
+        assert store.meals_between('u1', '2025-02-01', '2025-03-01') == \
+            _linear(on_disk['meals'], '2025-02-01', '2025-03-01'), inner.name
+        assert on_disk[VERSION_KEY] == 1 + 20 + 2, inner.name
+
+        try:
+            store.delete_meal('u1', 'no-such-meal')
+            assert False, f'{inner.name}: unknown id accepted'
+        except KeyError:
+            pass
+
+
+def test_meal_ids_edit_and_delete():
+    """Meals keep their ids; edits and deletes by id survive a fresh load on every engine"""
+    for cached in (False, True):
+        tmp = tempfile.mkdtemp()
+        for inner in [JSONUserStore(tmp), JournalUserStore(f'{tmp}/journal'), SQLiteUserStore(f'{tmp}/lean.db')]:
+            store = CachedUserStore(inner) if cached else inner
+            store.save('u1', {'meals': _random_meals(10), 'settings': {}})
+            meal = {'date': '2026-01-05', 'time': '12:00', 'calories': 400, 'protein': 30}
+            store.append_meal('u1', meal)
+            ids = [m['id'] for m in store.load('u1')['meals']]
+            assert len(set(ids)) == 11 and meal['id'] in ids, inner.name
+
+            updated = store.update_meal('u1', meal['id'], {'date': '2024-12-31', 'calories': 450})
+            assert updated['id'] == meal['id'] and updated['calories'] == 450
+            victim = ids[3] if ids[3] != meal['id'] else ids[4]
+            assert store.delete_meal('u1', victim)['id'] == victim
+
+            fresh = type(inner)(inner.db_path) if isinstance(inner, SQLiteUserStore) else type(inner)(inner.data_dir)
+            doc = fresh.load('u1')
+            assert [m['id'] for m in doc['meals']] == [m['id'] for m in store.load('u1')['meals']], inner.name
+            assert doc['meals'][0] == updated, inner.name
+            assert victim not in [m['id'] for m in doc['meals']]
+            assert store.find_meal('u1', meal['id']) == updated
+            assert doc['daily_totals']['2024-12-31']['calories'] == 450
+
+
+def test_delete_route_rejects_booleans():
+    """JSON true is not list position 1 for older clients' delete_meal"""
+    import app_pro
+    client = app_pro.app.test_client()
+    client.set_cookie('lean_uid', f'bool-delete-{new_meal_id()}')  # a fresh user on every run
+    for i in range(3):
+        client.post('/api/add_meal', json={'description': f'meal {i}', 'calories': 100 + i, 'protein': 5})
+    assert client.post('/api/delete_meal', json={'meal_id': True}).status_code == 400
+    assert client.post('/api/delete_meal', json={'meal_id': 9}).status_code == 400
+    assert len(client.get('/api/today').get_json()['meals']) == 3
+    assert client.post('/api/delete_meal', json={'meal_id': 1}).get_json()['deleted']['calories'] == 101
+
+
+def test_backfill_meal_ids():
+    """Pre-id documents get ids once, and they stay the same across reads"""
+    tmp = tempfile.mkdtemp()
+    inner = JSONUserStore(tmp)
+    os.makedirs(os.path.dirname(inner.path('old')), exist_ok=True)
+    with open(inner.path('old'), 'w') as f:
+        json.dump({'meals': _random_meals(5)}, f)
+
+    store = CachedUserStore(inner)
+    ids = [m['id'] for m in store.meals_between('old')]
+    assert len(ids) == 5 and all(ids)
+    assert {m['id'] for m in JSONUserStore(tmp).load('old')['meals']} == set(ids)
+    assert [m['id'] for m in store.meals_between('old')] == ids
+
+    os.makedirs(os.path.dirname(inner.path('older')), exist_ok=True)
+    with open(inner.path('older'), 'w') as f:
+        json.dump({'meals': _random_meals(3)}, f)
+    assert backfill_meal_ids(inner) == 1
+    assert all(m.get('id') for m in inner.load('older')['meals'])
+
+
+def main():
+    tests = [test_day_ordinal, test_between_matches_linear_scan,
+             test_incremental_insert_and_remove_match_rebuild, test_cached_store_keeps_index_in_step,
+             test_meal_ids_edit_and_delete, test_delete_route_rejects_booleans, test_backfill_meal_ids]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Tests for the day/week/month range aggregates (range_aggregates.py)
+"""
+
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+
+from daily_rollups import add_meal, remove_meal
+from range_aggregates import AggregateIndex, aggregate, buckets
+from user_storage import CachedUserStore, JSONUserStore, JournalUserStore, SQLiteUserStore
+
+BASE = date(2025, 11, 20)
+
+
+def _random_meal(rng, span=120):
+    return {'date': (BASE + timedelta(days=rng.randrange(span))).isoformat(), 'time': '12:00',
+            'calories': rng.randrange(100, 900), 'protein': rng.randrange(5, 60),
+            'carbs': rng.randrange(0, 90), 'fat': rng.randrange(0, 40)}
+
+
+def test_buckets_follow_the_calendar():
+    weeks = buckets(date(2026, 2, 25), date(2026, 3, 10), 'week')
+    assert [(label, lo.isoformat(), hi.isoformat()) for label, lo, hi in weeks] == [
+        ('2026-W09', '2026-02-25', '2026-03-01'),
+        ('2026-W10', '2026-03-02', '2026-03-08'),
+        ('2026-W11', '2026-03-09', '2026-03-10'),
+    ]
+    months = buckets(date(2025, 12, 15), date(2026, 3, 1), 'month')
+    assert [(label, hi.isoformat()) for label, _, hi in months] == [
+        ('2025-12', '2025-12-31'), ('2026-01', '2026-01-31'), ('2026-02', '2026-02-28'), ('2026-03', '2026-03-01'),
+    ]
+    assert len(buckets(date(2026, 1, 1), date(2026, 1, 31), 'day')) == 31
+
+
+def test_index_matches_day_sums_under_updates():
+    """Fenwick range sums equal summing the window's days, through random adds and removes"""
+    for seed in range(10):
+        rng = random.Random(seed)
+        totals, meals = {}, []
+        index = AggregateIndex(totals)
+        for step in range(200):
+            if meals and rng.random() < 0.35:
+                meal = meals.pop(rng.randrange(len(meals)))
+                remove_meal(totals, meal)
+            else:
+                meal = _random_meal(rng)
+                meals.append(meal)
+                add_meal(totals, meal)
+            index = index.copy()
+            index.update_day(meal['date'], totals)
+            if step % 10:
+                continue
+            for group in ('week', 'month'):
+                start = (BASE - timedelta(days=rng.randrange(30))).isoformat()
+                end = (BASE + timedelta(days=rng.randrange(150))).isoformat()
+                assert aggregate(totals, start, end, group, index) == aggregate(totals, start, end, group), \
+                    (seed, step, group)
+
+
+def test_store_aggregates_across_engines():
+    """Bare and cached engines agree, and the cached index follows meal writes"""
+    rng = random.Random(4)
+    for cached in (False, True):
+        tmp = tempfile.mkdtemp()
+        for inner in (JSONUserStore(tmp), JournalUserStore(f'{tmp}/journal'), SQLiteUserStore(f'{tmp}/lean.db')):
+            store = CachedUserStore(inner) if cached else inner
+            store.save('u1', {'meals': [_random_meal(rng) for _ in range(40)], 'settings': {}})
+            store.aggregate('u1', '2025-11-01', '2026-04-30', 'month')
+            for _ in range(15):
+                store.append_meal('u1', _random_meal(rng))
+            store.delete_meal('u1', store.load('u1')['meals'][3]['id'])
+
+            totals = inner.daily_totals('u1')
+            for group in ('day', 'week', 'month'):
+                assert store.aggregate('u1', '2025-11-01', '2026-04-30', group) == \
+                    aggregate(totals, '2025-11-01', '2026-04-30', group), (inner.name, cached, group)
+            months = store.aggregate('u1', '2025-11-01', '2026-04-30', 'month')
+            assert sum(m['meal_count'] for m in months) == 40 + 15 - 1
+            assert sum(m['days_logged'] for m in months) == len(totals)
+
+
+def main():
+    tests = [test_buckets_follow_the_calendar, test_index_matches_day_sums_under_updates,
+             test_store_aggregates_across_engines]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
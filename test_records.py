@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Tests for the compact cached records (records.py) and the compact document cache
+"""
+
+import json
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+
+from records import Meal, ProgressPhoto, Record, WeightEntry, compact_doc, expand_doc
+from user_storage import CachedUserStore, JSONUserStore, JournalUserStore, SQLiteUserStore, UserDocCache
+
+BASE = date(2026, 2, 1)
+
+
+def _random_meal(rng):
+    return {'date': (BASE + timedelta(days=rng.randrange(30))).isoformat(),
+            'time': f'{rng.randrange(24):02d}:{rng.randrange(60):02d}', 'description': f'meal {rng.randrange(99)}',
+            'calories': rng.randrange(100, 900), 'protein': rng.randrange(5, 60) + 0.5, 'carbs': rng.randrange(90)}
+
+
+def test_round_trip_is_exact():
+    """Key order, value types and non-canonical dates/times all come back as they went in"""
+    entries = [
+        (Meal, {'calories': 520, 'date': '2026-03-01', 'time': '08:05', 'id': 'abc', 'notes': 'extra', 'fat': 12.5}),
+        (Meal, {'date': '2026-02-30', 'time': '8:05', 'description': None}),
+        (Meal, {'date': 739000, 'time': '24:00', 'protein': True}),
+        (Meal, {'date': '20260301', 'time': 'noon', 'tags': ['a', 'b']}),
+        (WeightEntry, {'date': '2026-03-01', 'time': '07:00', 'weight': 181.4, 'notes': ''}),
+        (ProgressPhoto, {'date': '2026-03-01', 'weight': None, 'waist': 33, 'photo_url': 'data:...', 'notes': 'x'}),
+    ]
+    for cls, entry in entries:
+        record = cls.from_dict(entry)
+        expanded = record.to_dict()
+        assert expanded == entry and list(expanded) == list(entry), entry
+        assert json.dumps(expanded) == json.dumps(entry)
+        assert [type(v) for v in expanded.values()] == [type(v) for v in entry.values()]
+    assert not hasattr(Meal.from_dict(entries[0][1]), '__dict__')
+
+
+def test_records_read_like_dicts():
+    entry = {'date': '2026-03-01', 'time': '08:05', 'calories': 520, 'notes': 'n'}
+    record = Meal.from_dict(entry)
+    assert record['date'] == '2026-03-01' and record['time'] == '08:05' and record['notes'] == 'n'
+    assert record.get('protein') is None and record.get('protein', 0) == 0
+    assert 'calories' in record and 'protein' not in record
+    assert record == entry and entry == record and {**record} == entry
+    assert len(record) == 4 and list(record.items()) == list(entry.items())
+    try:
+        record['fat']
+        assert False, 'missing field should raise KeyError'
+    except KeyError:
+        pass
+
+
+def test_compact_doc_copies_containers():
+    data = {'meals': [{'date': '2026-03-01', 'time': '08:00'}], 'settings': {'goal': 1}, '_version': 3}
+    doc = compact_doc(data)
+    assert isinstance(doc['meals'][0], Record) and doc['settings'] is not data['settings']
+    assert expand_doc(doc) == data and type(expand_doc(doc)['meals'][0]) is dict
+
+
+def test_compact_cache_matches_plain_cache():
+    """A compact cache answers exactly like the dict cache through writes, and hands out plain dicts"""
+    for make in (JSONUserStore, JournalUserStore, lambda d: SQLiteUserStore(f'{d}/lean.db')):
+        rng = random.Random(5)
+        stores = [CachedUserStore(make(tempfile.mkdtemp()), UserDocCache(compact=compact)) for compact in (False, True)]
+        meals = [_random_meal(rng) for _ in range(60)]
+        for i, meal in enumerate(meals):
+            meal['id'] = f'm{i}'
+        for store in stores:
+            store.save('u1', {'meals': [dict(m) for m in meals], 'settings': {'goal': 2000},
+                              'weight_history': [{'date': '2026-02-03', 'time': '07:00', 'weight': 180}]})
+            store.load('u1')
+        for step in range(30):
+            roll = rng.random()
+            meal_id = f'm{rng.randrange(60)}'
+            changes = {'calories': rng.randrange(900), 'date': _random_meal(rng)['date']}
+            new_meal = {**_random_meal(rng), 'id': f'n{step}'}
+            for store in stores:
+                if roll < 0.2:
+                    if store.find_meal('u1', meal_id):
+                        store.delete_meal('u1', meal_id)
+                elif roll < 0.4:
+                    if store.find_meal('u1', meal_id):
+                        store.update_meal('u1', meal_id, changes)
+                else:
+                    store.append_meal('u1', dict(new_meal))
+            plain, compact = (store.load('u1') for store in stores)
+            for doc in (plain, compact):
+                doc.pop('_version')
+            assert plain == compact, (make, step)
+            assert all(type(m) is dict for m in compact['meals'] + compact['weight_history'])
+            ranges = [store.meals_between('u1', '2026-02-10', '2026-02-20') for store in stores]
+            assert ranges[0] == ranges[1] and all(type(m) is dict for m in ranges[1])
+            assert stores[0].aggregate('u1', '2026-02-01', '2026-03-05', 'week') == \
+                stores[1].aggregate('u1', '2026-02-01', '2026-03-05', 'week')
+
+
+def main():
+    tests = [test_round_trip_is_exact, test_records_read_like_dicts, test_compact_doc_copies_containers,
+             test_compact_cache_matches_plain_cache]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
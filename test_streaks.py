@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Tests for the incremental streak state (streaks.py)
+Randomized differential test against the original full re-parse get_streak()
+"""
+
+import random
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+
+from daily_rollups import ROLLUP_KEY, add_meal, remove_meal
+from streaks import STREAK_KEY, build_streak, streak_summary
+from user_storage import CachedUserStore, JSONUserStore, JournalUserStore, SQLiteUserStore
+
+TODAY = date(2026, 3, 15)
+
+
+def _reference_streak(dates, today):
+    """The original /api/streak: sorted set of meal dates, strptime on every adjacent pair"""
+    dates_logged = sorted(set(dates))
+    if not dates_logged:
+        return {'current': 0, 'longest': 0, 'logged_today': False}
+    yesterday = (datetime.strptime(today, '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d')
+    current_streak = 0
+    longest_streak = 0
+    temp_streak = 1
+    if today in dates_logged or yesterday in dates_logged:
+        current_streak = 1
+        for i in range(len(dates_logged) - 1, 0, -1):
+            current_date = datetime.strptime(dates_logged[i], '%Y-%m-%d')
+            prev_date = datetime.strptime(dates_logged[i-1], '%Y-%m-%d')
+            if (current_date - prev_date).days == 1:
+                current_streak += 1
+            else:
+                break
+    for i in range(1, len(dates_logged)):
+        current_date = datetime.strptime(dates_logged[i], '%Y-%m-%d')
+        prev_date = datetime.strptime(dates_logged[i-1], '%Y-%m-%d')
+        if (current_date - prev_date).days == 1:
+            temp_streak += 1
+            longest_streak = max(longest_streak, temp_streak)
+        else:
+            temp_streak = 1
+    longest_streak = max(longest_streak, current_streak, temp_streak)
+    return {'current': current_streak, 'longest': longest_streak, 'logged_today': today in dates_logged}
+
+
+def _random_day(rng, span=40):
+    return (TODAY - timedelta(days=rng.randrange(-2, span))).isoformat()
+
+
+def test_incremental_state_matches_reference():
+    """Random adds/removes keep the state equal to a rebuild and the summary equal to the old code"""
+    for seed in range(12):
+        rng = random.Random(seed)
+        totals, meals = {}, []
+        state = build_streak(totals)
+        for _ in range(250):
+            if meals and rng.random() < 0.4:
+                meal = meals.pop(rng.randrange(len(meals)))
+                remove_meal(totals, meal, state)
+            else:
+                meal = {'date': _random_day(rng), 'calories': 100}
+                meals.append(meal)
+                add_meal(totals, meal, state)
+            assert state == build_streak(totals), seed
+            for today in (TODAY, TODAY - timedelta(days=3), TODAY + timedelta(days=2)):
+                today = today.isoformat()
+                assert streak_summary(state, totals, today) == \
+                    _reference_streak([m['date'] for m in meals], today), (seed, today)
+
+
+def test_engines_match_reference():
+    """Appends, date edits and deletes through every engine answer like the old endpoint"""
+    rng = random.Random(5)
+    for cached in (False, True):
+        tmp = tempfile.mkdtemp()
+        for inner in (JSONUserStore(tmp), JournalUserStore(f'{tmp}/journal'), SQLiteUserStore(f'{tmp}/lean.db')):
+            store = CachedUserStore(inner) if cached else inner
+            store.save('u1', {'meals': [{'date': _random_day(rng), 'time': '08:00', 'calories': 1}
+                                        for _ in range(15)], 'settings': {}})
+            for step in range(60):
+                meals = store.load('u1')['meals']
+                roll = rng.random()
+                if meals and roll < 0.25:
+                    store.delete_meal('u1', rng.choice(meals)['id'])
+                elif meals and roll < 0.4:
+                    store.update_meal('u1', rng.choice(meals)['id'], {'date': _random_day(rng)})
+                else:
+                    store.append_meal('u1', {'date': _random_day(rng), 'time': '12:00', 'calories': 1})
+                dates = [m['date'] for m in store.load('u1')['meals']]
+                assert store.streak('u1', TODAY.isoformat()) == _reference_streak(dates, TODAY.isoformat()), \
+                    (inner.name, cached, step)
+                if isinstance(inner, SQLiteUserStore):
+                    # The persisted streaks row, kept in step with daily_totals by each write's transaction
+                    conn = inner._conn()
+                    assert inner._stored_streak(conn, 'u1') == build_streak(inner._totals(conn, 'u1')), step
+
+            doc = store.load('u1')
+            assert doc[STREAK_KEY] == build_streak(doc[ROLLUP_KEY]), inner.name
+
+
+def test_legacy_documents_get_state():
+    """Documents written before the streak state existed get it on load"""
+    store = JSONUserStore(tempfile.mkdtemp())
+    store.save('u1', {'meals': [{'date': '2026-03-14', 'calories': 1}, {'date': '2026-03-15', 'calories': 1}]})
+    doc = store.load('u1')
+    del doc[STREAK_KEY]
+    store.save('u1', doc)
+    assert store.streak('u1', '2026-03-15') == {'current': 2, 'longest': 2, 'logged_today': True}
+
+
+def test_sqlite_backfills_streak_row():
+    """SQLite databases from before the streaks table get the row on the first read, then keep it up to date"""
+    store = SQLiteUserStore(f'{tempfile.mkdtemp()}/lean.db')
+    store.save('u1', {'meals': [{'date': '2026-03-13', 'calories': 1}, {'date': '2026-03-14', 'calories': 1}]})
+    conn = store._conn()
+    conn.execute('DELETE FROM streaks')
+    assert store.streak('u1', '2026-03-15') == {'current': 2, 'longest': 2, 'logged_today': False}
+    assert store._stored_streak(conn, 'u1') == build_streak({'2026-03-13': 1, '2026-03-14': 1})
+    store.append_meal('u1', {'date': '2026-03-15', 'calories': 1})
+    assert store.streak('u1', '2026-03-15') == {'current': 3, 'longest': 3, 'logged_today': True}
+    assert store.streak('nobody', '2026-03-15') == {'current': 0, 'longest': 0, 'logged_today': False}
+    assert store._stored_streak(conn, 'nobody') is None
+
+
+def main():
+    tests = [test_incremental_state_matches_reference, test_engines_match_reference, test_legacy_documents_get_state,
+             test_sqlite_backfills_streak_row]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
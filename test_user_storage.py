@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+Tests for the pluggable user storage engines (user_storage.py)
+Runs against temporary directories - no server needed
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import atomic_io
+import user_storage
+from atomic_io import group_commit_stats
+from daily_rollups import ROLLUP_KEY
+from streaks import STREAK_KEY
+from user_storage import (
+    VERSION_KEY, CachedUserStore, JSONUserStore, JournalUserStore, SQLiteUserStore, UserDocCache,
+    VersionConflict, _sort_key, insert_ordered, migrate_json_to_sqlite, reshard_documents, shard_of,
+)
+
+
+def _sample_doc():
+    return {
+        'meals': [
+            {'date': '2026-02-01', 'time': '08:00', 'description': 'Eggs', 'calories': 300, 'protein': 20},
+            {'date': '2026-02-02', 'time': '12:30', 'description': 'Chicken', 'calories': 500, 'protein': 45},
+            {'date': '2026-02-03', 'time': '19:00', 'description': 'Steak', 'calories': 700, 'protein': 60},
+        ],
+        'weight_history': [{'date': '2026-02-01', 'time': '07:00', 'weight': 185.5, 'notes': ''}],
+        'progress_photos': [],
+        'settings': {'daily_calorie_goal': 2200, 'daily_protein_goal': 200},
+        'workouts': [{'date': '2026-02-02', 'lifts': []}],
+    }
+
+
+def _stores():
+    tmp = tempfile.mkdtemp()
+    return [JSONUserStore(tmp), JournalUserStore(f'{tmp}/journal'), SQLiteUserStore(f'{tmp}/lean.db')]
+
+
+def test_round_trip():
+    """Every engine returns the document it was given"""
+    for store in _stores():
+        doc = _sample_doc()
+        assert not store.exists('u1')
+        store.save('u1', doc)
+        assert store.exists('u1')
+        assert store.load('u1') == doc, store.name
+
+
+def test_append_and_range_query():
+    """Appends are visible to date-range reads, in date order"""
+    for store in _stores():
+        store.save('u1', _sample_doc())
+        store.append_meal('u1', {'date': '2026-02-02', 'time': '20:00', 'calories': 100, 'protein': 5})
+        store.append_weight('u1', {'date': '2026-02-04', 'time': '07:00', 'weight': 184.0, 'notes': ''})
+
+        meals = store.meals_between('u1', '2026-02-02', '2026-02-03')
+        assert [(m['date'], m['time']) for m in meals] == [
+            ('2026-02-02', '12:30'), ('2026-02-02', '20:00'), ('2026-02-03', '19:00')
+        ], store.name
+        assert len(store.meals_between('u1', start='2026-02-03')) == 1
+        assert len(store.load('u1')['weight_history']) == 2
+        assert store.settings('u1')['daily_calorie_goal'] == 2200
+
+
+def test_sqlite_save_only_touches_changed_rows():
+    """Deleting one meal through save() keeps the other rows in place"""
+    store = SQLiteUserStore(f'{tempfile.mkdtemp()}/lean.db')
+    store.save('u1', _sample_doc())
+    ids_before = [r[0] for r in store._conn().execute('SELECT id FROM meals ORDER BY id')]
+
+    doc = store.load('u1')
+    doc['meals'].pop(1)
+    store.save('u1', doc)
+
+    ids_after = [r[0] for r in store._conn().execute('SELECT id FROM meals ORDER BY id')]
+    assert ids_after == [ids_before[0], ids_before[2]]
+
+
+def test_migrate_json_to_sqlite():
+    """Migration imports every JSON user file"""
+    tmp = tempfile.mkdtemp()
+    source = JSONUserStore(tmp)
+    source.save('u1', _sample_doc())
+    source.save('u2', _sample_doc())
+
+    assert migrate_json_to_sqlite(tmp, f'{tmp}/lean.db') == 2
+    target = SQLiteUserStore(f'{tmp}/lean.db')
+    doc = target.load('u2')
+    doc.pop(VERSION_KEY)
+    doc.pop(ROLLUP_KEY)
+    doc.pop(STREAK_KEY)
+    for meal in doc['meals']:
+        meal.pop('id')
+    assert doc == _sample_doc()
+
+
+def test_journal_appends_without_rewriting_snapshot():
+    """Journal appends leave the snapshot alone and compaction folds them in"""
+    store = JournalUserStore(tempfile.mkdtemp(), max_entries=1000)
+    store.save('u1', _sample_doc())
+    snapshot_mtime = os.stat(store.path('u1')).st_mtime_ns
+
+    for i in range(5):
+        store.append_meal('u1', {'date': '2026-02-04', 'time': f'0{i}:00', 'calories': 100, 'protein': 5})
+    assert os.stat(store.path('u1')).st_mtime_ns == snapshot_mtime
+    assert len(store.load('u1')['meals']) == 8
+
+    store.compact('u1')
+    assert len(JSONUserStore.load(store, 'u1')['meals']) == 8
+    assert store._read_journal('u1')[1] == []
+    assert len(store.load('u1')['meals']) == 8
+
+
+def test_journal_background_compaction():
+    """Crossing the entry threshold triggers a compaction thread"""
+    store = JournalUserStore(tempfile.mkdtemp(), max_entries=3)
+    store.save('u1', _sample_doc())
+    store.load('u1')
+    for i in range(4):
+        store.append_meal('u1', {'date': '2026-02-04', 'time': f'0{i}:00', 'calories': 100, 'protein': 5})
+
+    for _ in range(50):
+        if not store._compacting and not store._read_journal('u1')[1]:
+            break
+        time.sleep(0.02)
+    assert store._read_journal('u1')[1] == []
+    assert len(store.load('u1')['meals']) == 7
+
+
+def test_journal_ignores_already_folded_journal():
+    """A journal left over from an interrupted compaction is not replayed twice"""
+    store = JournalUserStore(tempfile.mkdtemp())
+    store.save('u1', _sample_doc())
+    store.append_meal('u1', {'date': '2026-02-04', 'time': '08:00', 'calories': 100, 'protein': 5})
+
+    # Simulate a crash after the new snapshot was renamed into place
+    journal = open(store.journal_path('u1')).read()
+    store.compact('u1')
+    with open(store.journal_path('u1'), 'w') as f:
+        f.write(journal)
+    os.utime(store.journal_path('u1'), ns=(0, 0))
+
+    assert len(store.load('u1')['meals']) == 4
+    store.append_meal('u1', {'date': '2026-02-05', 'time': '08:00', 'calories': 100, 'protein': 5})
+    assert len(store.load('u1')['meals']) == 5
+
+
+def test_cache_hits_and_invalidation():
+    """Repeated loads hit the cache; a write from another process invalidates it"""
+    tmp = tempfile.mkdtemp()
+    store = CachedUserStore(JSONUserStore(tmp))
+    store.save('u1', _sample_doc())
+
+    for _ in range(6):
+        assert len(store.load('u1')['meals']) == 3
+    assert store.cache_stats()['hits'] == 6
+
+    # Another worker rewrites the file behind our back
+    other = JSONUserStore(tmp)
+    doc = other.load('u1')
+    doc['meals'].append({'date': '2026-02-05', 'time': '09:00', 'calories': 1, 'protein': 1})
+    other.save('u1', doc)
+    assert len(store.load('u1')['meals']) == 4
+    assert store.cache_stats()['misses'] == 1
+
+
+def test_cached_writes_skip_reparsing_the_document():
+    """Appends and saves through the cache start from the cached copy, not a reparse of the file"""
+    for compact in (False, True):
+        tmp = tempfile.mkdtemp()
+        inner = JSONUserStore(tmp)
+        store = CachedUserStore(inner, UserDocCache(compact=compact))
+        store.save('u1', _sample_doc())
+        ledger = store.deficit_ledger('u1', '2026-02-01', 2000)
+        parses = []
+        load_file = inner._load_file
+        inner._load_file = lambda uid: parses.append(uid) or load_file(uid)
+
+        for i in range(5):
+            store.append_meal('u1', {'date': '2026-02-03', 'time': f'{18 + i}:30', 'calories': 100, 'protein': 5})
+        store.append_weight('u1', {'date': '2026-02-04', 'time': '07:00', 'weight': 184.0, 'notes': ''})
+        doc = store.load('u1')
+        doc['settings']['daily_calorie_goal'] = 2100
+        store.save('u1', doc, expected_version=doc[VERSION_KEY])
+        assert parses == [] and store.cache_stats()['misses'] == 0
+
+        fresh = JSONUserStore(tmp).load('u1')
+        assert store.load('u1') == fresh and len(fresh['meals']) == 8 and len(fresh['weight_history']) == 2
+        assert store.deficit_ledger('u1', '2026-02-01', 2000).cum_calories[-1] == ledger.cum_calories[-1] + 500
+        assert [m['time'] for m in store.meals_between('u1', '2026-02-03', '2026-02-03')] == \
+            ['18:30', '19:00', '19:30', '20:30', '21:30', '22:30']
+
+
+def test_cache_returns_independent_copies():
+    """Mutating a loaded document does not leak into the cache"""
+    for inner in _stores():
+        store = CachedUserStore(inner)
+        store.save('u1', _sample_doc())
+        doc = store.load('u1')
+        doc['meals'].pop()
+        doc['settings']['daily_calorie_goal'] = 1
+        assert len(store.load('u1')['meals']) == 3, inner.name
+        assert store.settings('u1')['daily_calorie_goal'] == 2200
+
+
+def test_cache_eviction_by_entries_and_bytes():
+    """LRU evicts the least recently used document past either limit"""
+    cache = UserDocCache(max_entries=2, max_bytes=100)
+    cache.put('a', 1, {}, 10)
+    cache.put('b', 1, {}, 10)
+    cache.get('a', 1)
+    cache.put('c', 1, {}, 10)
+    assert cache.get('b', 1) is None
+    assert cache.get('a', 1) is not None
+
+    cache.put('d', 1, {}, 95)
+    assert cache.stats()['entries'] == 1
+    assert cache.stats()['bytes'] == 95
+    assert cache.stats()['evictions'] == 3
+
+
+def test_versions_and_compare_and_swap():
+    """Every write bumps the version; a stale save raises VersionConflict"""
+    for store in _stores():
+        store.save('u1', _sample_doc())
+        first = store.load('u1')
+        second = store.load('u1')
+        version = first[VERSION_KEY]
+
+        store.append_meal('u1', {'date': '2026-02-04', 'time': '08:00', 'calories': 100, 'protein': 5})
+        assert store.load('u1')[VERSION_KEY] == version + 1, store.name
+
+        # Both copies were loaded before the append
+        first['settings']['daily_calorie_goal'] = 1800
+        try:
+            store.save('u1', first, expected_version=first[VERSION_KEY])
+            assert False, f'{store.name}: stale save was accepted'
+        except VersionConflict:
+            pass
+
+        fresh = store.load('u1')
+        fresh['settings']['daily_calorie_goal'] = 1800
+        store.save('u1', fresh, expected_version=fresh[VERSION_KEY])
+        assert fresh[VERSION_KEY] == version + 2
+
+        second['meals'] = []
+        try:
+            store.save('u1', second, expected_version=second[VERSION_KEY])
+            assert False, f'{store.name}: stale save was accepted'
+        except VersionConflict:
+            pass
+        assert len(store.load('u1')['meals']) == 4
+
+
+def test_concurrent_writes_share_group_commits():
+    """In batch mode concurrent append_meal() / save() calls on one json user share commits and lose nothing"""
+    fsync, window = user_storage.FSYNC_MODE, atomic_io._group_commit.window
+    user_storage.FSYNC_MODE, atomic_io._group_commit.window = 'batch', 0.02
+    try:
+        tmp = tempfile.mkdtemp()
+        for cached in (False, True):
+            inner = JSONUserStore(f'{tmp}/{cached}')
+            store = CachedUserStore(inner) if cached else inner
+            store.save('u1', _sample_doc())
+            version = store.load('u1')[VERSION_KEY]
+            barrier = threading.Barrier(20)
+
+            def append(i):
+                barrier.wait()
+                store.append_meal('u1', {'date': '2026-02-05', 'time': f'{i:02d}:00', 'calories': 100, 'protein': 5})
+
+            before = group_commit_stats()
+            threads = [threading.Thread(target=append, args=(i,)) for i in range(20)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            after = group_commit_stats()
+            assert after['writes'] - before['writes'] == 20, store.name
+            assert after['commits'] - before['commits'] < 20, (before, after)
+
+            doc = JSONUserStore(inner.data_dir).load('u1')
+            assert len(doc['meals']) == 23 and doc[VERSION_KEY] == version + 20
+            assert doc[ROLLUP_KEY]['2026-02-05'] == {**doc[ROLLUP_KEY]['2026-02-05'], 'calories': 2000, 'meal_count': 20}
+            assert store.load('u1') == doc
+
+            # Whole-document saves coalesce too; the last one queued is what is stored
+            docs = [{**_sample_doc(), 'settings': {'daily_calorie_goal': 1500 + i}} for i in range(8)]
+            barrier = threading.Barrier(8)
+            stamps = []
+
+            def save(doc):
+                barrier.wait()
+                stamps.append(store.save('u1', doc))
+
+            before = group_commit_stats()
+            threads = [threading.Thread(target=save, args=(d,)) for d in docs]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            assert group_commit_stats()['commits'] - before['commits'] < 8
+            stored = store.load('u1')
+            assert stored[VERSION_KEY] == version + 28 and store.stamp('u1') in stamps
+            assert [d for d in docs if d[VERSION_KEY] == stored[VERSION_KEY]][0]['settings'] == stored['settings']
+    finally:
+        user_storage.FSYNC_MODE, atomic_io._group_commit.window = fsync, window
+
+
+def test_journal_compaction_keeps_version():
+    """Folding the journal does not change the logical document version"""
+    store = JournalUserStore(tempfile.mkdtemp())
+    store.save('u1', _sample_doc())
+    store.append_meal('u1', {'date': '2026-02-04', 'time': '08:00', 'calories': 100, 'protein': 5})
+    version = store.load('u1')[VERSION_KEY]
+    store.compact('u1')
+    assert store.load('u1')[VERSION_KEY] == version
+    assert store.current_version('u1') == version
+
+
+def test_insert_ordered_matches_stable_sort():
+    """Ordered inserts give the same list a stable re-sort would, on every engine's replay too"""
+    import random
+    rng = random.Random(3)
+    entries, expected = [], []
+    for i in range(300):
+        day = f'2026-02-{rng.randrange(1, 29):02d}' if i % 4 else '2026-03-01'
+        entry = {'date': day, 'time': f'{rng.randrange(6, 22):02d}:00', 'n': i}
+        insert_ordered(entries, entry)
+        expected.append(entry)
+        expected.sort(key=_sort_key)
+        assert entries == expected
+
+    for store in _stores():
+        doc = _sample_doc()
+        doc['meals'].reverse()  # written before ordered inserts: sorted on save
+        store.save('u1', doc)
+        for entry in entries[:40]:
+            store.append_meal('u1', {**entry, 'calories': 100})
+        meals = store.load('u1')['meals']
+        assert [_sort_key(m) for m in meals] == sorted(_sort_key(m) for m in meals), store.name
+
+
+def test_sharded_layout():
+    """Files live in <data_dir>/ab/cd; the flat layout still writes <data_dir>/<uid>.json"""
+    tmp = tempfile.mkdtemp()
+    for engine in (JSONUserStore, JournalUserStore):
+        store = engine(f'{tmp}/{engine.name}')
+        for uid in ('u1', 'u2', 'u3'):
+            store.save(uid, _sample_doc())
+        store.append_meal('u1', {'date': '2026-02-04', 'time': '08:00', 'calories': 100})
+        assert store.path('u1') == os.path.join(store.data_dir, shard_of('u1'), 'u1.json')
+        assert os.path.exists(store.path('u1'))
+        assert not any(f.endswith('.json') for f in os.listdir(store.data_dir)), store.name
+        assert store.uids() == ['u1', 'u2', 'u3'] and not store.exists('u4')
+        assert len(engine(store.data_dir).load('u1')['meals']) == 4, store.name
+
+    flat = JSONUserStore(f'{tmp}/flat', layout='flat')
+    flat.save('u1', _sample_doc())
+    assert os.path.exists(f'{tmp}/flat/u1.json') and flat.uids() == ['u1']
+
+
+def test_reshard_moves_flat_documents():
+    """Pre-sharding files are served in place, then moved with their journal by reshard"""
+    for engine in (JSONUserStore, JournalUserStore):
+        tmp = tempfile.mkdtemp()
+        old = engine(tmp, layout='flat')
+        old.save('u1', _sample_doc())
+        old.append_meal('u1', {'date': '2026-02-04', 'time': '08:00', 'calories': 100})
+        old.save('u2', _sample_doc())
+
+        store = engine(tmp)
+        expected = old.load('u1')
+        assert store.load('u1') == expected and store.uids() == ['u1', 'u2'], store.name
+        store.save('u3', _sample_doc())  # new users go straight to their shard
+        assert os.path.dirname(store.path('u3')) != tmp
+
+        assert reshard_documents(tmp) == 2 and reshard_documents(tmp) == 0
+        assert sorted(os.listdir(tmp)) == sorted({shard_of(u)[:2] for u in ('u1', 'u2', 'u3')}), store.name
+        fresh = engine(tmp)
+        assert fresh.load('u1') == expected and fresh.uids() == ['u1', 'u2', 'u3'], store.name
+        assert store.load('u1') == expected  # a store opened before the move still finds it
+
+
+def main():
+    tests = [test_round_trip, test_append_and_range_query,
+             test_sqlite_save_only_touches_changed_rows, test_migrate_json_to_sqlite,
+             test_journal_appends_without_rewriting_snapshot, test_journal_background_compaction,
+             test_journal_ignores_already_folded_journal, test_cache_hits_and_invalidation,
+             test_cached_writes_skip_reparsing_the_document,
+             test_cache_returns_independent_copies, test_cache_eviction_by_entries_and_bytes,
+             test_versions_and_compare_and_swap, test_concurrent_writes_share_group_commits,
+             test_journal_compaction_keeps_version,
+             test_insert_ordered_matches_stable_sort, test_sharded_layout, test_reshard_moves_flat_documents]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
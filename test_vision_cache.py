@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Tests for the vision result cache (vision_cache.py) and the analyzers skipping their model call on a hit
+"""
+
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import app_pro
+import local_vision_analyzer
+import vision_cache
+import voice_fix
+from job_queue import JobQueue
+from user_storage import CachedUserStore, JSONUserStore
+from vision_cache import VisionCache, image_digest
+
+MEAL = {'food': 'granola bar', 'calories': 190, 'protein': 4, 'carbs': 29, 'fat': 7}
+
+
+_saved = {}
+
+
+def setup_module():
+    """Point app_pro at a fresh store, job directory and vision cache under a temp dir"""
+    global TMP
+    TMP = tempfile.mkdtemp()
+    _saved.update(store=app_pro.store, jobs=app_pro.jobs, vision_db=app_pro.vision_cache.db_path)
+    app_pro.store = CachedUserStore(JSONUserStore(TMP))
+    app_pro.jobs = JobQueue(os.path.join(TMP, '.jobs'), on_finish=app_pro._publish_job)
+    app_pro.vision_cache.db_path = os.path.join(TMP, 'vision_cache.db')
+    app_pro.vision_cache._local = threading.local()
+
+
+def teardown_module():
+    app_pro.store, app_pro.jobs = _saved['store'], _saved['jobs']
+    app_pro.vision_cache.db_path = _saved['vision_db']
+    app_pro.vision_cache._local = threading.local()
+    shutil.rmtree(TMP, ignore_errors=True)
+
+
+def _segment(marker, payload):
+    return bytes((0xFF, marker)) + (len(payload) + 2).to_bytes(2, 'big') + payload
+
+
+def _jpeg(pixels=b'\x12\x34\x56', exif=b'Exif\x00\x00camera A'):
+    """A minimal JPEG-shaped byte string: metadata, a quantization table, then the scan"""
+    return (b'\xff\xd8' + _segment(0xE0, b'JFIF\x00') + _segment(0xE1, exif) + _segment(0xDB, b'\x00' * 65)
+            + _segment(0xFE, b'comment') + _segment(0xDA, b'\x01\x01\x00') + pixels + b'\xff\xd9')
+
+
+def _cache(**kwargs):
+    return VisionCache(os.path.join(tempfile.mkdtemp(), 'vision.db'), **kwargs)
+
+
+def test_digest_ignores_metadata_not_pixels():
+    assert image_digest(_jpeg()) == image_digest(_jpeg(exif=b'Exif\x00\x00phone B, 2026-10-01'))
+    assert image_digest(_jpeg()) != image_digest(_jpeg(pixels=b'\x12\x34\x57'))
+    assert vision_cache.normalize_image(b'\x89PNG\r\n') == b'\x89PNG\r\n'
+    assert vision_cache.normalize_image(b'\xff\xd8\x00garbage') == b'\xff\xd8\x00garbage'
+
+
+def test_hits_per_model_across_instances():
+    cache = _cache()
+    assert cache.get(_jpeg(), 'gpt-4o') is None
+    cache.put(_jpeg(), 'gpt-4o', MEAL)
+    assert cache.get(_jpeg(exif=b'other'), 'gpt-4o') == MEAL
+    assert cache.get(_jpeg(), 'llava:latest') is None
+    # Another worker process opening the same file sees the entry
+    assert VisionCache(cache.db_path).get(_jpeg(), 'gpt-4o') == MEAL
+    assert cache.stats() == {**cache.stats(), 'hits': 1, 'misses': 2, 'entries': 1}
+
+
+def test_ttl_and_lru_eviction():
+    cache = _cache(ttl=0.2, max_entries=3)
+    photos = [_jpeg(pixels=bytes([i])) for i in range(4)]
+    for i, photo in enumerate(photos[:3]):
+        cache.put(photo, 'gpt-4o', {**MEAL, 'calories': i})
+        time.sleep(0.01)
+    assert cache.get(photos[0], 'gpt-4o')['calories'] == 0  # now the most recently used
+    cache.put(photos[3], 'gpt-4o', MEAL)
+    assert cache.get(photos[1], 'gpt-4o') is None and cache.get(photos[0], 'gpt-4o') is not None
+    assert cache.stats()['entries'] == 3
+    time.sleep(0.25)
+    assert cache.get(photos[0], 'gpt-4o') is None
+    assert cache.evict() == 3 and cache.stats()['entries'] == 0
+
+
+def test_near_duplicates_within_distance():
+    """Matching by perceptual hash (computed with Pillow when installed - stood in for here)"""
+    hashes = {_jpeg(pixels=b'a'): 0b1011, _jpeg(pixels=b'b'): 0b1001, _jpeg(pixels=b'c'): 0b0110100}
+    original = vision_cache.perceptual_hash
+    vision_cache.perceptual_hash = hashes.get
+    try:
+        cache = _cache()
+        cache.phash_distance = 2
+        cache.put(_jpeg(pixels=b'a'), 'gpt-4o', MEAL)
+        assert cache.get(_jpeg(pixels=b'b'), 'gpt-4o') == MEAL  # 1 bit apart
+        assert cache.get(_jpeg(pixels=b'c'), 'gpt-4o') is None  # 5 bits apart
+        assert cache.stats()['near_hits'] == 1
+    finally:
+        vision_cache.perceptual_hash = original
+    if vision_cache.Image is None:
+        assert _cache(phash_distance=4).phash_distance == 0
+
+
+def test_unusable_cache_never_raises():
+    cache = VisionCache(tempfile.mkdtemp())  # a directory, not a database file
+    cache.put(_jpeg(), 'gpt-4o', MEAL)
+    assert cache.get(_jpeg(), 'gpt-4o') is None
+    assert cache.stats()['entries'] is None and cache.stats()['errors'] == 4
+
+
+def test_photo_log_hit_skips_job_and_api():
+    calls = []
+    original = voice_fix.analyze_meal_photo_direct
+
+    def analyze(image_bytes, api_key):
+        calls.append(len(image_bytes))
+        return json.dumps(MEAL)
+
+    voice_fix.analyze_meal_photo_direct = analyze
+    try:
+        client = app_pro.app.test_client()
+        client.set_cookie('lean_uid', 'vision-user')
+        accepted = client.post('/api/photo_log', data={'photo': (io.BytesIO(_jpeg()), 'bar.jpg')})
+        assert accepted.status_code == 202
+        deadline = time.time() + 5
+        while client.get(accepted.get_json()['status_url']).get_json()['status'] != 'done':
+            assert time.time() < deadline
+            time.sleep(0.01)
+
+        started = time.perf_counter()
+        again = client.post('/api/photo_log', data={'photo': (io.BytesIO(_jpeg(exif=b'resaved')), 'bar.jpg')})
+        assert again.status_code == 200 and (time.perf_counter() - started) < 0.5
+        assert again.get_json() == {'success': True, 'meal': MEAL, 'cached': True}
+        assert calls == [len(_jpeg())]
+        assert client.get('/api/today').get_json()['totals']['calories'] == 2 * MEAL['calories']
+    finally:
+        voice_fix.analyze_meal_photo_direct = original
+
+
+def test_local_analyzer_hit_skips_model():
+    path = os.path.join(tempfile.mkdtemp(), 'bar.jpg')
+    with open(path, 'wb') as f:
+        f.write(_jpeg(pixels=b'local'))
+    url = local_vision_analyzer.OLLAMA_API_URL
+    local_vision_analyzer.OLLAMA_API_URL = 'http://127.0.0.1:9/api/generate'  # nothing listens here
+    try:
+        assert not local_vision_analyzer.analyze_food_image_local(path)['success']
+        app_pro.vision_cache.put(_jpeg(pixels=b'local'), local_vision_analyzer.VISION_MODEL, MEAL)
+        assert local_vision_analyzer.analyze_food_image_local(path) == {'success': True, 'data': MEAL, 'cached': True}
+    finally:
+        local_vision_analyzer.OLLAMA_API_URL = url
+
+
+def main():
+    tests = [test_digest_ignores_metadata_not_pixels, test_hits_per_model_across_instances,
+             test_ttl_and_lru_eviction, test_near_duplicates_within_distance, test_unusable_cache_never_raises,
+             test_photo_log_hit_skips_job_and_api, test_local_analyzer_hit_skips_model]
+    failed = 0
+    setup_module()
+    try:
+        for test in tests:
+            try:
+                test()
+                print(f"✅ {test.__name__}")
+            except AssertionError as e:
+                failed += 1
+                print(f"❌ {test.__name__}: {e}")
+    finally:
+        teardown_module()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
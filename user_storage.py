@@ -0,0 +1,1926 @@
+#!/usr/bin/env python3
+"""
+User Data Storage for Lean
+Pluggable per-user storage engines behind app_pro.load_data/save_data
+
+Backends (LEAN_STORAGE_BACKEND):
+    json   - one JSON document per user in LEAN_USER_DATA_DIR (default); past
+             LEAN_COMPRESS_MIN_BYTES it is stored as <uid>.json.zst / .json.gz
+             (compressed_io.py) and read back transparently
+    sqlite - single SQLite database in WAL mode (LEAN_USER_DB), one row per
+             meal / weight / progress photo so logging is a single insert
+    journal - <uid>.json snapshot plus an append-only <uid>.jsonl journal;
+              logging appends one line, a background compactor folds the
+              journal into a new snapshot past LEAN_JOURNAL_MAX_BYTES/ENTRIES
+              (snapshots are compressed like json documents, journals never)
+
+Layout of the json / journal files (LEAN_USER_LAYOUT):
+    sharded - <data_dir>/ab/cd/<uid>.json, ab/cd from a hash of the uid, so
+              no directory grows past a few dozen entries at millions of
+              users (default). Shard directories are created by the first
+              write into them; documents still in the flat directory are
+              served from there until `reshard` moves them.
+    flat    - <data_dir>/<uid>.json
+
+Documents, journal lines and SQLite payloads are encoded by json_codec.py
+(orjson when installed, compact unless LEAN_JSON_INDENT=2).
+
+Every document carries a monotonically increasing '_version'. save() with
+expected_version is a compare-and-swap (VersionConflict on mismatch) and
+locked(uid) holds a per-user lock across worker processes. With
+LEAN_FSYNC=batch the json / journal engines group-commit whole-document
+writes per user: saves and appends arriving within LEAN_GROUP_COMMIT_MS are
+applied to one load of the document, under one hold of the lock, and
+written with a single fsync - the window is waited out before the lock is
+taken, so the lock is held only for the commit itself.
+
+Every engine is wrapped in a per-process LRU cache of parsed documents
+(LEAN_USER_CACHE_ENTRIES / LEAN_USER_CACHE_BYTES, 0 disables), validated by
+file mtime+size or the SQLite per-user version and updated on save. Cached
+documents carry a MealDateIndex (meal_index.py) that answers meals_between()
+with bisect and is updated in place by append_meal() / update_meal() /
+delete_meal(). Meals are addressed by a stable 'id' assigned when stored.
+Per-day rollups (daily_rollups.py) and the logging streak state (streaks.py)
+are kept in step on every write (SQLite: daily_totals and streaks rows, in
+the write's transaction); deficit ledgers (deficit_ledger.py) and
+range aggregate indexes (range_aggregates.py) built from a cached document
+are carried forward across meal writes. With LEAN_USER_CACHE_COMPACT=1 the
+cache holds meals, weights and photos as slotted records (records.py) and
+expands them back to dicts on load() and range reads.
+
+A cache miss doesn't load the whole document for range reads, settings,
+totals or the streak: json / journal documents are written in per-month
+sections with a <uid>.idx block index (doc_sections.py), and read_sections()
+fetches just the blocks asked for (the journal replays its appends on top).
+Documents without a current index are loaded whole, as before.
+
+With LEAN_ARCHIVE_AFTER_DAYS set, the json / journal engines move meals of
+months past that horizon into compressed per-month segments in
+<uid>.archive/ whenever they write the document (meal_archive.py), leaving
+recent meals in it. load() returns that hot document; meals_between() and
+load_all() merge the archived months back in, and rollups, streaks and
+aggregates are unaffected since daily totals stay in the document.
+
+Usage:
+    python user_storage.py migrate            # import data/users/*.json into SQLite
+    python user_storage.py migrate --dry-run
+    python user_storage.py compact            # fold every journal into its snapshot
+    python user_storage.py rebuild-rollups    # recompute daily_totals and streak from raw meals
+    python user_storage.py backfill-meal-ids  # give pre-id meals a stable 'id'
+    python user_storage.py recompress [--pause SECONDS]  # convert documents to the LEAN_COMPRESSION format
+    python user_storage.py reshard            # move flat data/users/<uid>.* files into their shards
+"""
+
+import fcntl
+import hashlib
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from bisect import insort
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
+import compressed_io
+import doc_sections
+import json_codec
+import meal_archive
+from atomic_io import FSYNC_MODE, ensure_dir, group_commit, write_document_atomic, write_file_atomic
+from daily_rollups import METRICS, ROLLUP_KEY, add_meal, build_rollups, ensure_rollups, remove_meal, totals_between
+from deficit_ledger import DeficitLedger
+from meal_archive import ARCHIVE_AFTER_DAYS, ARCHIVE_KEY
+from meal_index import MEAL_ID_KEY, MealDateIndex, assign_meal_ids, new_meal_id
+from range_aggregates import AggregateIndex, aggregate
+from records import Meal, compact_doc, expand, expand_doc
+from streaks import STREAK_KEY, build_streak, day_added, day_removed, ensure_streak, streak_summary
+
+logger = logging.getLogger(__name__)
+
+USER_DATA_DIR = os.getenv('LEAN_USER_DATA_DIR', 'data/users')
+STORAGE_BACKEND = os.getenv('LEAN_STORAGE_BACKEND', 'json')
+USER_LAYOUT = os.getenv('LEAN_USER_LAYOUT', 'sharded')
+USER_DB_PATH = os.getenv('LEAN_USER_DB', os.path.join(USER_DATA_DIR, 'lean.db'))
+JOURNAL_MAX_BYTES = int(os.getenv('LEAN_JOURNAL_MAX_BYTES', 256 * 1024))
+JOURNAL_MAX_ENTRIES = int(os.getenv('LEAN_JOURNAL_MAX_ENTRIES', 500))
+USER_CACHE_ENTRIES = int(os.getenv('LEAN_USER_CACHE_ENTRIES', 256))
+USER_CACHE_BYTES = int(os.getenv('LEAN_USER_CACHE_BYTES', 64 * 1024 * 1024))
+USER_CACHE_COMPACT = os.getenv('LEAN_USER_CACHE_COMPACT', '0') == '1'
+
+# Monotonic per-user document version, bumped by every write
+VERSION_KEY = '_version'
+
+LAYOUTS = ('sharded', 'flat')
+
+# Document keys that the SQLite engine stores as rows instead of inside the blob
+COLLECTION_KEYS = ('meals', 'weight_history', 'progress_photos')
+
+
+def _safe_uid(uid: str) -> str:
+    return ''.join(ch for ch in uid if ch.isalnum() or ch in ('-', '_'))
+
+
+def shard_of(uid: str) -> str:
+    """'ab/cd' - the two-level shard directory of a (safe) uid"""
+    digest = hashlib.blake2b(uid.encode('utf-8'), digest_size=2).hexdigest()
+    return os.path.join(digest[:2], digest[2:])
+
+
+def _is_shard_name(name):
+    return len(name) == 2 and all(ch in '0123456789abcdef' for ch in name)
+
+
+def _subdirs(directory):
+    """Shard-named ('ab') subdirectories of directory"""
+    with os.scandir(directory) as entries:
+        return [e.path for e in entries if _is_shard_name(e.name) and e.is_dir()]
+
+
+def _shard_dirs(data_dir):
+    """Every existing <data_dir>/ab/cd shard directory"""
+    for top in _subdirs(data_dir):
+        yield from _subdirs(top)
+
+
+def _sort_key(entry):
+    return (entry.get('date', ''), entry.get('time', '00:00'))
+
+
+def insert_ordered(entries, entry):
+    """
+    Insert entry into a (date, time)-ordered list after any equal keys - the
+    same place a stable re-sort would put it. New entries are nearly always
+    the latest, which is a plain O(1) append; back-dated ones are an insort.
+    """
+    if not entries or _sort_key(entries[-1]) <= _sort_key(entry):
+        entries.append(entry)
+    else:
+        insort(entries, entry, key=_sort_key)
+
+
+def _meals_in(meals, start=None, end=None):
+    return [
+        m for m in meals
+        if (start is None or m['date'] >= start) and (end is None or m['date'] <= end)
+    ]
+
+
+def _stat_stamp(st):
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return _stat_stamp(st)
+
+
+def _number(value):
+    """REAL column -> int when whole, so rollups read back the way they were written"""
+    return int(value) if float(value).is_integer() else value
+
+
+def _is_ordered(entries):
+    keys = [_sort_key(e) for e in entries]
+    return all(a <= b for a, b in zip(keys, keys[1:]))
+
+
+def _prepare_for_write(data):
+    """
+    Invariants every stored document keeps: meals and weights in (date, time)
+    order, every meal has an id, rollups match the meals
+    """
+    for key in ('meals', 'weight_history'):
+        if key in data and not _is_ordered(data[key]):
+            data[key].sort(key=_sort_key)  # documents written before ordered inserts
+    assign_meal_ids(data.get('meals', []))
+    ensure_rollups(data)
+
+
+def _apply_meal_change(data, meal, updated):
+    """Swap meal for updated (None removes it) in data's meal list and rollups, without a re-sort"""
+    totals = ensure_rollups(data)
+    # Same-day edits never change which days are logged, so leave the streak alone
+    moved = updated is None or (updated.get('date') or '') != (meal.get('date') or '')
+    streak = data[STREAK_KEY] if moved else None
+    meals = data.setdefault('meals', [])
+    pos = next(i for i, m in enumerate(meals) if m is meal or m.get(MEAL_ID_KEY) == meal[MEAL_ID_KEY])
+    del meals[pos]
+    remove_meal(totals, meal, streak)
+    if updated is not None:
+        if _sort_key(updated) == _sort_key(meal):
+            meals.insert(pos, updated)
+        else:
+            insert_ordered(meals, updated)
+        add_meal(totals, updated, streak)
+
+
+def _insert_meal(data, meal):
+    add_meal(ensure_rollups(data), meal, data[STREAK_KEY])
+    insert_ordered(data.setdefault('meals', []), meal)
+
+
+class VersionConflict(Exception):
+    """save() was given a document loaded before someone else's write"""
+
+
+# Group commit (LEAN_FSYNC=batch): concurrent writes to one user's document
+# are queued as changes, and one leader applies them all to a single load of
+# the document and writes it once (see JSONUserStore._grouped). A change is
+# change(current, version) -> (document, result): current() is the document
+# as the changes before it left it, version its version.
+
+def _replacing(uid, data, expected_version):
+    """save() as a change: data replaces the document, if expected_version still holds"""
+    def change(current, version):
+        if expected_version is not None and expected_version != version:
+            raise VersionConflict(f'{uid}: expected version {expected_version}, found {version}')
+        data[VERSION_KEY] = version + 1
+        return data, None
+    return change
+
+
+def _updating(fn):
+    """_update() as a change: fn(document) applied to the latest document, returning fn's result"""
+    def change(current, version):
+        data = current()
+        return data, fn(data)
+    return change
+
+
+def _apply_changes(changes, version, load):
+    """
+    Fold changes onto the stored document at version, in order; load()
+    reads it, only if a change needs it. Returns the document to write
+    (None if every change failed), its version, and per change either
+    (result, the document it left) or the exception it raised. A change
+    must raise before it mutates the document.
+    """
+    data = None
+    outcomes = []
+    for change in changes:
+        try:
+            data, result = change(lambda: load() if data is None else data, version)
+            version += 1
+            outcomes.append((result, data))
+        except Exception as e:
+            outcomes.append(e)
+    return data, version, outcomes
+
+
+def _settle(outcomes, data, stamp):
+    """
+    GroupCommit results from _apply_changes() outcomes once data is written
+    at stamp: (result, stamp), with the stamp None for a change whose
+    document a later save() replaced, or the change's exception
+    """
+    return [o if isinstance(o, Exception) else (o[0], stamp if o[1] is data else None) for o in outcomes]
+
+
+class UserStore:
+    """Interface shared by all storage engines"""
+
+    name = 'base'
+    archive_after_days = 0  # engines that tier old meals into archive segments override this
+    group_commits = False  # engines with _grouped() / _commit_locked() set this
+    appends_rewrite_document = True  # append_*() load and save the whole document
+
+    def exists(self, uid):
+        raise NotImplementedError
+
+    def load(self, uid):
+        """
+        Return the user document, including its VERSION_KEY. Meals of
+        archived months (meal_archive.py) are not in it - see load_all().
+        """
+        raise NotImplementedError
+
+    def load_all(self, uid):
+        """load() with the archived months' meals merged back into 'meals' - the complete history"""
+        for attempt in range(2):
+            data = self.load(uid)
+            archive = data.pop(ARCHIVE_KEY, None)
+            if not archive:
+                return data
+            try:
+                data['meals'] = meal_archive.merge(self._archived_meals(uid, archive, sorted(archive)),
+                                                   data.get('meals', []))
+                return data
+            except FileNotFoundError:
+                if attempt:
+                    raise
+
+    def save(self, uid, data, expected_version=None):
+        """
+        Persist the full user document and stamp it with the next version.
+        With expected_version this is a compare-and-swap: VersionConflict is
+        raised if the stored version moved on since the document was loaded.
+        Returns the stamp() of what was written, read while still locked.
+        """
+        raise NotImplementedError
+
+    def locked(self, uid):
+        """Exclusive per-user lock across worker processes (re-entrant per thread)"""
+        return nullcontext()
+
+    def uids(self):
+        """Every user with a stored document"""
+        raise NotImplementedError
+
+    def _update(self, uid, fn):
+        """
+        Apply fn(data) to the latest document and save it; returns fn's
+        result. Engines that rewrite the whole document group-commit these.
+        """
+        with self.locked(uid):
+            data = self.load(uid)
+            result = fn(data)
+            self.save(uid, data)
+            return result
+
+    def append_meal(self, uid, meal):
+        meal.setdefault(MEAL_ID_KEY, new_meal_id())
+        self._update(uid, lambda data: _insert_meal(data, meal))
+
+    def append_weight(self, uid, entry):
+        self._update(uid, lambda data: insert_ordered(data.setdefault('weight_history', []), entry))
+
+    def append_progress_photo(self, uid, photo):
+        self._update(uid, lambda data: data.setdefault('progress_photos', []).append(photo))
+
+    def find_meal(self, uid, meal_id):
+        """The meal with this id, or None"""
+        return next((m for m in self.load(uid).get('meals', []) if m.get(MEAL_ID_KEY) == meal_id), None)
+
+    def delete_meal(self, uid, meal_id):
+        """Remove and return the meal with this id (KeyError if there is none)"""
+        with self.locked(uid):
+            meal = self.find_meal(uid, meal_id)
+            if meal is None:
+                return self._change_archived_meal(uid, meal_id, None)
+            self._replace_meal(uid, meal, None)
+            return meal
+
+    def update_meal(self, uid, meal_id, changes):
+        """Apply changes to the meal with this id and return the new record (KeyError if there is none)"""
+        with self.locked(uid):
+            meal = self.find_meal(uid, meal_id)
+            if meal is None:
+                return self._change_archived_meal(uid, meal_id, changes)
+            updated = {**meal, **changes, MEAL_ID_KEY: meal_id}
+            self._replace_meal(uid, meal, updated)
+            return updated
+
+    def _change_archived_meal(self, uid, meal_id, changes):
+        """
+        delete_meal() / update_meal() of a meal in an archived month (caller
+        holds the lock): thaw the month back into the document, change the
+        meal there and save, which archives the month again as a new segment
+        """
+        data = self.load(uid)
+        archive = data.get(ARCHIVE_KEY) or {}
+        for month in sorted(archive, reverse=True):
+            meals = self._archived_meals(uid, archive, [month])
+            meal = next((m for m in meals if m.get(MEAL_ID_KEY) == meal_id), None)
+            if meal is not None:
+                break
+        else:
+            raise KeyError(meal_id)
+        del archive[month]
+        data['meals'] = meal_archive.merge(meals, data.get('meals', []))
+        updated = None if changes is None else {**meal, **changes, MEAL_ID_KEY: meal_id}
+        _apply_meal_change(data, meal, updated)
+        self.save(uid, data)
+        return meal if updated is None else updated
+
+    def _replace_meal(self, uid, meal, updated, data=None):
+        """
+        Persist swapping meal (found by id, caller holds the lock) for updated,
+        or its removal when updated is None. data, if given, is the current
+        document with the change already applied.
+        """
+        if data is None:
+            data = self.load(uid)
+            _apply_meal_change(data, meal, updated)
+        self.save(uid, data)
+
+    def read_sections(self, uid, keys, start=None, end=None, latest=None):
+        """
+        {key: value} for those of the document's top-level keys it has, read
+        without the rest of the document. 'meals' / 'weight_history' may be cut
+        to the months overlapping start..end, or with latest=n to a tail holding
+        their last n entries. None when the engine can't for this document -
+        load() it instead.
+        """
+        return None
+
+    def _sections_or_load(self, uid, keys, start=None, end=None, latest=None, optional=()):
+        """read_sections() when it has every key (optional ones if present), else the whole document"""
+        part = self.read_sections(uid, tuple(keys) + tuple(optional), start, end, latest)
+        if part is not None and all(key in part for key in keys):
+            return part
+        return self.load(uid)
+
+    def _archived_meals(self, uid, archive, months):
+        """Meals of these archived months (archive: the document's ARCHIVE_KEY), oldest first"""
+        return []
+
+    def _with_archived(self, uid, archive, meals, start=None, end=None):
+        """meals - the document's in start..end - with those of its archived months in the range merged in"""
+        months = meal_archive.months_in(archive, start, end) if archive else []
+        if not months:
+            return meals
+        return meal_archive.merge(_meals_in(self._archived_meals(uid, archive, months), start, end), meals)
+
+    def meals_between(self, uid, start=None, end=None):
+        """Meals with start <= date <= end ('YYYY-MM-DD', either bound optional), archived ones included"""
+        for attempt in range(2):
+            data = self._sections_or_load(uid, ('meals',), start, end, optional=(ARCHIVE_KEY,))
+            try:
+                return self._with_archived(uid, data.get(ARCHIVE_KEY), _meals_in(data.get('meals', []), start, end),
+                                           start, end)
+            except FileNotFoundError:
+                if attempt:
+                    raise  # the segment was replaced after the document was read - read both again
+
+    def latest_weights(self, uid, n):
+        """The last n weight entries, oldest first"""
+        weights = self._sections_or_load(uid, ('weight_history',), latest=n).get('weight_history', [])
+        return weights[-n:] if n > 0 else []
+
+    def daily_totals(self, uid, start=None, end=None):
+        """{date: per-day macro totals} for logged days in the range (see daily_rollups.py)"""
+        return totals_between(self._sections_or_load(uid, (ROLLUP_KEY,)).get(ROLLUP_KEY, {}), start, end)
+
+    def streak(self, uid, today):
+        """{'current', 'longest', 'logged_today'} as of today ('YYYY-MM-DD'), see streaks.py"""
+        data = self._sections_or_load(uid, (STREAK_KEY, ROLLUP_KEY))
+        return streak_summary(data[STREAK_KEY], data[ROLLUP_KEY], today)
+
+    def deficit_ledger(self, uid, start, goal):
+        """DeficitLedger over the rollups from start ('YYYY-MM-DD') for a daily calorie goal"""
+        return DeficitLedger(self.daily_totals(uid, start), start, goal)
+
+    def aggregate(self, uid, start, end, group='day'):
+        """Per-bucket macro totals for start..end grouped by day/week/month (see range_aggregates.py)"""
+        return aggregate(self.daily_totals(uid, start, end), start, end, group)
+
+    def settings(self, uid):
+        return self._sections_or_load(uid, ('settings',)).get('settings', {})
+
+    def stamp(self, uid):
+        """Cheap token that changes whenever the stored document changes (None = unknown)"""
+        return None
+
+    def size_hint(self, uid):
+        """Approximate stored size in bytes, used for cache accounting"""
+        return 0
+
+
+class JSONUserStore(UserStore):
+    """One JSON document per user: <data_dir>/ab/cd/<uid>.json, or .json.zst / .json.gz once large"""
+
+    name = 'json'
+    group_commits = True
+
+    DOC_SUFFIXES = ('.json',) + tuple(f'.json{s}' for s in compressed_io.SUFFIXES.values())
+
+    def __init__(self, data_dir=USER_DATA_DIR, compression=compressed_io.COMPRESSION,
+                 compress_min_bytes=compressed_io.COMPRESS_MIN_BYTES, layout=USER_LAYOUT,
+                 archive_after_days=ARCHIVE_AFTER_DAYS):
+        if layout not in LAYOUTS:
+            raise ValueError(f'Unknown LEAN_USER_LAYOUT: {layout}')
+        self.data_dir = data_dir
+        self.layout = layout
+        self.compression = compression
+        self.compress_min_bytes = compress_min_bytes
+        self.archive_after_days = archive_after_days
+        self._versions = {}  # uid -> (file stamp, version, journal generation) seen on last read/write
+        self._held = threading.local()
+        ensure_dir(data_dir, fsync=False)
+        # Pre-sharding documents left in the flat directory are looked up there too
+        self._flat_docs = layout == 'sharded' and any(self._uids_in(data_dir, first=True))
+
+    def _home(self, uid):
+        """<uid>.json where the layout puts it"""
+        safe = _safe_uid(uid)
+        if self.layout == 'flat':
+            return os.path.join(self.data_dir, f'{safe}.json')
+        return os.path.join(self.data_dir, shard_of(safe), f'{safe}.json')
+
+    def _flat(self, home):
+        return os.path.join(self.data_dir, os.path.basename(home))
+
+    def _locate(self, uid):
+        """(variant path, os.stat_result) of the stored document, or (home path, None)"""
+        home = self._home(uid)
+        found = compressed_io.resolve(home)
+        if found[1] is None and self._flat_docs:
+            found = compressed_io.resolve(self._flat(home))
+            if found[1] is None:
+                found = compressed_io.resolve(home)  # moved into its shard between the two looks
+        return found
+
+    def path(self, uid):
+        """<uid>.json - the document may actually be stored at a compressed variant of it"""
+        home = self._home(uid)
+        if self._flat_docs and not self._locate(uid)[0].startswith(home):
+            return self._flat(home)
+        return home
+
+    def exists(self, uid):
+        return self._locate(uid)[1] is not None
+
+    @classmethod
+    def _uids_in(cls, directory, first=False):
+        """uids with a document directly in directory (stops at the first one with first=True)"""
+        found = set()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                for suffix in cls.DOC_SUFFIXES:
+                    if entry.name.endswith(suffix):
+                        found.add(entry.name[:-len(suffix)])
+                        if first:
+                            return found
+        return found
+
+    def uids(self):
+        if not os.path.isdir(self.data_dir):
+            return []
+        directories = [] if self.layout == 'flat' else list(_shard_dirs(self.data_dir))
+        if self.layout == 'flat' or self._flat_docs:
+            directories.append(self.data_dir)
+        return sorted(set().union(*(self._uids_in(d) for d in directories)))
+
+    @contextmanager
+    def locked(self, uid, exclusive=True):
+        """fcntl advisory lock on <uid>.lock, shared by every worker process"""
+        held = getattr(self._held, 'uids', None)
+        if held is None:
+            held = self._held.uids = set()
+        if uid in held:
+            yield
+            return
+        lock_path = self._home(uid)[:-len('.json')] + '.lock'
+        try:
+            lock_file = open(lock_path, 'a')
+        except FileNotFoundError:
+            # First write into this shard - every write takes the lock, so this is where it is made
+            ensure_dir(os.path.dirname(lock_path), fsync=FSYNC_MODE != 'none')
+            lock_file = open(lock_path, 'a')
+        with lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            held.add(uid)
+            try:
+                yield
+            finally:
+                held.discard(uid)
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write_doc(self, uid, data):
+        """Write the document in sections with its index (doc_sections.py); pretty-printed ones whole"""
+        def dump(doc):
+            if json_codec.JSON_INDENT:
+                return json_codec.dumpb(doc, indent=json_codec.JSON_INDENT)
+            return doc_sections.split(doc) or json_codec.dumpb(doc)
+
+        # Already coalesced by _grouped() when batching, so this write is the commit
+        payload, fsync = dump(data), FSYNC_MODE != 'none'
+        if isinstance(payload, doc_sections.SplitDocument):
+            doc_sections.write(self.path(uid), payload, fsync, self.compression, self.compress_min_bytes)
+        else:
+            write_document_atomic(self.path(uid), payload, fsync, self.compression, self.compress_min_bytes)
+
+    def _freeze(self, uid, data):
+        """Move data's meals past the archive horizon into segments before it is written (prune after)"""
+        meal_archive.freeze(meal_archive.archive_dir(self.path(uid)), data,
+                            meal_archive.hot_from(self.archive_after_days), data[ROLLUP_KEY],
+                            FSYNC_MODE != 'none', self.compression)
+
+    def _prune(self, uid, data):
+        meal_archive.prune(meal_archive.archive_dir(self.path(uid)), data)
+
+    def _archived_meals(self, uid, archive, months):
+        return meal_archive.read_months(meal_archive.archive_dir(self.path(uid)), archive, months)
+
+    def read_sections(self, uid, keys, start=None, end=None, latest=None):
+        return doc_sections.read_sections(self.path(uid), keys, start, end, latest)
+
+    def _load_file(self, uid):
+        path, st = self._locate(uid)
+        if st is None:
+            raise FileNotFoundError(path)
+        with open(path, 'rb') as f:
+            data = json_codec.loads(compressed_io.decompress(f.read(), path))
+        stamp = _stat_stamp(st)
+        self._versions[uid] = (stamp, data.get(VERSION_KEY, 0), data.get(JournalUserStore.GENERATION_KEY, 0))
+        return data
+
+    def _file_version(self, uid):
+        """(version, generation) of the file on disk, parsing it only if it changed since we last saw it"""
+        stamp = self.stamp(uid)
+        if stamp is None:
+            return 0, 0
+        seen = self._versions.get(uid)
+        if seen is None or seen[0] != stamp:
+            self._load_file(uid)
+            seen = self._versions[uid]
+        return seen[1], seen[2]
+
+    def current_version(self, uid):
+        return self._file_version(uid)[0]
+
+    def load(self, uid):
+        data = self._load_file(uid)
+        ensure_rollups(data)
+        return data
+
+    def save(self, uid, data, expected_version=None):
+        # A save that a concurrent one replaced within the same commit returns stamp None
+        return self._grouped(uid, _replacing(uid, data, expected_version))[1]
+
+    def _update(self, uid, fn):
+        return self._grouped(uid, _updating(fn))[0]
+
+    def _grouped(self, uid, change, commit=None):
+        """
+        (result, stamp) of change once commit(uid, changes) (default
+        _commit()) wrote it. In batch mode changes for uid arriving within
+        LEAN_GROUP_COMMIT_MS share that one load, write and fsync; the window
+        is waited out before the user's lock is taken.
+        """
+        commit = commit or self._commit
+        if FSYNC_MODE == 'batch' and uid not in getattr(self._held, 'uids', ()):
+            return group_commit((self, uid), change, lambda changes: commit(uid, changes))
+        # Nothing to coalesce with - or this thread holds the lock a leader would wait for
+        outcome = commit(uid, [change])[0]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def _commit(self, uid, changes):
+        with self.locked(uid):
+            data, version, outcomes = _apply_changes(changes, self.current_version(uid), lambda: self.load(uid))
+            stamp = self._commit_locked(uid, data, version) if data is not None else None
+            return _settle(outcomes, data, stamp)
+
+    def _commit_locked(self, uid, data, version):
+        """Write data as the document at version (caller holds the lock); returns its stamp"""
+        data[VERSION_KEY] = version
+        _prepare_for_write(data)
+        self._freeze(uid, data)
+        self._write_doc(uid, data)
+        self._prune(uid, data)
+        stamp = self.stamp(uid)
+        self._versions[uid] = (stamp, version, 0)
+        return stamp
+
+    def stamp(self, uid):
+        st = self._locate(uid)[1]
+        return _stat_stamp(st) if st else None
+
+    def size_hint(self, uid):
+        path, st = self._locate(uid)
+        return doc_sections.decoded_size(compressed_io.base_path(path), path, st) if st else 0
+
+    def _needs_recompress(self, uid):
+        """Whether the stored variant differs from what the compression settings pick for it"""
+        base = self.path(uid)
+        current = compressed_io.resolve(base)[0]
+        codec = compressed_io.codec_for(self.compression, len(compressed_io.read_document(base)),
+                                        self.compress_min_bytes)
+        target = base + compressed_io.SUFFIXES[codec] if codec else base
+        stray = [p for p in compressed_io.variants(base) if p != target and os.path.exists(p)]
+        return current != target or bool(stray)
+
+    def recompress(self, uid):
+        """Rewrite the document in the format the settings pick (same content and version); True if rewritten"""
+        with self.locked(uid):
+            if not self._needs_recompress(uid):
+                return False
+            path = self.path(uid)
+            text = compressed_io.read_document(path)
+            if doc_sections.is_current(path):
+                self._write_doc(uid, json_codec.loads(text))  # keep it readable in sections
+            else:
+                write_document_atomic(path, text, FSYNC_MODE != 'none', self.compression, self.compress_min_bytes)
+            return True
+
+
+class JournalUserStore(JSONUserStore):
+    """
+    Log-structured engine: <uid>.json snapshot + <uid>.jsonl journal
+
+    The first journal line is a header {"generation": n}. The snapshot
+    records the generation its journal started from, so a journal left
+    behind by an interrupted compaction (older generation) is ignored
+    instead of being replayed twice. The document version is the snapshot
+    version plus the number of journal entries, so appends bump it too.
+    """
+
+    name = 'journal'
+    appends_rewrite_document = False
+
+    GENERATION_KEY = '_journal_generation'
+
+    # journal op -> document collection it appends to ('update_meal' and
+    # 'delete_meal' replace / drop an existing meal by id instead)
+    OPS = {
+        'meal': 'meals',
+        'weight': 'weight_history',
+        'photo': 'progress_photos',
+    }
+
+    def __init__(self, data_dir=USER_DATA_DIR, max_bytes=JOURNAL_MAX_BYTES, max_entries=JOURNAL_MAX_ENTRIES,
+                 compression=compressed_io.COMPRESSION, compress_min_bytes=compressed_io.COMPRESS_MIN_BYTES,
+                 layout=USER_LAYOUT, archive_after_days=ARCHIVE_AFTER_DAYS):
+        super().__init__(data_dir, compression, compress_min_bytes, layout, archive_after_days)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = {}  # uid -> journal entry count, when known
+        self._compacting = set()
+        self._compacting_lock = threading.Lock()
+
+    def journal_path(self, uid):
+        return self.path(uid)[:-len('.json')] + '.jsonl'
+
+    def _read_journal(self, uid):
+        """Return (generation, entries) or (None, []) when there is no journal"""
+        try:
+            with open(self.journal_path(uid), 'rb') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return None, []
+        if not lines:
+            return None, []
+        generation = json_codec.loads(lines[0]).get('generation', 0)
+        entries = []
+        for line in lines[1:]:
+            try:
+                entries.append(json_codec.loads(line))
+            except ValueError:
+                break  # torn final line from a crash mid-append
+        return generation, entries
+
+    def _journal_generation(self, uid):
+        try:
+            with open(self.journal_path(uid), 'rb') as f:
+                return json_codec.loads(f.readline()).get('generation', 0)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _journal_is_stale(self, uid):
+        """Compaction always replaces the journal after the snapshot, so a
+        journal older than its snapshot (or a missing one) can't take appends"""
+        try:
+            journal_mtime = os.stat(self.journal_path(uid)).st_mtime_ns
+        except FileNotFoundError:
+            return True
+        snapshot = self._locate(uid)[1]
+        if snapshot is None:
+            raise FileNotFoundError(self.path(uid))
+        return snapshot.st_mtime_ns > journal_mtime
+
+    def _load_unlocked(self, uid):
+        data = self._load_file(uid)
+        snapshot_generation = data.pop(self.GENERATION_KEY, 0)
+        generation, entries = self._read_journal(uid)
+        if generation != snapshot_generation:
+            entries = []  # already folded into the snapshot
+        totals = data.get(ROLLUP_KEY)
+        streak = ensure_streak(data, totals) if totals is not None else None
+        meal_positions = None  # meal id -> list position, built on the first edit/delete
+        resort = False
+        for entry in entries:
+            op, record = entry['op'], entry['entry']
+            if op in self.OPS:
+                collection = data.setdefault(self.OPS[op], [])
+                if op == 'photo':
+                    collection.append(record)
+                elif op == 'meal' and meal_positions is not None:
+                    # Positions must stay put until the end; order is restored below
+                    collection.append(record)
+                    meal_positions[record.get(MEAL_ID_KEY)] = len(collection) - 1
+                    resort = True
+                else:
+                    insert_ordered(collection, record)
+                if op == 'meal' and totals is not None:
+                    add_meal(totals, record, streak)
+                continue
+            # 'update_meal' / 'delete_meal' address an earlier meal by id
+            meals = data.setdefault('meals', [])
+            if meal_positions is None:
+                meal_positions = {m.get(MEAL_ID_KEY): i for i, m in enumerate(meals)}
+            pos = meal_positions.get(record[MEAL_ID_KEY])
+            if pos is None:
+                continue
+            moved = op == 'delete_meal' or record.get('date') != meals[pos].get('date')
+            if totals is not None:
+                remove_meal(totals, meals[pos], streak if moved else None)
+            if op == 'update_meal':
+                resort = resort or _sort_key(record) != _sort_key(meals[pos])
+                meals[pos] = record
+                if totals is not None:
+                    add_meal(totals, record, streak if moved else None)
+            else:
+                meals[pos] = None
+                del meal_positions[record[MEAL_ID_KEY]]
+        if meal_positions is not None:
+            data['meals'] = [m for m in data['meals'] if m is not None]
+        if resort:
+            data['meals'].sort(key=_sort_key)
+        ensure_rollups(data)
+        data[VERSION_KEY] = data.get(VERSION_KEY, 0) + len(entries)
+        self._entries[uid] = len(entries)
+        return data
+
+    def _write_unlocked(self, uid, data):
+        """Write a new snapshot generation and start an empty journal for it"""
+        current = self._journal_generation(uid)
+        generation = (current or 0) + 1
+        _prepare_for_write(data)
+        self._freeze(uid, data)
+        snapshot = dict(data)
+        snapshot[self.GENERATION_KEY] = generation
+        self._write_doc(uid, snapshot)
+        write_file_atomic(
+            self.journal_path(uid),
+            json_codec.dumpb({'generation': generation}) + b'\n',
+            fsync=(FSYNC_MODE != 'none')
+        )
+        self._prune(uid, data)
+        self._versions[uid] = (JSONUserStore.stamp(self, uid), data.get(VERSION_KEY, 0), generation)
+        self._entries[uid] = 0
+        return self.stamp(uid)
+
+    def current_version(self, uid):
+        version, snapshot_generation = self._file_version(uid)
+        generation, entries = self._read_journal(uid)
+        return version + (len(entries) if generation == snapshot_generation else 0)
+
+    def load(self, uid):
+        with self.locked(uid, exclusive=False):
+            return self._load_unlocked(uid)
+
+    def _commit_locked(self, uid, data, version):
+        data[VERSION_KEY] = version
+        return self._write_unlocked(uid, data)
+
+    def _append(self, uid, op, entry):
+        with self.locked(uid):
+            path = self.journal_path(uid)
+            if self._journal_is_stale(uid):
+                # Snapshot written by another engine, or a compaction that died
+                # between its two renames - start a journal for its generation
+                generation = self._load_file(uid).get(self.GENERATION_KEY, 0)
+                with open(path, 'wb') as f:
+                    f.write(json_codec.dumpb({'generation': generation}) + b'\n')
+            with open(path, 'ab') as f:
+                f.write(json_codec.dumpb({'op': op, 'entry': entry}) + b'\n')
+                size = f.tell()
+                if FSYNC_MODE == 'always':
+                    f.flush()
+                    os.fsync(f.fileno())
+        if uid in self._entries:
+            self._entries[uid] += 1
+        if size > self.max_bytes or self._entries.get(uid, 0) > self.max_entries:
+            self._schedule_compaction(uid)
+
+    def read_sections(self, uid, keys, start=None, end=None, latest=None):
+        """Snapshot sections with the journal's appends replayed onto them (edits and deletes need a full load)"""
+        wanted = set(keys) | {self.GENERATION_KEY} | ({ROLLUP_KEY} if STREAK_KEY in keys else set())
+        with self.locked(uid, exclusive=False):
+            part = super().read_sections(uid, wanted, start, end, latest)
+            if part is None:
+                return None
+            generation, entries = self._read_journal(uid)
+        if generation != part.pop(self.GENERATION_KEY, 0):
+            entries = []  # already folded into the snapshot
+        if any(entry['op'] not in self.OPS for entry in entries):
+            return None
+        totals = part.get(ROLLUP_KEY)
+        streak = ensure_streak(part, totals) if totals is not None and STREAK_KEY in keys else None
+        for entry in entries:
+            op, record = entry['op'], entry['entry']
+            key = self.OPS[op]
+            if key in keys:
+                collection = part.setdefault(key, [])
+                if op == 'photo':
+                    collection.append(record)
+                else:
+                    insert_ordered(collection, record)
+            if op == 'meal' and totals is not None:
+                add_meal(totals, record, streak)
+        return part
+
+    def append_meal(self, uid, meal):
+        meal.setdefault(MEAL_ID_KEY, new_meal_id())
+        self._append(uid, 'meal', meal)
+
+    def _replace_meal(self, uid, meal, updated, data=None):
+        if updated is None:
+            self._append(uid, 'delete_meal', {MEAL_ID_KEY: meal[MEAL_ID_KEY]})
+        else:
+            self._append(uid, 'update_meal', updated)
+
+    def append_weight(self, uid, entry):
+        self._append(uid, 'weight', entry)
+
+    def append_progress_photo(self, uid, photo):
+        self._append(uid, 'photo', photo)
+
+    def stamp(self, uid):
+        snapshot = super().stamp(uid)
+        if snapshot is None:
+            return None
+        return (snapshot, _file_stamp(self.journal_path(uid)))
+
+    def size_hint(self, uid):
+        journal = _file_stamp(self.journal_path(uid))
+        return super().size_hint(uid) + (journal[2] if journal else 0)
+
+    def recompress(self, uid):
+        # Rewriting the snapshot alone would make its journal look stale - fold it in instead
+        with self.locked(uid):
+            if not self._needs_recompress(uid):
+                return False
+            self.compact(uid)
+            return True
+
+    def compact(self, uid):
+        """Fold the journal into a new snapshot (the document version is unchanged)"""
+        with self.locked(uid):
+            self._write_unlocked(uid, self._load_unlocked(uid))
+
+    def _schedule_compaction(self, uid):
+        with self._compacting_lock:
+            if uid in self._compacting:
+                return
+            self._compacting.add(uid)
+
+        def run():
+            try:
+                self.compact(uid)
+            except Exception:
+                logger.exception('Journal compaction failed for %s', uid)
+            finally:
+                with self._compacting_lock:
+                    self._compacting.discard(uid)
+
+        threading.Thread(target=run, name=f'compact-{uid}', daemon=True).start()
+
+
+class _StoredDays:
+    """
+    The days uid has meals on, answered from daily_totals by point lookups:
+    as much of a rollup table as streaks.py needs, without loading one
+    """
+
+    def __init__(self, conn, uid):
+        self.conn = conn
+        self.uid = uid
+
+    def __contains__(self, day):
+        row = self.conn.execute('SELECT 1 FROM daily_totals WHERE uid = ? AND date = ?', (self.uid, day)).fetchone()
+        return row is not None
+
+    def __iter__(self):
+        return (day for (day,) in self.conn.execute('SELECT date FROM daily_totals WHERE uid = ?', (self.uid,)))
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM daily_totals WHERE uid = ?', (self.uid,)).fetchone()[0]
+
+
+class SQLiteUserStore(UserStore):
+    """
+    SQLite engine (WAL mode)
+    meals / weights / progress_photos hold one row per entry, indexed by
+    (uid, date, time); everything else in the document lives in user_docs.
+    user_docs.version is bumped by every write and serves as the cache stamp.
+    """
+
+    name = 'sqlite'
+    appends_rewrite_document = False
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS user_docs (
+        uid TEXT PRIMARY KEY,
+        doc TEXT NOT NULL,
+        version INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS settings (
+        uid TEXT PRIMARY KEY,
+        settings TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS meals (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        uid TEXT NOT NULL,
+        date TEXT NOT NULL,
+        time TEXT NOT NULL DEFAULT '',
+        payload TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_meals_uid_date ON meals(uid, date, time);
+    CREATE INDEX IF NOT EXISTS idx_meals_uid_id ON meals(uid, json_extract(payload, '$.id'));
+    CREATE TABLE IF NOT EXISTS weights (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        uid TEXT NOT NULL,
+        date TEXT NOT NULL,
+        time TEXT NOT NULL DEFAULT '',
+        payload TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_weights_uid_date ON weights(uid, date, time);
+    CREATE TABLE IF NOT EXISTS progress_photos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        uid TEXT NOT NULL,
+        date TEXT NOT NULL,
+        time TEXT NOT NULL DEFAULT '',
+        payload TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_photos_uid_date ON progress_photos(uid, date);
+    CREATE TABLE IF NOT EXISTS daily_totals (
+        uid TEXT NOT NULL,
+        date TEXT NOT NULL,
+        calories REAL NOT NULL DEFAULT 0,
+        protein REAL NOT NULL DEFAULT 0,
+        carbs REAL NOT NULL DEFAULT 0,
+        fat REAL NOT NULL DEFAULT 0,
+        meal_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (uid, date)
+    );
+    CREATE TABLE IF NOT EXISTS streaks (
+        uid TEXT PRIMARY KEY,
+        run_start INTEGER NOT NULL,
+        last_day INTEGER NOT NULL,
+        longest INTEGER NOT NULL,
+        days INTEGER NOT NULL
+    );
+    """
+
+    STREAK_COLUMNS = ('run_start', 'last_day', 'longest', 'days')
+
+    # LEAN_FSYNC -> PRAGMA synchronous (WAL commits are already group-committed)
+    SYNCHRONOUS = {
+        'always': 'FULL',
+        'batch': 'NORMAL',
+        'none': 'OFF',
+    }
+
+    # document key -> table
+    TABLES = {
+        'meals': 'meals',
+        'weight_history': 'weights',
+        'progress_photos': 'progress_photos',
+    }
+
+    def __init__(self, db_path=USER_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(f'PRAGMA synchronous={self.SYNCHRONOUS[FSYNC_MODE]}')
+            conn.executescript(self.SCHEMA)
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(user_docs)')]
+            if 'version' not in columns:
+                conn.execute('ALTER TABLE user_docs ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+            self._local.conn = conn
+        return conn
+
+    def exists(self, uid):
+        row = self._conn().execute('SELECT 1 FROM user_docs WHERE uid = ?', (uid,)).fetchone()
+        return row is not None
+
+    def uids(self):
+        return [uid for (uid,) in self._conn().execute('SELECT uid FROM user_docs ORDER BY uid')]
+
+    def _rows(self, table, uid, start=None, end=None):
+        sql = f'SELECT payload FROM {table} WHERE uid = ?'
+        args = [uid]
+        if start is not None:
+            sql += ' AND date >= ?'
+            args.append(start)
+        if end is not None:
+            sql += ' AND date <= ?'
+            args.append(end)
+        sql += ' ORDER BY date, time, id'
+        return [json_codec.loads(p) for (p,) in self._conn().execute(sql, args)]
+
+    @contextmanager
+    def _transaction(self, mode='IMMEDIATE'):
+        """BEGIN ... COMMIT, or join the transaction this thread already has open"""
+        conn = self._conn()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute(f'BEGIN {mode}')
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def locked(self, uid):
+        """Hold the database write lock (BEGIN IMMEDIATE) for the whole block"""
+        return self._transaction()
+
+    def load(self, uid):
+        with self._transaction('DEFERRED') as conn:
+            row = conn.execute('SELECT doc, version FROM user_docs WHERE uid = ?', (uid,)).fetchone()
+            if row is None:
+                raise FileNotFoundError(f'No data for user {uid}')
+            data = json_codec.loads(row[0])
+            data[VERSION_KEY] = row[1]
+            settings_row = conn.execute('SELECT settings FROM settings WHERE uid = ?', (uid,)).fetchone()
+            if settings_row is not None:
+                data['settings'] = json_codec.loads(settings_row[0])
+            for key, table in self.TABLES.items():
+                data[key] = self._rows(table, uid)
+            data[ROLLUP_KEY] = self._totals(conn, uid)
+            state = self._stored_streak(conn, uid)
+            if state is not None:
+                data[STREAK_KEY] = state
+        ensure_rollups(data)
+        return data
+
+    def _totals(self, conn, uid, start=None, end=None):
+        sql = 'SELECT date, calories, protein, carbs, fat, meal_count FROM daily_totals WHERE uid = ?'
+        args = [uid]
+        if start is not None:
+            sql += ' AND date >= ?'
+            args.append(start)
+        if end is not None:
+            sql += ' AND date <= ?'
+            args.append(end)
+        return {
+            row[0]: {'calories': _number(row[1]), 'protein': _number(row[2]), 'carbs': _number(row[3]),
+                     'fat': _number(row[4]), 'meal_count': row[5]}
+            for row in conn.execute(sql, args)
+        }
+
+    def _sync_totals(self, conn, uid, totals):
+        """Make the daily_totals rows for uid match totals, touching only changed days"""
+        existing = self._totals(conn, uid)
+        changed = [(uid, day, t['calories'], t['protein'], t['carbs'], t['fat'], t['meal_count'])
+                   for day, t in totals.items() if existing.get(day) != t]
+        stale = [(uid, day) for day in existing if day not in totals]
+        if changed:
+            conn.executemany(
+                'INSERT OR REPLACE INTO daily_totals (uid, date, calories, protein, carbs, fat, meal_count) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', changed
+            )
+        if stale:
+            conn.executemany('DELETE FROM daily_totals WHERE uid = ? AND date = ?', stale)
+
+    def _stored_streak(self, conn, uid):
+        row = conn.execute(f'SELECT {", ".join(self.STREAK_COLUMNS)} FROM streaks WHERE uid = ?', (uid,)).fetchone()
+        return dict(zip(self.STREAK_COLUMNS, row)) if row else None
+
+    def _put_streak(self, conn, uid, state):
+        conn.execute(
+            'INSERT OR REPLACE INTO streaks (uid, run_start, last_day, longest, days) VALUES (?, ?, ?, ?, ?)',
+            (uid, *(state[k] for k in self.STREAK_COLUMNS))
+        )
+
+    def _streak_state(self, conn, uid):
+        """uid's streaks row, built from daily_totals the first time (databases from before the table)"""
+        state = self._stored_streak(conn, uid)
+        if state is None:
+            state = build_streak(_StoredDays(conn, uid))
+            self._put_streak(conn, uid, state)
+        return state
+
+    def _insert(self, conn, table, uid, entry):
+        conn.execute(
+            f'INSERT INTO {table} (uid, date, time, payload) VALUES (?, ?, ?, ?)',
+            (uid, entry.get('date', ''), entry.get('time', ''), json_codec.dumps(entry))
+        )
+
+    def _sync_rows(self, conn, table, uid, entries):
+        """Make the rows for uid match entries, touching only what changed"""
+        existing = {}
+        for row_id, payload in conn.execute(f'SELECT id, payload FROM {table} WHERE uid = ?', (uid,)):
+            existing.setdefault(payload, []).append(row_id)
+        for entry in entries:
+            payload = json_codec.dumps(entry)
+            ids = existing.get(payload)
+            if ids:
+                ids.pop()
+            else:
+                self._insert(conn, table, uid, entry)
+        stale = [row_id for ids in existing.values() for row_id in ids]
+        if stale:
+            conn.executemany(f'DELETE FROM {table} WHERE id = ?', [(i,) for i in stale])
+
+    def save(self, uid, data, expected_version=None):
+        _prepare_for_write(data)
+        skip = COLLECTION_KEYS + ('settings', VERSION_KEY, ROLLUP_KEY, STREAK_KEY)
+        doc = {k: v for k, v in data.items() if k not in skip}
+        with self._transaction() as conn:
+            row = conn.execute('SELECT version FROM user_docs WHERE uid = ?', (uid,)).fetchone()
+            current = row[0] if row else 0
+            if expected_version is not None and expected_version != current:
+                raise VersionConflict(f'{uid}: expected version {expected_version}, found {current}')
+            conn.execute(
+                'INSERT INTO user_docs (uid, doc, version) VALUES (?, ?, ?) '
+                'ON CONFLICT(uid) DO UPDATE SET doc = excluded.doc, version = excluded.version',
+                (uid, json_codec.dumps(doc), current + 1)
+            )
+            conn.execute(
+                'INSERT INTO settings (uid, settings) VALUES (?, ?) '
+                'ON CONFLICT(uid) DO UPDATE SET settings = excluded.settings',
+                (uid, json_codec.dumps(data.get('settings', {})))
+            )
+            for key, table in self.TABLES.items():
+                self._sync_rows(conn, table, uid, data.get(key, []))
+            self._sync_totals(conn, uid, data[ROLLUP_KEY])
+            self._put_streak(conn, uid, ensure_streak(data, data[ROLLUP_KEY]))
+        data[VERSION_KEY] = current + 1
+        return current + 1
+
+    def _adjust_totals(self, conn, uid, meal, sign=1):
+        """
+        Fold one meal into (or, with sign=-1, out of) its day's daily_totals row,
+        and the streaks row along with it when the day gains its first meal or
+        loses its last
+        """
+        day = meal.get('date') or ''
+        days = _StoredDays(conn, uid)
+        new_day = sign > 0 and day not in days
+        conn.execute(
+            'INSERT INTO daily_totals (uid, date, calories, protein, carbs, fat, meal_count) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(uid, date) DO UPDATE SET '
+            'calories = calories + excluded.calories, protein = protein + excluded.protein, '
+            'carbs = carbs + excluded.carbs, fat = fat + excluded.fat, '
+            'meal_count = meal_count + excluded.meal_count',
+            (uid, day, *(sign * (meal.get(k) or 0) for k in METRICS), sign)
+        )
+        gone = sign < 0 and conn.execute(
+            'DELETE FROM daily_totals WHERE uid = ? AND date = ? AND meal_count <= 0', (uid, day)
+        ).rowcount > 0
+        if new_day or gone:
+            state = self._stored_streak(conn, uid)
+            if state is None:
+                state = build_streak(days)  # already counts this change
+            elif new_day:
+                day_added(state, days, day)
+            else:
+                day_removed(state, days, day)
+            self._put_streak(conn, uid, state)
+
+    def _append(self, table, uid, entry):
+        with self._transaction() as conn:
+            self._insert(conn, table, uid, entry)
+            if table == 'meals':
+                self._adjust_totals(conn, uid, entry)
+            conn.execute('UPDATE user_docs SET version = version + 1 WHERE uid = ?', (uid,))
+
+    def append_meal(self, uid, meal):
+        meal.setdefault(MEAL_ID_KEY, new_meal_id())
+        self._append('meals', uid, meal)
+
+    def find_meal(self, uid, meal_id):
+        row = self._conn().execute(
+            "SELECT payload FROM meals WHERE uid = ? AND json_extract(payload, '$.id') = ?", (uid, meal_id)
+        ).fetchone()
+        return json_codec.loads(row[0]) if row else None
+
+    def _replace_meal(self, uid, meal, updated, data=None):
+        with self._transaction() as conn:
+            where = "uid = ? AND json_extract(payload, '$.id') = ?"
+            if updated is None:
+                conn.execute(f'DELETE FROM meals WHERE {where}', (uid, meal[MEAL_ID_KEY]))
+            else:
+                conn.execute(
+                    f'UPDATE meals SET date = ?, time = ?, payload = ? WHERE {where}',
+                    (updated.get('date', ''), updated.get('time', ''), json_codec.dumps(updated), uid, meal[MEAL_ID_KEY])
+                )
+            self._adjust_totals(conn, uid, meal, -1)
+            if updated is not None:
+                self._adjust_totals(conn, uid, updated)
+            conn.execute('UPDATE user_docs SET version = version + 1 WHERE uid = ?', (uid,))
+
+    def append_weight(self, uid, entry):
+        self._append('weights', uid, entry)
+
+    def append_progress_photo(self, uid, photo):
+        self._append('progress_photos', uid, photo)
+
+    def meals_between(self, uid, start=None, end=None):
+        return self._rows('meals', uid, start, end)
+
+    def daily_totals(self, uid, start=None, end=None):
+        return self._totals(self._conn(), uid, start, end)
+
+    def streak(self, uid, today):
+        # The streaks row plus lookups of today and yesterday; no meals, and no daily_totals scan
+        with self._transaction('DEFERRED') as conn:
+            state = self._stored_streak(conn, uid)
+            if state is not None:
+                return streak_summary(state, _StoredDays(conn, uid), today)
+        with self._transaction() as conn:
+            days = _StoredDays(conn, uid)
+            # A user from before the streaks table gets its row now; one with no meals needs none
+            state = self._streak_state(conn, uid) if days else build_streak({})
+            return streak_summary(state, days, today)
+
+    def settings(self, uid):
+        row = self._conn().execute('SELECT settings FROM settings WHERE uid = ?', (uid,)).fetchone()
+        return json_codec.loads(row[0]) if row else {}
+
+    def stamp(self, uid):
+        row = self._conn().execute('SELECT version FROM user_docs WHERE uid = ?', (uid,)).fetchone()
+        return row[0] if row else None
+
+    def size_hint(self, uid):
+        conn = self._conn()
+        total = 0
+        for table in ('user_docs', 'settings'):
+            column = 'doc' if table == 'user_docs' else 'settings'
+            total += conn.execute(f'SELECT COALESCE(SUM(LENGTH({column})), 0) FROM {table} WHERE uid = ?', (uid,)).fetchone()[0]
+        for table in self.TABLES.values():
+            total += conn.execute(f'SELECT COALESCE(SUM(LENGTH(payload)), 0) FROM {table} WHERE uid = ?', (uid,)).fetchone()[0]
+        return total
+
+
+def _copy_doc(data):
+    """
+    Copy the containers of a user document so callers can append/pop/assign
+    freely without touching the cached original. Individual records (meal
+    dicts etc.) are shared - replace them rather than mutating in place.
+    """
+    return {
+        k: list(v) if isinstance(v, list) else dict(v) if isinstance(v, dict) else v
+        for k, v in data.items()
+    }
+
+
+class UserDocCache:
+    """Bounded LRU of parsed user documents, evicted by entry count and approximate bytes"""
+
+    def __init__(self, max_entries=USER_CACHE_ENTRIES, max_bytes=USER_CACHE_BYTES, compact=USER_CACHE_COMPACT):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.compact = compact  # hold record collections as records.Record instead of dicts
+        self._entries = OrderedDict()  # uid -> (stamp, data, nbytes, derived)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, uid, stamp):
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is None or stamp is None or entry[0] != stamp:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(uid)
+            self.hits += 1
+            return entry[1]
+
+    def peek(self, uid, stamp):
+        """(data, derived) cached at stamp, without touching LRU order or counters"""
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is None or stamp is None or entry[0] != stamp:
+                return None
+            return entry[1], entry[3]
+
+    def derived(self, uid, stamp, name, build):
+        """
+        Structure computed from a cached document (e.g. its meal date index),
+        built at most once per cached version and evicted with the document.
+        Returns None when the document isn't cached at stamp.
+        """
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is None or stamp is None or entry[0] != stamp:
+                return None
+            value = entry[3].get(name)
+        if value is None:
+            value = build(entry[1])
+            with self._lock:
+                entry[3].setdefault(name, value)
+        return value
+
+    def put(self, uid, stamp, data, nbytes, derived=None):
+        if stamp is None or self.max_entries <= 0 or nbytes > self.max_bytes:
+            self.discard(uid)
+            return
+        with self._lock:
+            old = self._entries.pop(uid, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self._entries[uid] = (stamp, data, nbytes, derived or {})
+            self.bytes += nbytes
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted[2]
+                self.evictions += 1
+
+    def discard(self, uid):
+        with self._lock:
+            old = self._entries.pop(uid, None)
+            if old is not None:
+                self.bytes -= old[2]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'compact': self.compact,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+class CachedUserStore(UserStore):
+    """
+    Read-through / write-through document cache in front of any engine.
+    Each cached document carries a MealDateIndex for range reads and id
+    lookups; meal appends, edits and deletes update both in place of a
+    reparse and re-sort. Reads that need only part of a document that isn't
+    cached (today's meals, settings, rollups) take just those sections from
+    the engine when it can (read_sections()) instead of loading it all.
+    """
+
+    def __init__(self, inner, cache=None):
+        self.inner = inner
+        self.name = inner.name
+        self.archive_after_days = inner.archive_after_days
+        self.cache = cache or UserDocCache()
+        self.partial_reads = 0
+
+    def exists(self, uid):
+        return self.inner.exists(uid)
+
+    def _cached(self, uid, stamp=None):
+        """(stamp, cached document) - the document is shared, don't mutate it"""
+        if stamp is None:
+            stamp = self.inner.stamp(uid)
+        data = self.cache.get(uid, stamp)
+        if data is None:
+            data = self.inner.load(uid)
+            if any(not m.get(MEAL_ID_KEY) for m in data.get('meals', [])):
+                stamp, data = self._backfill_meal_ids(uid)
+            if self.cache.compact:
+                data = compact_doc(data)
+            self.cache.put(uid, stamp, data, self.inner.size_hint(uid))
+        return stamp, data
+
+    def _sections(self, uid, keys, start=None, end=None, latest=None, optional=()):
+        """
+        (stamp, sections) - sections read from the engine when the document
+        isn't cached and the engine has every key (optional ones if present),
+        else None (use _cached(uid, stamp))
+        """
+        stamp = self.inner.stamp(uid)
+        if self.cache.peek(uid, stamp) is not None:
+            return stamp, None
+        part = self.inner.read_sections(uid, tuple(keys) + tuple(optional), start, end, latest)
+        if part is None or not all(key in part for key in keys):
+            return stamp, None
+        self.partial_reads += 1
+        return stamp, part
+
+    def _backfill_meal_ids(self, uid):
+        """One-time save giving a pre-id document's meals their ids, so they stay stable across reads"""
+        with self.inner.locked(uid):
+            data = self.inner.load(uid)
+            stamp = self.inner.save(uid, data) if assign_meal_ids(data.get('meals', [])) else self.inner.stamp(uid)
+            return stamp, data
+
+    def _meal_index(self, uid, stamp, data):
+        index = self.cache.derived(uid, stamp, 'meal_index', lambda doc: MealDateIndex(doc.get('meals', [])))
+        return index if index is not None else MealDateIndex(data.get('meals', []))
+
+    @staticmethod
+    def _carry_derived(derived, totals, days):
+        """
+        The previous version's day-keyed structures (deficit ledgers, aggregate
+        index), updated for the days whose meals changed
+        """
+        carried = {}
+        for name, value in derived.items():
+            if isinstance(value, (DeficitLedger, AggregateIndex)):
+                structure = carried[name] = value.copy()
+                for day in days:
+                    structure.update_day(day, totals)
+        return carried
+
+    def locked(self, uid):
+        return self.inner.locked(uid)
+
+    def load(self, uid):
+        data = self._cached(uid)[1]
+        return expand_doc(data) if self.cache.compact else _copy_doc(data)
+
+    def save(self, uid, data, expected_version=None):
+        if self.inner.group_commits:
+            return self._grouped(uid, _replacing(uid, data, expected_version))[1]
+        stamp = self.inner.save(uid, data, expected_version)
+        self.cache.put(uid, stamp, compact_doc(data) if self.cache.compact else _copy_doc(data),
+                       self.inner.size_hint(uid))
+        return stamp
+
+    def _update(self, uid, fn):
+        if self.inner.group_commits:
+            return self._grouped(uid, _updating(fn))[0]
+        return super()._update(uid, fn)
+
+    def _grouped(self, uid, change):
+        """The engine's group commit (JSONUserStore._grouped), committed from and into the cache"""
+        return self.inner._grouped(uid, change, self._commit)
+
+    def _commit(self, uid, changes):
+        """
+        Apply changes to a copy of the cached document when it is current
+        rather than have the engine reparse its file, write once, and cache
+        what was written
+        """
+        with self.inner.locked(uid):
+            cached = self.cache.peek(uid, self.inner.stamp(uid))
+
+            def load():
+                if cached is None:
+                    return self.inner.load(uid)
+                return expand_doc(cached[0]) if self.cache.compact else _copy_doc(cached[0])
+
+            data, version, outcomes = _apply_changes(changes, self.inner.current_version(uid), load)
+            if data is None:
+                return _settle(outcomes, None, None)
+            stamp = self.inner._commit_locked(uid, data, version)
+            derived = {}
+            if cached is not None:
+                before = cached[0].get(ROLLUP_KEY, {})
+                days = [day for day in before.keys() | data[ROLLUP_KEY].keys()
+                        if before.get(day) != data[ROLLUP_KEY].get(day)]
+                derived = self._carry_derived(cached[1], data[ROLLUP_KEY], days)
+            self.cache.put(uid, stamp, compact_doc(data) if self.cache.compact else _copy_doc(data),
+                           self.inner.size_hint(uid), derived)
+            return _settle(outcomes, data, stamp)
+
+    def append_meal(self, uid, meal):
+        meal.setdefault(MEAL_ID_KEY, new_meal_id())
+        if self.inner.appends_rewrite_document:
+            return super().append_meal(uid, meal)  # group-committed from the cached copy
+        with self.inner.locked(uid):
+            cached = self.cache.peek(uid, self.inner.stamp(uid))
+            self.inner.append_meal(uid, meal)
+            if cached is None or self._may_archive(cached[0], meal):
+                self.cache.discard(uid)
+                return
+            # Replay the append on the cached copy instead of reparsing the file
+            data = _copy_doc(cached[0])
+            meal = Meal.from_dict(meal) if self.cache.compact else dict(meal)
+            # Cached documents came through load()/save(), so their rollups are
+            # already consistent - skip ensure_rollups()' O(days) recount
+            add_meal(data.setdefault(ROLLUP_KEY, {}), meal, data.get(STREAK_KEY))
+            insert_ordered(data.setdefault('meals', []), meal)
+            data[VERSION_KEY] = data.get(VERSION_KEY, 0) + 1
+            derived = self._carry_derived(cached[1], data[ROLLUP_KEY], [meal.get('date') or ''])
+            if 'meal_index' in cached[1]:
+                derived['meal_index'] = cached[1]['meal_index'].copy()
+                derived['meal_index'].insert(meal)
+            self.cache.put(uid, self.inner.stamp(uid), data, self.inner.size_hint(uid), derived)
+
+    def append_weight(self, uid, entry):
+        if self.inner.appends_rewrite_document:
+            return super().append_weight(uid, entry)
+        self.inner.append_weight(uid, entry)
+        self.cache.discard(uid)
+
+    def append_progress_photo(self, uid, photo):
+        if self.inner.appends_rewrite_document:
+            return super().append_progress_photo(uid, photo)
+        self.inner.append_progress_photo(uid, photo)
+        self.cache.discard(uid)
+
+    def _may_archive(self, data, *meals):
+        """
+        Whether writing meals into the cached document data could have moved
+        meals into the archive, so the engine's document no longer matches a
+        replay of the write on the cached copy
+        """
+        probe = {'meals': sorted(data.get('meals', [])[:1] + list(meals), key=_sort_key),
+                 ARCHIVE_KEY: data.get(ARCHIVE_KEY)}
+        return meal_archive.has_cold_meals(probe, meal_archive.hot_from(self.archive_after_days))
+
+    def find_meal(self, uid, meal_id):
+        stamp, data = self._cached(uid)
+        return expand(self._meal_index(uid, stamp, data).get(meal_id))
+
+    def _archived_meals(self, uid, archive, months):
+        return self.inner._archived_meals(uid, archive, months)
+
+    def _replace_meal(self, uid, meal, updated, data=None):
+        # delete_meal()/update_meal() hold the lock and found meal in the cached document
+        stamp, cached = self._cached(uid)
+        data = _copy_doc(cached)
+        record = Meal.from_dict(updated) if self.cache.compact and updated is not None else updated
+        _apply_meal_change(data, meal, record)
+        index = self._meal_index(uid, stamp, cached).copy()
+        index.remove(meal)
+        if record is not None:
+            index.insert(record)
+        self.inner._replace_meal(uid, meal, updated, expand_doc(data) if self.cache.compact else data)
+        if self._may_archive(cached, *([updated] if updated is not None else [])):
+            self.cache.discard(uid)
+            return
+        data[VERSION_KEY] = cached.get(VERSION_KEY, 0) + 1
+        days = {meal.get('date') or '', (updated or meal).get('date') or ''}
+        previous = self.cache.peek(uid, stamp)
+        derived = self._carry_derived(previous[1], data[ROLLUP_KEY], days) if previous else {}
+        derived['meal_index'] = index
+        self.cache.put(uid, self.inner.stamp(uid), data, self.inner.size_hint(uid), derived)
+
+    def meals_between(self, uid, start=None, end=None):
+        if self.cache.max_entries <= 0:
+            return self.inner.meals_between(uid, start, end)
+        for attempt in range(2):
+            stamp, part = self._sections(uid, ('meals',), start, end, optional=(ARCHIVE_KEY,))
+            if part is not None:
+                archive, meals = part.get(ARCHIVE_KEY), _meals_in(part['meals'], start, end)
+            else:
+                stamp, data = self._cached(uid, stamp)
+                meals = self._meal_index(uid, stamp, data).between(start, end)
+                archive, meals = data.get(ARCHIVE_KEY), [m.to_dict() for m in meals] if self.cache.compact else meals
+            try:
+                return self._with_archived(uid, archive, meals, start, end)
+            except FileNotFoundError:
+                if attempt:
+                    raise
+
+    def latest_weights(self, uid, n):
+        if self.cache.max_entries <= 0:
+            return self.inner.latest_weights(uid, n)
+        stamp, part = self._sections(uid, ('weight_history',), latest=n)
+        weights = (part or self._cached(uid, stamp)[1]).get('weight_history', [])
+        return [expand(w) for w in weights[-n:]] if n > 0 else []
+
+    def _totals(self, uid):
+        """(stamp, rollups, whether they're the cached document's)"""
+        stamp, part = self._sections(uid, (ROLLUP_KEY,))
+        if part is not None:
+            return stamp, part[ROLLUP_KEY], False
+        stamp, data = self._cached(uid, stamp)
+        return stamp, data.get(ROLLUP_KEY, {}), True
+
+    def daily_totals(self, uid, start=None, end=None):
+        if self.cache.max_entries <= 0:
+            return self.inner.daily_totals(uid, start, end)
+        return totals_between(self._totals(uid)[1], start, end)
+
+    def streak(self, uid, today):
+        if self.cache.max_entries <= 0:
+            return self.inner.streak(uid, today)
+        stamp, data = self._sections(uid, (STREAK_KEY, ROLLUP_KEY))
+        if data is None:
+            data = self._cached(uid, stamp)[1]
+        return streak_summary(data[STREAK_KEY], data[ROLLUP_KEY], today)
+
+    def aggregate(self, uid, start, end, group='day'):
+        if self.cache.max_entries <= 0:
+            return self.inner.aggregate(uid, start, end, group)
+        stamp, totals, cached = self._totals(uid)
+        index = None
+        if group != 'day' and cached:
+            index = self.cache.derived(uid, stamp, 'aggregate_index', lambda doc: AggregateIndex(doc.get(ROLLUP_KEY, {})))
+        return aggregate(totals, start, end, group, index)
+
+    def deficit_ledger(self, uid, start, goal):
+        if self.cache.max_entries <= 0:
+            return self.inner.deficit_ledger(uid, start, goal)
+        stamp, totals, cached = self._totals(uid)
+        ledger = None
+        if cached:
+            ledger = self.cache.derived(uid, stamp, ('deficit_ledger', start, goal),
+                                        lambda doc: DeficitLedger(doc.get(ROLLUP_KEY, {}), start, goal))
+        return ledger if ledger is not None else DeficitLedger(totals, start, goal)
+
+    def uids(self):
+        return self.inner.uids()
+
+    def settings(self, uid):
+        if isinstance(self.inner, SQLiteUserStore):
+            return self.inner.settings(uid)
+        stamp, part = self._sections(uid, ('settings',))
+        return dict((part or self._cached(uid, stamp)[1]).get('settings', {}))
+
+    def stamp(self, uid):
+        return self.inner.stamp(uid)
+
+    def size_hint(self, uid):
+        return self.inner.size_hint(uid)
+
+    def cache_stats(self):
+        return {**self.cache.stats(), 'partial_reads': self.partial_reads}
+
+
+STORES = {
+    'json': JSONUserStore,
+    'journal': JournalUserStore,
+    'sqlite': SQLiteUserStore,
+}
+
+# Store instance - lazy load
+_store = None
+
+def get_user_store():
+    """Get or initialize the configured storage engine"""
+    global _store
+
+    if _store is None:
+        backend = STORAGE_BACKEND.lower()
+        if backend not in STORES:
+            raise ValueError(f'Unknown LEAN_STORAGE_BACKEND: {STORAGE_BACKEND}')
+        _store = CachedUserStore(STORES[backend]())
+
+    return _store
+
+
+# ============= MIGRATION =============
+
+def migrate_json_to_sqlite(data_dir=USER_DATA_DIR, db_path=USER_DB_PATH, dry_run=False):
+    """Import every <uid>.json user document into the SQLite engine"""
+    source = JSONUserStore(data_dir)
+    target = SQLiteUserStore(db_path)
+    migrated = 0
+
+    for uid in source.uids():
+        try:
+            data = source.load_all(uid)
+        except (OSError, ValueError) as e:
+            print(f"❌ {uid}: {e}")
+            continue
+
+        print(f"✓ {uid}: {len(data.get('meals', []))} meals, "
+              f"{len(data.get('weight_history', []))} weights, "
+              f"{len(data.get('progress_photos', []))} photos")
+        if not dry_run:
+            target.save(uid, data)
+        migrated += 1
+
+    return migrated
+
+
+def compact_journals(data_dir=USER_DATA_DIR):
+    """Fold every <uid>.jsonl journal into its snapshot"""
+    store = JournalUserStore(data_dir)
+    compacted = 0
+
+    for uid in store.uids():
+        if not os.path.exists(store.journal_path(uid)):
+            continue
+        store.compact(uid)
+        print(f"✓ {uid}: compacted")
+        compacted += 1
+
+    return compacted
+
+
+def recompress_documents(store=None, pause=0.0):
+    """
+    Rewrite every json / journal document whose format no longer matches the
+    LEAN_COMPRESSION settings (e.g. plain files written before compression was
+    enabled). One user at a time under their lock, pausing between rewrites so
+    it can run alongside live traffic.
+    """
+    store = store or STORES[STORAGE_BACKEND.lower()]()
+    if not isinstance(store, JSONUserStore):
+        print(f"{store.name} engine stores no document files - nothing to recompress")
+        return 0
+    rewritten = 0
+
+    for uid in store.uids():
+        if store.recompress(uid):
+            path, st = compressed_io.resolve(store.path(uid))
+            print(f"✓ {uid}: {os.path.basename(path)} ({st.st_size} bytes)")
+            rewritten += 1
+            time.sleep(pause)
+
+    return rewritten
+
+
+def reshard_documents(data_dir=USER_DATA_DIR):
+    """
+    Move every user's files from the flat data directory into their hashed
+    shard (LEAN_USER_LAYOUT=sharded), one user at a time under their lock.
+    Running workers keep serving a document from the flat directory until
+    it has moved, so this can run alongside live traffic.
+    """
+    store = JSONUserStore(data_dir, layout='sharded')
+    moved = 0
+
+    for uid in sorted(store._uids_in(data_dir)):
+        with store.locked(uid):
+            home = store._home(uid)[:-len('.json')]
+            flat = store._flat(home)
+            # Journal before snapshot: a half-moved user is still read from the flat directory
+            for suffix in ('.jsonl', '.idx', '.archive') + store.DOC_SUFFIXES:
+                if not os.path.exists(flat + suffix):
+                    continue
+                if os.path.exists(home + suffix):
+                    print(f"⚠️  {uid}: {os.path.basename(home + suffix)} already in its shard - flat copy left in place")
+                    continue
+                os.replace(flat + suffix, home + suffix)
+        try:
+            os.remove(flat + '.lock')
+        except FileNotFoundError:
+            pass
+        print(f"✓ {uid} → {shard_of(uid)}")
+        moved += 1
+
+    return moved
+
+
+def rebuild_rollups(store=None):
+    """Recompute every user's daily_totals (and streak state) from their raw meals"""
+    store = store or STORES[STORAGE_BACKEND.lower()]()
+    rebuilt = 0
+
+    for uid in store.uids():
+        with store.locked(uid):
+            data = store.load_all(uid)
+            data[ROLLUP_KEY] = build_rollups(data.get('meals', []))
+            data.pop(STREAK_KEY, None)  # rebuilt from the new table on save
+            store.save(uid, data)
+        print(f"✓ {uid}: {len(data[ROLLUP_KEY])} days")
+        rebuilt += 1
+
+    return rebuilt
+
+
+def backfill_meal_ids(store=None):
+    """Give every stored meal without an id a stable one"""
+    store = store or STORES[STORAGE_BACKEND.lower()]()
+    updated = 0
+
+    for uid in store.uids():
+        with store.locked(uid):
+            data = store.load(uid)
+            assigned = assign_meal_ids(data.get('meals', []))
+            if assigned:
+                store.save(uid, data)
+                updated += 1
+        print(f"✓ {uid}: {assigned} meal id(s) assigned")
+
+    return updated
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == 'compact':
+        count = compact_journals()
+        print(f"\n🎉 Compacted {count} journal(s)")
+        return
+    if command == 'rebuild-rollups':
+        count = rebuild_rollups()
+        print(f"\n🎉 Rebuilt daily rollups for {count} user(s)")
+        return
+    if command == 'backfill-meal-ids':
+        count = backfill_meal_ids()
+        print(f"\n🎉 Backfilled meal ids for {count} user(s)")
+        return
+    if command == 'recompress':
+        args = sys.argv[2:]
+        pause = float(args[args.index('--pause') + 1]) if '--pause' in args else 0.05
+        count = recompress_documents(pause=pause)
+        print(f"\n🎉 Recompressed {count} document(s)")
+        return
+    if command == 'reshard':
+        count = reshard_documents()
+        print(f"\n🎉 Moved {count} user(s) into hashed shards")
+        return
+    if command != 'migrate':
+        print("Usage: python user_storage.py migrate [--dry-run]")
+        print("       python user_storage.py compact")
+        print("       python user_storage.py rebuild-rollups")
+        print("       python user_storage.py backfill-meal-ids")
+        print("       python user_storage.py recompress [--pause SECONDS]")
+        print("       python user_storage.py reshard")
+        sys.exit(1)
+
+    dry_run = '--dry-run' in sys.argv[2:]
+    print(f"🚀 Migrating {USER_DATA_DIR} → {USER_DB_PATH}{' (dry run)' if dry_run else ''}")
+    count = migrate_json_to_sqlite(dry_run=dry_run)
+    print(f"\n🎉 Migrated {count} user(s)")
+    print("Set LEAN_STORAGE_BACKEND=sqlite to serve from the database")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Vision Result Cache for Lean
+Remembers the macro estimate a vision model gave for a photo, so the same
+photo uploaded again (a retry after a failed request, a saved picture of a
+packaged food) is answered from disk in milliseconds instead of another
+GPT-4o / LLaVA call. Shared by photo_log, photo_analyzer and
+local_vision_analyzer, and by every worker process, through one SQLite file.
+
+Settings:
+    LEAN_VISION_CACHE               SQLite file (default data/vision_cache.db)
+    LEAN_VISION_CACHE_TTL           seconds an estimate stays valid (default 30 days)
+    LEAN_VISION_CACHE_MAX           entries kept; least recently used beyond that are
+                                    evicted (default 5000)
+    LEAN_VISION_PHASH_DISTANCE      also reuse the estimate of a near-duplicate photo
+                                    whose 64-bit perceptual hash is within this many
+                                    bits (default 0: exact matches only; needs Pillow)
+
+Photos are keyed by the SHA-256 of their normalized bytes: JPEG metadata
+segments (EXIF, XMP, ICC, comments) are dropped first, so a re-saved or
+re-shared copy of the same pixels still matches. Entries are per model,
+since each model's estimates are its own. Only successful estimates are
+stored.
+
+Usage:
+    from vision_cache import vision_cache
+    data = vision_cache.get(image_bytes, 'gpt-4o')
+    if data is None:
+        data = call_the_model(image_bytes)
+        vision_cache.put(image_bytes, 'gpt-4o', data)
+"""
+
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+
+import json_codec
+
+# Optional imports (load if available)
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Beside, not inside, the per-user documents tree the storage commands walk
+CACHE_PATH = os.getenv('LEAN_VISION_CACHE', 'data/vision_cache.db')
+CACHE_TTL_SECONDS = float(os.getenv('LEAN_VISION_CACHE_TTL', 30 * 24 * 3600))
+CACHE_MAX_ENTRIES = int(os.getenv('LEAN_VISION_CACHE_MAX', 5000))
+PHASH_DISTANCE = int(os.getenv('LEAN_VISION_PHASH_DISTANCE', 0))
+
+# JPEG markers carrying metadata rather than pixels: APP0-APP15 and COM
+_JPEG_METADATA = frozenset(range(0xE0, 0xF0)) | {0xFE}
+
+
+def normalize_image(image_bytes):
+    """
+    image_bytes with JPEG metadata segments removed (other formats, and
+    JPEGs this parser does not follow, are returned unchanged)
+    """
+    if image_bytes[:2] != b'\xff\xd8':
+        return image_bytes
+    kept = [b'\xff\xd8']
+    pos = 2
+    while pos + 4 <= len(image_bytes):
+        if image_bytes[pos] != 0xFF:
+            return image_bytes
+        marker = image_bytes[pos + 1]
+        if marker == 0xFF:  # fill byte before a marker
+            pos += 1
+            continue
+        if marker == 0xDA:  # start of scan: entropy-coded pixels to the end
+            kept.append(image_bytes[pos:])
+            return b''.join(kept)
+        end = pos + 2 + int.from_bytes(image_bytes[pos + 2:pos + 4], 'big')
+        if marker not in _JPEG_METADATA:
+            kept.append(image_bytes[pos:end])
+        pos = end
+    return image_bytes
+
+
+def image_digest(image_bytes):
+    """SHA-256 hex digest of the normalized image"""
+    return hashlib.sha256(normalize_image(image_bytes)).hexdigest()
+
+
+def perceptual_hash(image_bytes):
+    """64-bit difference hash (dHash) of the image, or None without Pillow or for an unreadable image"""
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            pixels = list(image.convert('L').resize((9, 8)).getdata())
+    except Exception:
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return bits - (1 << 63)  # as a signed 64-bit SQLite INTEGER
+
+
+class VisionCache:
+    """SQLite-backed (digest, model) -> estimate map with TTL and LRU eviction; thread- and process-safe"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS vision_results (
+        digest TEXT NOT NULL,
+        model TEXT NOT NULL,
+        phash INTEGER,
+        result TEXT NOT NULL,
+        created REAL NOT NULL,
+        accessed REAL NOT NULL,
+        PRIMARY KEY (digest, model)
+    );
+    CREATE INDEX IF NOT EXISTS vision_results_accessed ON vision_results (accessed);
+    """
+
+    def __init__(self, db_path=CACHE_PATH, ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES,
+                 phash_distance=PHASH_DISTANCE):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.phash_distance = phash_distance if Image is not None else 0
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')  # a lost entry only costs one API call
+            conn.executescript(self.SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def get(self, image_bytes, model):
+        """The cached estimate for this photo (or, if enabled, a near-duplicate of it), or None"""
+        try:
+            return self._get(image_bytes, model)
+        except sqlite3.Error:
+            self.errors += 1  # an unusable cache costs an API call, never the upload
+            return None
+
+    def _get(self, image_bytes, model):
+        now = time.time()
+        conn = self._conn()
+        digest = image_digest(image_bytes)
+        row = conn.execute('SELECT result FROM vision_results WHERE digest = ? AND model = ? AND created > ?',
+                           (digest, model, now - self.ttl)).fetchone()
+        if row is None and self.phash_distance:
+            row = self._nearest(conn, perceptual_hash(image_bytes), model, now)
+            if row is not None:
+                digest, row = row[0], (row[1],)
+                self.near_hits += 1
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        conn.execute('UPDATE vision_results SET accessed = ? WHERE digest = ? AND model = ?', (now, digest, model))
+        return json_codec.loads(row[0])
+
+    def _nearest(self, conn, phash, model, now):
+        """(digest, result) of the closest live entry within phash_distance bits, or None"""
+        if phash is None:
+            return None
+        best = None
+        rows = conn.execute('SELECT digest, result, phash FROM vision_results '
+                            'WHERE model = ? AND phash IS NOT NULL AND created > ?', (model, now - self.ttl))
+        for digest, result, other in rows:
+            distance = bin((phash ^ other) & 0xFFFFFFFFFFFFFFFF).count('1')
+            if distance <= self.phash_distance and (best is None or distance < best[0]):
+                best = (distance, digest, result)
+        return best[1:] if best else None
+
+    def put(self, image_bytes, model, result):
+        """Store a successful estimate (a JSON-serializable dict) for this photo"""
+        try:
+            self._put(image_bytes, model, result)
+        except sqlite3.Error:
+            self.errors += 1
+
+    def _put(self, image_bytes, model, result):
+        now = time.time()
+        phash = perceptual_hash(image_bytes) if self.phash_distance else None
+        conn = self._conn()
+        conn.execute('INSERT OR REPLACE INTO vision_results (digest, model, phash, result, created, accessed) '
+                     'VALUES (?, ?, ?, ?, ?, ?)',
+                     (image_digest(image_bytes), model, phash, json_codec.dumps(result), now, now))
+        self.evict(now)
+
+    def evict(self, now=None):
+        """Drop expired entries, then the least recently used beyond max_entries; returns how many"""
+        now = now or time.time()
+        conn = self._conn()
+        removed = conn.execute('DELETE FROM vision_results WHERE created <= ?', (now - self.ttl,)).rowcount
+        excess = conn.execute('SELECT COUNT(*) FROM vision_results').fetchone()[0] - self.max_entries
+        if excess > 0:
+            removed += conn.execute('DELETE FROM vision_results WHERE rowid IN '
+                                    '(SELECT rowid FROM vision_results ORDER BY accessed LIMIT ?)',
+                                    (excess,)).rowcount
+        return removed
+
+    def stats(self):
+        try:
+            entries = self._conn().execute('SELECT COUNT(*) FROM vision_results').fetchone()[0]
+        except sqlite3.Error:
+            self.errors += 1
+            entries = None
+        return {'hits': self.hits, 'near_hits': self.near_hits, 'misses': self.misses, 'errors': self.errors,
+                'entries': entries, 'max_entries': self.max_entries, 'phash': bool(self.phash_distance)}
+
+
+# Shared by every analyzer
+vision_cache = VisionCache()
@@ -1,5 +1,10 @@
 import os
-import requests
+
+from http_client import http
+
+# OpenAI-compatible API root (a proxy, or a local stub in tests)
+OPENAI_API_URL = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1').rstrip('/')
+PHOTO_MODEL = "gpt-4o"
 
 def transcribe_audio_direct(audio_path, api_key):
     """Call Whisper API directly without SDK"""
@@ -12,14 +17,15 @@ def transcribe_audio_direct(audio_path, api_key):
     if file_size == 0:
         raise Exception("Audio file is empty")
     
-    url = "https://api.openai.com/v1/audio/transcriptions"
+    url = f"{OPENAI_API_URL}/audio/transcriptions"
     headers = {"Authorization": f"Bearer {api_key}"}
     
     # Try multiple formats - webm might not work, try as mp3
+    # (read into memory so a retried upload resends the whole file)
     with open(audio_path, 'rb') as f:
-        files = {'file': ('audio.mp3', f, 'audio/mpeg')}
-        data = {'model': 'whisper-1'}
-        response = requests.post(url, headers=headers, files=files, data=data)
+        files = {'file': ('audio.mp3', f.read(), 'audio/mpeg')}
+    data = {'model': 'whisper-1'}
+    response = http.post(url, headers=headers, files=files, data=data, name='openai.transcriptions')
     
     if response.status_code == 200:
         return response.json()['text']
@@ -39,7 +45,7 @@ def _clean_jsonish(content: str) -> str:
 
 def parse_meal_direct(text, api_key):
     """Call GPT API directly without SDK"""
-    url = "https://api.openai.com/v1/chat/completions"
+    url = f"{OPENAI_API_URL}/chat/completions"
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
@@ -66,7 +72,7 @@ Return ONLY valid JSON (no markdown, no explanation):
         }]
     }
 
-    response = requests.post(url, headers=headers, json=payload)
+    response = http.post(url, headers=headers, json=payload, name='openai.chat')
 
     if response.status_code == 200:
         content = response.json()['choices'][0]['message']['content']
@@ -79,7 +85,7 @@ def analyze_meal_photo_direct(image_bytes: bytes, api_key: str) -> str:
     """Call GPT-4o Vision directly without SDK. Returns JSON string."""
     import base64
 
-    url = "https://api.openai.com/v1/chat/completions"
+    url = f"{OPENAI_API_URL}/chat/completions"
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
@@ -104,7 +110,7 @@ def analyze_meal_photo_direct(image_bytes: bytes, api_key: str) -> str:
     )
 
     payload = {
-        "model": "gpt-4o",
+        "model": PHOTO_MODEL,
         "messages": [
             {
                 "role": "user",
@@ -117,7 +123,7 @@ def analyze_meal_photo_direct(image_bytes: bytes, api_key: str) -> str:
         "max_tokens": 300
     }
 
-    response = requests.post(url, headers=headers, json=payload)
+    response = http.post(url, headers=headers, json=payload, name='openai.vision')
     if response.status_code == 200:
         content = response.json()['choices'][0]['message']['content']
         return _clean_jsonish(content)